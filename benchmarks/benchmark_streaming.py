@@ -0,0 +1,105 @@
+"""
+Peak memory and run time of the in-memory and streaming top-10 aggregations
+on synthetic Spotify charts of growing size, checking that both select the
+very same songs. Run by run_benchmarks.py, e.g.
+
+    python run_benchmarks.py --only streaming --streaming-rows 1000000 4000000
+
+Every measurement runs in its own process, so that peak RSS is not shared.
+"""
+import argparse
+import json
+import numpy
+import os
+import pandas
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import filter_top_10  # noqa: E402
+import storage  # noqa: E402
+
+COUNTRIES = 60
+SONGS = 20_000
+MODES = ["memory", "streaming"]
+
+
+def generate_charts(path: str, rows: int, chunksize: int = 1_000_000) -> None:
+    """Write `rows` chart entries of top-200 charts, in chunks to keep the generator itself small."""
+    rng = numpy.random.default_rng(0)
+    songs = numpy.array([f"Song {index}" for index in range(SONGS)])
+    artists = numpy.array([f"Artist {index % (SONGS // 4)}" for index in range(SONGS)])
+    countries = numpy.array([f"Country {index}" for index in range(COUNTRIES)])
+    for start in range(0, rows, chunksize):
+        size = min(chunksize, rows - start)
+        song = rng.integers(0, SONGS, size)
+        years = rng.integers(2013, 2023, size)
+        chunk = pandas.DataFrame({
+            "artist": artists[song],
+            "country": countries[rng.integers(0, COUNTRIES, size)],
+            "daterange": [f"{year}-W{week:02}" for year, week in zip(years, rng.integers(1, 53, size))],
+            "position": rng.integers(1, 201, size),
+            "streams": rng.integers(1_000, 1_000_000, size),
+            "title": songs[song],
+            "year": years,
+        })
+        chunk.to_csv(path, mode="a", header=start == 0, index=False)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss survives exec on Linux, so it would include the memory of the
+    # parent process at fork time, whereas VmHWM is that of this process only
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    # Kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2 ** 20 if sys.platform == "darwin" else maxrss / 1024
+
+
+def measure(mode: str, path: str, chunksize: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    top = filter_top_10.filter_spotify_charts(chunksize=chunksize if mode == "streaming" else None, filename=path)
+    seconds = time.perf_counter() - start
+    digest = int(pandas.util.hash_pandas_object(top.astype(str), index=False).sum())
+    return {"seconds": seconds, "peak_rss_mb": peak_rss_mb(), "digest": digest}
+
+
+def run(mode: str, path: str, chunksize: int) -> Dict[str, float]:
+    command = [sys.executable, os.path.abspath(__file__), "--measure", mode, path, "--chunksize", str(chunksize)]
+    return json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+
+
+def benchmark(rows: List[int], chunksize: int = storage.CHUNKSIZE,
+              parquet: bool = False) -> Iterator[Tuple[int, str, Dict[str, float]]]:
+    """Row count, mode and measurements of every aggregation."""
+    with tempfile.TemporaryDirectory() as directory:
+        for count in rows:
+            path = os.path.join(directory, f"charts_{count}.csv")
+            generate_charts(path, count)
+            if parquet:
+                storage.convert(path)
+            results = {mode: run(mode, path, chunksize) for mode in MODES}
+            if results["memory"]["digest"] != results["streaming"]["digest"]:
+                raise AssertionError(f"Streaming and in-memory top 10 disagree on {count} rows")
+            for mode, result in results.items():
+                yield count, mode, result
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    # Measurement of a single aggregation, in a process of its own
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "PATH"), required=True)
+    parser.add_argument("--chunksize", type=int, default=storage.CHUNKSIZE)
+    args = parser.parse_args()
+
+    print(json.dumps(measure(*args.measure, args.chunksize)))
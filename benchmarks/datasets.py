@@ -0,0 +1,86 @@
+"""
+Synthetic datasets shaped like the ones of the pipeline, written into a
+directory tree mirroring the repository so that every stage can run on them
+unchanged. Scale 1 is about the size of the committed datasets, and larger
+scales add years of charts and contests.
+"""
+import numpy
+import os
+import pandas
+
+RADIO_DEPTHS = {"denmark": 40, "finland": 20, "norway": 40, "sweden": 10}
+COUNTRIES = ["Denmark", "Finland", "Norway", "Sweden", "Iceland"]
+LANGUAGES = ["English", "Danish", "Finnish", "Norwegian", "Swedish", "Icelandic", "Spanish", "French"]
+FIRST_YEAR = 2017
+YEARS = 5
+SONGS_PER_YEAR = 300
+EUROVISION_ENTRIES = 1645
+
+
+def make_songs(rng: numpy.random.Generator, count: int) -> pandas.DataFrame:
+    return pandas.DataFrame({
+        "artist": [f"Artist {index % (count // 3 + 1)}" for index in range(count)],
+        "title": [f"Title {index}" for index in range(count)],
+        "language": rng.choice(LANGUAGES, count, p=[0.6] + [0.4 / (len(LANGUAGES) - 1)] * (len(LANGUAGES) - 1)),
+    })
+
+
+def radio_charts(rng: numpy.random.Generator, songs: pandas.DataFrame, depth: int, years: int) -> pandas.DataFrame:
+    """Weekly charts of `depth` songs, favouring a few hits like real charts do."""
+    weeks = pandas.MultiIndex.from_product([range(FIRST_YEAR, FIRST_YEAR + years), range(1, 53),
+                                            range(1, depth + 1)], names=["year", "week", "position"])
+    popularity = 1 / numpy.arange(1, len(songs) + 1)
+    picks = rng.choice(len(songs), len(weeks), p=popularity / popularity.sum())
+    df = songs.iloc[picks].reset_index(drop=True)
+    df = pandas.concat([df, weeks.to_frame(index=False)], axis=1)
+    return df.reindex(sorted(df.columns), axis=1)
+
+
+def top_songs(rng: numpy.random.Generator, songs: pandas.DataFrame, metric: str, years: int) -> pandas.DataFrame:
+    """Ten labelled top songs per year and country."""
+    index = pandas.MultiIndex.from_product([range(FIRST_YEAR, FIRST_YEAR + years), COUNTRIES, range(10)],
+                                           names=["year", "country", "rank"])
+    df = songs.iloc[rng.choice(len(songs), len(index))].reset_index(drop=True)
+    df = pandas.concat([df, index.to_frame(index=False).drop(columns="rank")], axis=1)
+    df[metric] = rng.integers(1, 50 if metric == "weekcount" else 20_000_000, len(df))
+    return df.reindex(sorted(df.columns), axis=1)
+
+
+def eurovision(rng: numpy.random.Generator, entries: int):
+    """Official results and esc-history entries of the same songs, spelled slightly differently."""
+    countries = rng.choice(COUNTRIES + ["Italy", "France", "Spain", "Ukraine", "Greece"], entries)
+    official = pandas.DataFrame({
+        "artist": [f"Artist {index}" for index in range(entries)],
+        "country": countries,
+        "place_final": numpy.where(rng.random(entries) < 0.6, rng.integers(1, 27, entries), numpy.nan),
+        "points_final": rng.integers(0, 500, entries),
+        "title": [f"Song Number {index}" for index in range(entries)],
+        "year": 1956 + numpy.arange(entries) // 25,
+    })
+    esc = official[["artist", "country", "title", "year"]].sample(frac=0.8, random_state=0).sort_index()
+    esc["title"] = esc.title.str.upper()
+    esc["language"] = rng.choice(LANGUAGES, len(esc))
+    return official, esc.reindex(sorted(esc.columns), axis=1)
+
+
+def write_tree(root: str, scale: int, seed: int = 0) -> None:
+    """Write the datasets read by the filter, merge and plot stages under `root`."""
+    rng = numpy.random.default_rng(seed)
+    years = YEARS * scale
+    songs = make_songs(rng, SONGS_PER_YEAR * years)
+
+    charts_dir = os.path.join(root, "scrape-top-charts", "data", "charts")
+    labelled_dir = os.path.join(root, "scrape-top-charts", "data", "labelled-manual")
+    eurovision_dir = os.path.join(root, "scrape-eurovision", "data")
+    for directory in (charts_dir, labelled_dir, eurovision_dir, os.path.join(root, "visualize-top-charts")):
+        os.makedirs(directory, exist_ok=True)
+
+    for country, depth in RADIO_DEPTHS.items():
+        radio_charts(rng, songs, depth, years).to_csv(
+            os.path.join(charts_dir, f"charts_radio_{country}_2017_2021.csv"), index=False)
+    top_songs(rng, songs, "weekcount", years).to_csv(os.path.join(labelled_dir, "radio_charts.csv"), index=False)
+    top_songs(rng, songs, "streams", years).to_csv(os.path.join(labelled_dir, "spotify_charts.csv"), index=False)
+
+    official, esc = eurovision(rng, EUROVISION_ENTRIES * scale)
+    official.to_csv(os.path.join(eurovision_dir, "eurovision_songs_official.csv"), index=False)
+    esc.to_csv(os.path.join(eurovision_dir, "eurovision_songs_esc.csv"), index=False)
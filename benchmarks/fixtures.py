@@ -0,0 +1,203 @@
+"""
+Pages replayed by the parser benchmarks. Pages recorded from the live sites
+are saved under fixtures/<site>/ by running
+
+    python fixtures.py --record
+
+and are used whenever present. Otherwise synthetic pages with the markup the
+parsers expect are generated, so that the benchmarks also run offline.
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+
+from typing import Dict, List, Tuple
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BASEDIR, "fixtures")
+
+sys.path.append(os.path.join(BASEDIR, os.pardir, "scrape-top-charts"))
+sys.path.append(os.path.join(BASEDIR, os.pardir, "scrape-eurovision"))
+
+CHART_SITES = ["denmark", "finland", "norway", "sweden", "spotify"]
+SITES = CHART_SITES + ["eurovision-participants", "eurovision-final", "esc-listing", "esc-detail"]
+
+# Pages recorded for each site, and the keys of the chart pages passed on to their parsers
+RECORDED_WEEKS = [(2019, 10), (2020, 10), (2021, 10)]
+RECORDED_SPOTIFY_WEEKS = [("se", "2019-03-08--2019-03-15"), ("no", "2020-03-06--2020-03-13"),
+                          ("dk", "2021-03-05--2021-03-12")]
+RECORDED_EVENTS = ["https://eurovision.tv/event/tel-aviv-2019", "https://eurovision.tv/event/rotterdam-2021"]
+ESC_LISTING_URL = "https://www.esc-history.com/entries.asp?start=0"
+
+ARTISTS = ["Ed Sheeran", "Gulddreng", "Alan Walker", "Käärijä", "Sigrid", "Zara Larsson", "Björk", "Møme & Co",
+           "Ava Max", "Clean Bandit feat. Sean Paul & Anne-Marie"]
+TITLES = ["Shape of You", "Ked Af Det", "Alone", "Cha Cha Cha", "Strangers", "Ain't My Fault", "Jóga", "Æbler",
+          "Sweet but Psycho", "Rockabye (feat. Sean Paul)"]
+HEAD = ("<!DOCTYPE html><html><head><title>Chart</title><script>var x = '<b>';</script></head>"
+        "<body><nav><ul><li><a href='/'>Home</a></li></ul></nav>")
+
+
+def page_keys(site: str) -> List[Tuple]:
+    """Keys passed on to the chart parser of a site along with its pages."""
+    return RECORDED_SPOTIFY_WEEKS if site == "spotify" else RECORDED_WEEKS
+
+
+def song(rng: random.Random) -> Tuple[str, str]:
+    return rng.choice(ARTISTS), rng.choice(TITLES)
+
+
+def denmark_page(rng: random.Random, rows: int = 40) -> str:
+    tables = []
+    for position in range(1, rows + 1):
+        artist, title = song(rng)
+        cell = rng.choice(["denneugeny", "denneuge", "denneugere"])
+        tables.append(f'<table id="linien"><tr><td id="{cell}">{position}</td><td>'
+                      f'<div id="artistnavn"> {artist.upper()} </div><div id="titel"> {title.upper()} </div>'
+                      f'</td></tr></table>\n')
+    return f"<html><body><div>{''.join(tables)}</div></body></html>"
+
+
+def finland_page(rng: random.Random, rows: int = 20) -> str:
+    divs = []
+    for position in range(1, rows + 1):
+        artist, title = song(rng)
+        divs.append(f'<div class="chart-row row"><span class="chart-position">{position}.</span>'
+                    f'<span class="chart-artist">{artist}</span><span class="chart-title">{title}</span></div>\n')
+    return HEAD + f"<section>{''.join(divs)}</section></body></html>"
+
+
+def norway_page(rng: random.Random, rows: int = 40) -> str:
+    trs = []
+    for position in range(1, rows + 1):
+        artist, title = song(rng)
+        trs.append(f'<tr><td><span class="arrow"></span>{position}</td><td></td><td></td><td></td>'
+                   f'<td>{title}<span class="artist"><a href="/artist/{position}">{artist}</a></span></td></tr>\n')
+    return HEAD + f"<table><thead><tr><th>#</th></tr></thead><tbody>\n{''.join(trs)}</tbody></table></body></html>"
+
+
+def sweden_page(rng: random.Random, rows: int = 20) -> str:
+    items = []
+    for position in range(1, rows + 1):
+        artist, title = song(rng)
+        title_class = rng.choice(["track-title", "track__title"])
+        items.append(f'<li class="track"><span class="track__ranking-current"> {position} </span>'
+                     f'<h3 class="{title_class}">{artist} - {title}</h3></li>\n')
+    return f"<html><body><ul class='list'><li>\n<ul>\n{''.join(items)}</ul></li></ul></body></html>"
+
+
+def spotify_page(rng: random.Random, rows: int = 200) -> str:
+    trs = []
+    for position in range(1, rows + 1):
+        artist, title = song(rng)
+        trs.append(f'<tr><td class="chart-table-image"></td><td class="chart-table-position">{position}</td>'
+                   f'<td class="chart-table-track"><strong>{title}</strong><span>by {artist}</span></td>'
+                   f'<td class="chart-table-streams">{rng.randint(10_000, 2_000_000):,}</td></tr>\n')
+    return HEAD + (f"<table class='chart-table'><thead><tr><th></th></tr></thead><tbody>\n{''.join(trs)}"
+                   f"</tbody></table></body></html>")
+
+
+def eurovision_participants_page(rng: random.Random, rows: int = 40) -> str:
+    cards = []
+    for index in range(rows):
+        cards.append(f'<div class="pointer-events-none"><h4 data-card-title="">Artist {index}</h4>'
+                     f'<div class="space-x-1"><span>Country {index}</span></div>'
+                     f'<div class="text-base">Song {index}</div></div>\n')
+    return HEAD + f"<div class='flex flex-wrap'>{''.join(cards)}</div></body></html>"
+
+
+def eurovision_final_page(rng: random.Random, rows: int = 26) -> str:
+    suffixes = {1: "st", 2: "nd", 3: "rd"}
+    trs = []
+    for place, index in enumerate(rng.sample(range(40), rows), start=1):
+        trs.append(f'<tr><td></td><td>Country {index}</td><td>Artist {index}</td><td><span>Song {index}</span></td>'
+                   f'<td>{rng.randint(0, 500)}</td><td>{place}{suffixes.get(place, "th")}</td></tr>\n')
+    return HEAD + f"<table><thead><tr><th></th></tr></thead><tbody>{''.join(trs)}</tbody></table></body></html>"
+
+
+def esc_listing_page(rng: random.Random, rows: int = 30) -> str:
+    trs = ["<tr><td>spurious</td></tr>"]
+    for index in range(rows):
+        trs.append(f"<tr><td></td><td><a>{1956 + index // 10}</a></td><td></td><td><a>Country {index}</a></td>"
+                   f"<td> Artist {index} </td><td> Song {index} </td><td></td><td></td>"
+                   f"<td><a href='details.asp?key={index}'>Details</a></td></tr>")
+    return HEAD + f"<table><tbody>{''.join(trs)}</tbody></table></body></html>"
+
+
+def esc_detail_page(rng: random.Random) -> str:
+    language = rng.choice(["English", "French", "Swedish", "Italian"])
+    return HEAD + f"<section id='middle-col'><p><b>Language</b>:\t{language}</p><p>Lyrics...</p></section></body></html>"
+
+
+SYNTHETIC = {
+    "denmark": denmark_page,
+    "finland": finland_page,
+    "norway": norway_page,
+    "sweden": sweden_page,
+    "spotify": spotify_page,
+    "eurovision-participants": eurovision_participants_page,
+    "eurovision-final": eurovision_final_page,
+    "esc-listing": esc_listing_page,
+    "esc-detail": esc_detail_page,
+}
+
+
+def load_pages(site: str, count: int = 3) -> Tuple[List[bytes], str]:
+    """Pages of a site and where they come from, recorded or synthetic."""
+    recorded = sorted(glob.glob(os.path.join(FIXTURES_DIR, site, "*.html")))
+    if recorded:
+        pages = []
+        for filename in recorded:
+            with open(filename, "rb") as fh:
+                pages.append(fh.read())
+        return pages, "recorded"
+    rng = random.Random(site)
+    return [SYNTHETIC[site](rng).encode() for _ in range(count)], "synthetic"
+
+
+def urls_to_record() -> Dict[str, List[str]]:
+    import importlib
+
+    urls = {}
+    for site in CHART_SITES:
+        module = importlib.import_module(f"scrape_top_charts_{site}")
+        urls[site] = [module.get_week_url(*key) for key in page_keys(site)]
+    urls["eurovision-participants"] = [f"{event}/participants" for event in RECORDED_EVENTS]
+    urls["eurovision-final"] = [f"{event}/grand-final" for event in RECORDED_EVENTS]
+    urls["esc-listing"] = [ESC_LISTING_URL]
+    urls["esc-detail"] = ["https://www.esc-history.com/details.asp?key=1",
+                          "https://www.esc-history.com/details.asp?key=500"]
+    return urls
+
+
+def record() -> None:
+    """Save the pages of every site, in the order of their keys."""
+    import fetch
+    import scrape_top_charts_spotify
+
+    for site, urls in urls_to_record().items():
+        headers = scrape_top_charts_spotify.HEADERS if site.startswith(("spotify", "eurovision")) else None
+        responses = fetch.fetch_all(urls, headers=headers)
+        directory = os.path.join(FIXTURES_DIR, site)
+        os.makedirs(directory, exist_ok=True)
+        for index, (url, response) in enumerate(zip(urls, responses)):
+            if response.status_code != 200:
+                print(f"Skipping {url}: {response.status_code}")
+                continue
+            with open(os.path.join(directory, f"{index:02}.html"), "wb") as fh:
+                fh.write(response.content)
+            print(f"Recorded {url}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", action="store_true", help="Record pages from the live sites")
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+    else:
+        for site in SITES:
+            pages, source = load_pages(site)
+            print(f"{site:>24}: {len(pages)} {source} pages")
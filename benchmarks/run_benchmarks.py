@@ -0,0 +1,262 @@
+"""
+Benchmark the hot paths of the pipeline without hitting any live site: the
+parsers on recorded (or synthetic) pages, checking that every backend
+extracts the same songs, fetching chart pages replayed from an offline HTTP
+cache, and the filter, merge and plot stages on synthetic datasets at several
+scales, e.g.
+
+    python run_benchmarks.py --scales 1 10 100 --compare
+
+The peak memory of the in-memory and streaming top-10 aggregations on
+millions of rows, see benchmark_streaming.py, is measured on request only:
+
+    python run_benchmarks.py --only streaming --streaming-rows 1000000 4000000
+
+Throughput and peak memory of every benchmark are appended with the current
+commit to results.jsonl, and --compare reports the benchmarks that got slower
+or hungrier than in the last run of another commit.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import benchmark_streaming
+import datasets
+import fixtures
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(BASEDIR, "results.jsonl")
+
+sys.path.append(os.path.join(BASEDIR, os.pardir, "visualize-top-charts"))
+
+import extraction  # noqa: E402
+import http_cache  # noqa: E402
+import ingest  # noqa: E402
+
+
+class Result(NamedTuple):
+    throughput: float
+    unit: str
+    seconds: float
+    peak_mb: float
+
+
+def measure(run: Callable[[], None], items: int, unit: str, repeat: int) -> Result:
+    """Best time over `repeat` runs, and peak memory of one more run traced by tracemalloc."""
+    run()  # Warm up caches, e.g. compiled XPath expressions
+    seconds = min(timed(run) for _ in range(repeat))
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(items / seconds, unit, seconds, peak / 2 ** 20)
+
+
+def timed(run: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def count_rows(path: str) -> int:
+    with open(path) as fh:
+        return sum(1 for _ in fh) - 1  # Header
+
+
+@contextlib.contextmanager
+def working_directory(path: str) -> Iterator[None]:
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def parser_benchmarks(repeat: int) -> Dict[str, Result]:
+    results = {}
+    backends = [backend for backend in extraction.BACKENDS if backend != "lxml" or extraction.etree is not None]
+    for source in ingest.load_sources(fixtures.CHART_SITES):
+        pages, _ = fixtures.load_pages(source.name)
+        keys = fixtures.page_keys(source.name)
+        for page, key in zip(pages, keys):
+            charts = [ingest.parse_chart(source, page, key, backend) for backend in backends]
+            if any(chart != charts[0] for chart in charts):
+                raise AssertionError(f"Parser backends disagree on a {source.name} page")
+        for backend in backends:
+            results[f"parse/{source.name}/{backend}"] = measure(
+                lambda: [ingest.parse_chart(source, page, key, backend) for page, key in zip(pages, keys)],
+                len(pages), "pages/s", repeat)
+
+    import scrape_eurovision_songs_esc
+    import scrape_eurovision_songs_official
+
+    participants, _ = fixtures.load_pages("eurovision-participants")
+    finals, _ = fixtures.load_pages("eurovision-final")
+    results["parse/eurovision"] = measure(
+        lambda: [scrape_eurovision_songs_official.parse_event_pages(participant, final, 2021)
+                 for participant, final in zip(participants, finals)],
+        len(participants), "events/s", repeat)
+
+    listings, _ = fixtures.load_pages("esc-listing")
+    results["parse/esc-listing"] = measure(
+        lambda: [scrape_eurovision_songs_esc.get_listing_rows(page, 0) for page in listings],
+        len(listings), "pages/s", repeat)
+    details, _ = fixtures.load_pages("esc-detail")
+    results["parse/esc-detail"] = measure(
+        lambda: [scrape_eurovision_songs_esc.get_language(page) for page in details],
+        len(details), "pages/s", repeat)
+    return results
+
+
+def fetch_benchmarks(repeat: int) -> Dict[str, Result]:
+    """Fetch and parse chart pages end to end, replayed from an offline HTTP cache."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cache = http_cache.HTTPCache(os.path.join(directory, "cache"), offline=True)
+        for source in ingest.load_sources(fixtures.CHART_SITES):
+            pages, _ = fixtures.load_pages(source.name)
+            keys = fixtures.page_keys(source.name)
+            for page, key in zip(pages, keys):
+                cache.store(source.url(*key), source.headers, 200, {}, page)
+            results[f"fetch/{source.name}"] = measure(
+                lambda: [ingest.extract_chart(source, key, cache) for key in keys[:len(pages)]],
+                len(pages), "pages/s", repeat)
+    return results
+
+
+def stage_benchmarks(scales: List[int], repeat: int) -> Dict[str, Result]:
+    import assign_language
+    import filter_top_10
+    import visualize_top_charts
+
+    results = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as root:
+            datasets.write_tree(root, scale)
+            with working_directory(os.path.join(root, "scrape-top-charts")):
+                rows = sum(count_rows(filename) for filename in filter_top_10.RADIOCHARTS)
+                results[f"filter/{scale}x"] = measure(filter_top_10.filter_radio_charts, rows, "rows/s", repeat)
+                results[f"filter-streaming/{scale}x"] = measure(
+                    lambda: filter_top_10.filter_radio_charts(chunksize=100_000), rows, "rows/s", repeat)
+            with working_directory(os.path.join(root, "scrape-eurovision")):
+                rows = datasets.EUROVISION_ENTRIES * scale
+                results[f"merge/{scale}x"] = measure(assign_language.merge_language_into_dataset, rows, "rows/s",
+                                                     repeat)
+            with working_directory(os.path.join(root, "visualize-top-charts")):
+                rows = 2 * 10 * len(datasets.COUNTRIES) * datasets.YEARS * scale
+                results[f"plot-data/{scale}x"] = measure(visualize_top_charts.create_dataset_for_vis, rows, "rows/s",
+                                                         repeat)
+    return results
+
+
+def streaming_benchmarks(rows: List[int], parquet: bool) -> Dict[str, Result]:
+    """Each aggregation runs once, in a process of its own, peak memory being its peak RSS."""
+    return {f"top10-{mode}/{count}": Result(count / result["seconds"], "rows/s", result["seconds"],
+                                            result["peak_rss_mb"])
+            for count, mode, result in benchmark_streaming.benchmark(rows, parquet=parquet)}
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASEDIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results: Dict[str, Result], commit: Optional[str]) -> None:
+    record = {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "results": {name: result._asdict() for name, result in results.items()},
+    }
+    with open(RESULTS, "a") as fh:
+        fh.write(json.dumps(record) + "\n")
+
+
+def baseline(commit: Optional[str]) -> Optional[dict]:
+    """Last recorded run of another commit."""
+    if not os.path.exists(RESULTS):
+        return None
+    with open(RESULTS) as fh:
+        runs = [json.loads(line) for line in fh if line.strip()]
+    previous = [run for run in runs if run["commit"] != commit]
+    return previous[-1] if previous else None
+
+
+def compare(results: Dict[str, Result], previous: dict, tolerance: float) -> List[str]:
+    """Names of the benchmarks whose throughput dropped or peak memory grew by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        speed = result.throughput / before["throughput"]
+        memory = result.peak_mb / before["peak_mb"] if before["peak_mb"] else 1
+        flag = speed < 1 - tolerance or memory > 1 + tolerance
+        print(f"{name:>32}: {speed:5.2f}x throughput, {memory:5.2f}x peak memory{'  REGRESSION' if flag else ''}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100],
+                        help="Sizes of the synthetic datasets, relative to the committed ones")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", choices=["parse", "fetch", "stages", "streaming"], nargs="+",
+                        default=["parse", "fetch", "stages"])
+    parser.add_argument("--streaming-rows", type=int, nargs="+", default=[1_000_000, 4_000_000],
+                        help="Sizes of the synthetic Spotify charts of the streaming benchmark")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Read the charts of the streaming benchmark from a Parquet copy")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare with the last run of another commit, failing on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--no-save", action="store_true", help="Do not record the results")
+    args = parser.parse_args()
+
+    for site in fixtures.SITES:
+        _, source = fixtures.load_pages(site)
+        if source == "synthetic":
+            print(f"No recorded pages for {site}, using synthetic ones")
+
+    results = {}
+    if "parse" in args.only:
+        results.update(parser_benchmarks(args.repeat))
+    if "fetch" in args.only:
+        results.update(fetch_benchmarks(args.repeat))
+    if "stages" in args.only:
+        results.update(stage_benchmarks(args.scales, args.repeat))
+    if "streaming" in args.only:
+        results.update(streaming_benchmarks(args.streaming_rows, args.parquet))
+
+    for name, result in results.items():
+        print(f"{name:>32}: {result.throughput:12.1f} {result.unit:<9} {result.seconds:8.3f}s "
+              f"{result.peak_mb:8.1f} MB peak")
+
+    commit = current_commit()
+    exit_code = 0
+    if args.compare:
+        previous = baseline(commit)
+        if previous is None:
+            print("No previous run to compare with")
+        else:
+            print(f"\nCompared with {previous['commit']} ({previous['date']}):")
+            exit_code = 1 if compare(results, previous, args.tolerance) else 0
+    if not args.no_save:
+        save(results, commit)
+    sys.exit(exit_code)
@@ -0,0 +1,130 @@
+"""
+Single entry point to every step of the pipeline, e.g.
+
+    python charts.py scrape denmark --incremental
+    python charts.py scrape charts --incremental
+    python charts.py filter --streaming
+    python charts.py label --lyrics-backend none
+    python charts.py merge
+    python charts.py plot --panels
+
+Arguments following the step are passed on to its script, which is run from
+its own directory, so the datasets are found whatever the current directory;
+relative paths given as arguments are thus relative to that directory too.
+Heavy dependencies (pandas, bs4, matplotlib...) are only imported by the step
+that needs them, and --import-time reports what starting a step costs.
+"""
+import argparse
+import os
+import re
+import runpy
+import subprocess
+import sys
+
+from typing import List, Tuple
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+
+SCRAPERS = {
+    "charts": "scrape-top-charts/ingest.py",
+    "denmark": "scrape-top-charts/scrape_top_charts_denmark.py",
+    "finland": "scrape-top-charts/scrape_top_charts_finland.py",
+    "norway": "scrape-top-charts/scrape_top_charts_norway.py",
+    "sweden": "scrape-top-charts/scrape_top_charts_sweden.py",
+    "spotify": "scrape-top-charts/scrape_top_charts_spotify.py",
+    "eurovision-official": "scrape-eurovision/scrape_eurovision_songs_official.py",
+    "eurovision-esc": "scrape-eurovision/scrape_eurovision_songs_esc.py",
+}
+
+STEPS = {
+    "filter": ("scrape-top-charts/filter_top_10.py", "Keep the top songs of each year and country"),
+    "label": ("scrape-top-charts/detect_language.py", "Detect the language of the top songs"),
+    "runs": ("scrape-top-charts/chart_runs.py", "Index the debut, peak, weeks and streaks of every song"),
+    "similarity": ("scrape-top-charts/chart_similarity.py", "Compare the charts of every market week by week"),
+    "merge": ("scrape-eurovision/assign_language.py", "Merge languages into the Eurovision dataset"),
+    "plot": ("visualize-top-charts/visualize_top_charts.py", "Plot the languages of the top songs"),
+    "store": ("scrape-top-charts/storage.py", "Write the Parquet copies of every dataset"),
+    "serve": ("serve-charts/serve_charts.py", "Serve the datasets over HTTP"),
+}
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_script(script: str, args: List[str]) -> None:
+    """Run a pipeline script as if started from its own directory with the given arguments."""
+    path = os.path.join(BASEDIR, script)
+    directory = os.path.dirname(path)
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    sys.argv = [path] + args
+    runpy.run_path(path, run_name="__main__")
+
+
+def parse_import_times(stderr: str) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """
+    Cumulative import time in microseconds of every top-level module from the
+    output of -X importtime, and the remaining lines of that output.
+    """
+    modules, others = [], []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match is None:
+            if not line.startswith("import time:"):
+                others.append(line)
+            continue
+        # Modules imported by other modules are indented under them
+        if len(match.group(3)) == 1:
+            modules.append((match.group(4), int(match.group(2))))
+    return modules, others
+
+
+def report_import_time(argv: List[str], top: int = 15) -> int:
+    """Run the command again under -X importtime, and print its slowest top-level imports."""
+    process = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__)] + argv,
+                             stderr=subprocess.PIPE, text=True)
+    modules, others = parse_import_times(process.stderr)
+    if others:
+        print("\n".join(others), file=sys.stderr)
+
+    total = sum(cumulative for _, cumulative in modules)
+    print(f"\nImports took {total / 1e6:.3f}s, slowest top-level modules:", file=sys.stderr)
+    for module, cumulative in sorted(modules, key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{cumulative / 1e6:8.3f}s  {module}", file=sys.stderr)
+    return process.returncode
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="charts", description="Scrape, label and plot music charts")
+    parser.add_argument("--import-time", action="store_true",
+                        help="Report how long importing modules took, as measured by python -X importtime")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scrape = subparsers.add_parser("scrape", help="Scrape the charts of a source")
+    scrape.add_argument("source", choices=SCRAPERS.keys())
+
+    for command, (_, description) in STEPS.items():
+        subparsers.add_parser(command, help=description, add_help=False)
+    return parser
+
+
+def split_arguments(argv: List[str]) -> Tuple[List[str], List[str]]:
+    """Split the arguments of this command from those passed on to the step, e.g. its own --help."""
+    commands = ["scrape"] + list(STEPS.keys())
+    position = next((index for index, arg in enumerate(argv) if arg in commands), len(argv))
+    end = position + (2 if argv[position:position + 1] == ["scrape"] else 1)
+    return argv[:end], argv[end:]
+
+
+def main(argv: List[str]) -> int:
+    own_args, step_args = split_arguments(argv)
+    args = make_parser().parse_args(own_args)
+    if args.import_time:
+        return report_import_time([arg for arg in own_args if arg != "--import-time"] + step_args)
+
+    script = SCRAPERS[args.source] if args.command == "scrape" else STEPS[args.command][0]
+    run_script(script, step_args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,26 +1,50 @@
+import os
 import pandas
+import sys
+
+# Shared modules live next to the chart scrapers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import record_linkage  # noqa: E402
+import storage  # noqa: E402
+
+# Countries named differently by esc-history than by eurovision.tv
+COUNTRIES = {"Bosnia-Herzegovina": "Bosnia & Herzegovina", "FYR Macedonia": "North Macedonia"}
+
+
+def transliteration(values: pandas.Series) -> pandas.Series:
+    # esc-history follows names in other scripts with their original spelling, e.g. "Mana Mou | Μάνα μου",
+    # the bar being surrounded by no-break spaces
+    return values.astype(str).str.split(r"\s*\|\s*", n=1, regex=True).str[0]
 
 
 def merge_language_into_dataset() -> None:
-    df_official = pandas.read_csv("data/eurovision_songs_official.csv")
+    df_official = storage.read_dataset("data/eurovision_songs_official.csv")
     df_official.sort_values(by=["year", "country"], inplace=True)
     df_official.reset_index(drop=True, inplace=True)
 
-    df_esc = pandas.read_csv("data/eurovision_songs_esc.csv")
+    df_esc = storage.read_dataset("data/eurovision_songs_esc.csv")
     df_esc.sort_values(by=["year", "country"], inplace=True)
     df_esc.reset_index(drop=True, inplace=True)
 
-    df_official["lowertitle"] = df_official.title.apply(str.lower)
-    df_esc["lowertitle"] = df_esc.title.apply(str.lower)
-
-    merged = pandas.merge(df_official, df_esc, on=["country", "lowertitle", "year"], how="left")
-
-    # Adjust column name, remove extra column and reorder columns alphabetically
-    merged.rename(columns={"artist_x": "artist", "title_x": "title"}, inplace=True)
-    merged.drop(["artist_y", "title_y", "lowertitle"], axis=1, inplace=True)
+    # Titles and artists are spelled differently by both sources, songs are matched on their similarity
+    candidates = pandas.DataFrame({
+        "artist": transliteration(df_esc.artist),
+        "country": df_esc.country.astype(str).replace(COUNTRIES),
+        "title": transliteration(df_esc.title),
+        "year": df_esc.year,
+    })
+    linkage = record_linkage.link(df_official.astype({"country": str}), candidates, blocks=["year", "country"])
+    print(f"Matched {len(linkage.matches)} songs, {len(linkage.unmatched_left)} without a language:")
+    print(df_official.loc[linkage.unmatched_left, ["year", "country", "artist", "title"]].to_string(index=False))
+
+    language = df_esc.language.astype(str).iloc[linkage.matches.right].to_numpy()
+    merged = df_official.assign(language=pandas.Series(language, index=linkage.matches.left))
+
+    # Reorder columns alphabetically
     merged = merged.reindex(sorted(merged.columns), axis=1)
 
-    merged.to_csv("data/eurovision_songs_merged.csv", index=False)
+    storage.write_dataset(merged, "data/eurovision_songs_merged.csv")
 
 
 if __name__ == "__main__":
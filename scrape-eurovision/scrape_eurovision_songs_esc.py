@@ -1,10 +1,36 @@
+import argparse
+import asyncio
 import bs4
+import csv
+import os
 import pandas
-import requests
+import sys
 
-from typing import NamedTuple, Optional
+from typing import List, NamedTuple, Optional, Set
+
+# The HTTP layer is shared with the chart scrapers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import fetch  # noqa: E402
+import http_cache  # noqa: E402
+import metrics  # noqa: E402
+import storage  # noqa: E402
 
 BASE_URL = "https://www.esc-history.com/entries.asp?start="
+DETAIL_BASE_URL = "https://www.esc-history.com/"
+
+DATASET = "data/eurovision_songs_esc.csv"
+# Songs are streamed here while crawling, so that an interrupted crawl can be resumed
+PARTIAL_DATASET = "data/eurovision_songs_esc_partial.csv"
+# Listing rows whose detail page does not exist or has no language, as found by the last crawl
+MISSING_DATASET = "data/eurovision_songs_esc_missing.csv"
+# Statuses of the detail pages recorded as missing, others being fetched again by the next crawl
+MISSING_STATUSES = (200, 404)
+
+# Song detail pages never change, while listing pages shift when a new contest is added
+CACHE_TTL_RULES = [("entries\\.asp", http_cache.ONE_DAY)]
+
+WORKERS = 8
 
 
 class SongInfo(NamedTuple):
@@ -15,58 +41,192 @@ class SongInfo(NamedTuple):
     year: int
 
 
-def get_song_info(row: bs4.element.Tag) -> Optional[SongInfo]:
-    elements = row.find_all("td")
+class ListingRow(NamedTuple):
+    start: int  # Listing page the row comes from
+    index: int  # Position of the row in its listing page
+    detail_url: str
+    artist: str
+    country: str
+    title: str
+    year: int
+
+
+def get_listing_rows(content: bytes, start: int) -> List[ListingRow]:
     year_col = 1
     country_col = 3
     artist_col = 4
     title_col = 5
     details_col = 8
 
-    detail_url = elements[details_col].find("a", href=True)["href"]
-    detail_page = requests.get("https://www.esc-history.com/"+detail_url)
-    if detail_page.status_code == 404:
-        # No details about this song, something weird going on
-        return None
-
-    detail_soup = bs4.BeautifulSoup(detail_page.content, 'html.parser')
+    with metrics.RUN.stage("parse") as stage:
+        # First row is always spurious
+        rows = bs4.BeautifulSoup(content, "html.parser").table.tbody.find_all("tr")[1:]
+
+        listing = []
+        for index, row in enumerate(rows):
+            elements = row.find_all("td")
+            detail_url = DETAIL_BASE_URL + elements[details_col].find("a", href=True)["href"]
+            artist = elements[artist_col].text.strip()
+            country = elements[country_col].a.text
+            title = elements[title_col].text.strip()
+            year = int(elements[year_col].a.text)
+            listing.append(ListingRow(start, index, detail_url, artist, country, title, year))
+        stage.rows = len(listing)
+    return listing
+
+
+def get_language(content: bytes) -> Optional[str]:
+    detail_soup = bs4.BeautifulSoup(content, 'html.parser')
     section = detail_soup.find("section", id="middle-col")
-    strippedstrings = list(section.stripped_strings)
+    strippedstrings = list(section.stripped_strings) if section is not None else []
+    if "Language" not in strippedstrings:
+        return None
     langind = strippedstrings.index("Language") + 1
+    return strippedstrings[langind].strip(":\t")
 
-    artist = elements[artist_col].text.strip()
-    country = elements[country_col].a.text
-    language = strippedstrings[langind].strip(":\t")
-    title = elements[title_col].text.strip()
-    year = int(elements[year_col].a.text)
-
-    return SongInfo(artist, country, language, title, year)
 
+def get_song_info(row: ListingRow, detail_page: fetch.Response) -> Optional[SongInfo]:
+    if detail_page.status_code == 404:
+        # No details about this song, something weird going on
+        return None
+    with metrics.RUN.stage("parse"):
+        language = get_language(detail_page.content)
+    if language is None:
+        return None
+    return SongInfo(row.artist, row.country, language, row.title, row.year)
 
-def extract_songinfo_from(url: str) -> pandas.DataFrame:
-    page = requests.get(url)
 
-    # First row is always spurious
-    rows = bs4.BeautifulSoup(page.content, "html.parser").table.tbody.find_all("tr")[1:]
+def extract_songinfo_from(url: str, cache: Optional[http_cache.HTTPCache] = None) -> pandas.DataFrame:
+    page = fetch.fetch(url, cache=cache)
+    rows = get_listing_rows(page.content, int(url.split("=")[-1]))
+    detail_pages = fetch.fetch_all([row.detail_url for row in rows], cache=cache)
 
-    info = [get_song_info(row) for row in rows]
+    info = [get_song_info(row, detail_page) for row, detail_page in zip(rows, detail_pages)]
     info = [song for song in info if song is not None]
 
     df = pandas.DataFrame(info)
     return df
 
 
-def create_dataset() -> pandas.DataFrame:
-    dfs = []
-    for startn in range(1, 1352, 30):
-        print(f"Gathering page {startn}")
-        url = f"{BASE_URL}{startn}"
-        df = extract_songinfo_from(url)
-        dfs.append(df)
-    return pandas.concat(dfs)
+def reset_missing(missing_path: str, partial_path: str) -> None:
+    """
+    Start a new list of missing rows along with a new crawl, and keep only the
+    rows missing for good when resuming one, e.g. not those of pages that
+    failed with a 503 in older versions of the list.
+    """
+    if not os.path.exists(missing_path):
+        return
+    if not os.path.exists(partial_path):
+        os.remove(missing_path)
+        return
+    missing = pandas.read_csv(missing_path)
+    missing[missing.status_code.isin(MISSING_STATUSES)].to_csv(missing_path, index=False)
+
+
+def read_crawled_urls(*paths: str) -> Set[str]:
+    urls = set()
+    for path in paths:
+        if os.path.exists(path):
+            urls.update(pandas.read_csv(path, usecols=["detail_url"]).detail_url)
+    return urls
+
+
+class CSVAppender:
+    """Append rows to a CSV file, writing its header first if the file is new."""
+
+    def __init__(self, path: str, columns: List[str]) -> None:
+        is_new = not os.path.exists(path)
+        self.fh = open(path, "a", newline="")
+        self.writer = csv.writer(self.fh)
+        if is_new:
+            self.writer.writerow(columns)
+
+    def append(self, row: tuple) -> None:
+        self.writer.writerow(row)
+        self.fh.flush()
+
+    def close(self) -> None:
+        self.fh.close()
+
+
+async def crawl(cache: Optional[http_cache.HTTPCache] = None, workers: int = WORKERS,
+                partial_path: str = PARTIAL_DATASET, missing_path: str = MISSING_DATASET, **kwargs) -> int:
+    """
+    Crawl esc-history as a pipeline: listing pages are fetched concurrently and
+    feed their rows into a queue, from which a pool of workers fetches and
+    parses detail pages. Songs are appended to `partial_path` as soon as they
+    are parsed, and rows whose detail page is missing or has no language are
+    recorded in `missing_path`. Rows already present in either file are
+    skipped, so that a crawl can be resumed after being interrupted. Detail
+    pages that failed otherwise, e.g. with a 503, are left for the next crawl,
+    whose number is returned. Keyword arguments are forwarded to `fetch.Fetcher`.
+    """
+    reset_missing(missing_path, partial_path)
+    crawled = read_crawled_urls(partial_path, missing_path)
+    songs = CSVAppender(partial_path, list(ListingRow._fields) + ["language"])
+    missing = CSVAppender(missing_path, list(ListingRow._fields) + ["status_code"])
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 4)
+    pending = []
+
+    async with fetch.Fetcher(cache=cache, concurrency_per_host=workers, **kwargs) as fetcher:
+        async def produce() -> None:
+            listing_starts = range(1, 1352, 30)
+            listing_pages = [asyncio.ensure_future(fetcher.get(f"{BASE_URL}{start}")) for start in listing_starts]
+            for start, listing_page in zip(listing_starts, listing_pages):
+                print(f"Gathering page {start}")
+                for row in get_listing_rows((await listing_page).content, start):
+                    if row.detail_url not in crawled:
+                        await queue.put(row)
+            for _ in range(workers):
+                await queue.put(None)
+
+        async def consume() -> None:
+            while True:
+                row = await queue.get()
+                if row is None:
+                    return
+                detail_page = await fetcher.get(row.detail_url)
+                if detail_page.status_code not in MISSING_STATUSES:
+                    print(f"Failed to fetch {row.detail_url} ({detail_page.status_code}), left for the next crawl")
+                    pending.append(row)
+                    continue
+                song = get_song_info(row, detail_page)
+                if song is None:
+                    missing.append(tuple(row) + (detail_page.status_code,))
+                else:
+                    songs.append(tuple(row) + (song.language,))
+
+        try:
+            await asyncio.gather(produce(), *(consume() for _ in range(workers)))
+        finally:
+            songs.close()
+            missing.close()
+    return len(pending)
+
+
+def create_dataset(cache: Optional[http_cache.HTTPCache] = None, workers: int = WORKERS,
+                   partial_path: str = PARTIAL_DATASET, missing_path: str = MISSING_DATASET,
+                   **kwargs) -> pandas.DataFrame:
+    pending = asyncio.run(crawl(cache, workers, partial_path, missing_path, **kwargs))
+    if pending:
+        raise RuntimeError(f"{pending} detail pages could not be fetched, run the crawl again to resume it")
+    df = pandas.read_csv(partial_path)
+    # Restore the order of the listing pages, which workers do not preserve
+    df.sort_values(by=["start", "index"], inplace=True)
+    return df[list(SongInfo._fields)].reset_index(drop=True)
 
 
 if __name__ == "__main__":
-    df = create_dataset()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--offline", action="store_true", help="Replay pages from the HTTP cache only")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Number of detail pages fetched concurrently")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache = http_cache.HTTPCache(ttl_rules=CACHE_TTL_RULES, offline=args.offline)
+    df = create_dataset(cache, args.workers)
     df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/eurovision_songs_esc.csv", index=False)
+    storage.write_dataset(df, DATASET)
+    # The crawl is complete, start from scratch next time
+    os.remove(PARTIAL_DATASET)
+    metrics.report(args)
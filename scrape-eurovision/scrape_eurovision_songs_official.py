@@ -1,10 +1,31 @@
+import argparse
 import bs4
+import os
 import pandas
-import requests
+import sys
 
-from typing import NamedTuple, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# The HTTP layer is shared with the chart scrapers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import fetch  # noqa: E402
+import http_cache  # noqa: E402
+import metrics  # noqa: E402
+
+from journal import Journal  # noqa: E402
+from song_identity import normalize  # noqa: E402
 
 BASE_URL = "https://eurovision.tv/events"
+DATASET = "data/eurovision_songs_official.csv"
+JOURNAL = "data/journal/official"
+
+# Results of past contests never change, unlike the list of events and the
+# pages of the ongoing contest
+CACHE_TTL_RULES = [
+    ("/events$", http_cache.ONE_DAY),
+    (f"-{http_cache.CURRENT_YEAR}(/|$)", http_cache.ONE_DAY),
+]
 
 # Headers dict to use when requesting pages from spotifycharts.com
 HEADERS = {
@@ -12,8 +33,8 @@ HEADERS = {
 }
 
 
-def gather_events_url() -> list:
-    page = requests.get(BASE_URL, headers=HEADERS)
+def gather_events_url(cache: Optional[http_cache.HTTPCache] = None) -> list:
+    page = fetch.fetch(BASE_URL, headers=HEADERS, cache=cache)
     soup = bs4.BeautifulSoup(page.content, "html.parser")
     events = soup.find(class_="flex flex-wrap").find_all("div", class_="w-full md:w-1/3 xl:w-1/4 bg-white")
     return [event.find("a", href=True)["href"] for event in events][1:]  # Skip 2022
@@ -36,62 +57,94 @@ def get_participant_info(participant: bs4.element.Tag) -> Tuple[str, str, str]:
     return artist, country, title
 
 
-def get_final_info_if_present(artist: str, title: str, final_rows: bs4.element.ResultSet) -> Tuple[Optional[int], Optional[int]]:
+# Place and points of a song in the final, keyed by (artist, title)
+FinalResults = Dict[Tuple[str, str], Tuple[Optional[int], Optional[int]]]
+
+
+def parse_final_rows(final_rows: bs4.element.ResultSet) -> Tuple[FinalResults, FinalResults]:
+    """
+    Parse the table of the final once, indexing each result both by exact and
+    normalized (artist, title).
+    """
     artist_col = 2
     title_col = 3
     points_col = 4
     place_col = 5
 
+    exact, normalized = {}, {}
     for row in final_rows:
         elements = row.find_all("td")
         rowartist = elements[artist_col].text.strip()
         rowtitle = elements[title_col].span.text.strip()
-        if rowartist == artist and rowtitle == title:
-            rowplace = elements[place_col].text.strip()[:-2]  # Remove suffixes like 'st', 'nd', 'th'
-            rowpoints = int(elements[points_col].text.strip()) if elements[points_col].text.strip() != "—" else 0
-            return rowplace, rowpoints
+        rowplace = elements[place_col].text.strip()[:-2]  # Remove suffixes like 'st', 'nd', 'th'
+        rowpoints = int(elements[points_col].text.strip()) if elements[points_col].text.strip() != "—" else 0
+        # Keep the first row in case the same song appears twice
+        exact.setdefault((rowartist, rowtitle), (rowplace, rowpoints))
+        normalized.setdefault((normalize(rowartist), normalize(rowtitle)), (rowplace, rowpoints))
 
-    return None, None
+    return exact, normalized
 
 
-def extract_songinfo_from(url: str) -> pandas.DataFrame:
-    year = int(url.split("-")[-1])
-    if year < 2004:
-        final_url = f"{url}/final"
-    else:
-        final_url = f"{url}/grand-final"
+def get_final_info_if_present(artist: str, title: str,
+                              final_results: Tuple[FinalResults, FinalResults]) -> Tuple[Optional[int], Optional[int]]:
+    exact, normalized = final_results
+    if (artist, title) in exact:
+        return exact[(artist, title)]
+    # Fall back to a comparison insensitive to case, whitespace and diacritics
+    return normalized.get((normalize(artist), normalize(title)), (None, None))
 
-    participants_url = f"{url}/participants"
-    participants_page = requests.get(participants_url, headers=HEADERS)
 
-    participants = bs4.BeautifulSoup(participants_page.content, "html.parser").find(
-        class_="flex flex-wrap").find_all(class_="pointer-events-none")
+def parse_event_pages(participants_content: bytes, final_content: bytes, year: int) -> pandas.DataFrame:
+    with metrics.RUN.stage("parse") as stage:
+        participants = bs4.BeautifulSoup(participants_content, "html.parser").find(
+            class_="flex flex-wrap").find_all(class_="pointer-events-none")
 
-    participants_info = [get_participant_info(participant) for participant in participants]
+        participants_info = [get_participant_info(participant) for participant in participants]
 
-    final_page = requests.get(final_url, headers=HEADERS)
-    final_rows = bs4.BeautifulSoup(final_page.content, "html.parser").table.tbody.find_all("tr")
+        final_rows = bs4.BeautifulSoup(final_content, "html.parser").table.tbody.find_all("tr")
+        final_results = parse_final_rows(final_rows)
 
-    final_info = [get_final_info_if_present(artist, title, final_rows) for (artist, _, title) in participants_info]
+        final_info = [get_final_info_if_present(artist, title, final_results)
+                      for (artist, _, title) in participants_info]
 
-    info = [SongInfo(artist, country, title, place_final, points_final)
-            for (artist, country, title), (place_final, points_final) in zip(participants_info, final_info)]
+        info = [SongInfo(artist, country, title, place_final, points_final)
+                for (artist, country, title), (place_final, points_final) in zip(participants_info, final_info)]
+        stage.rows = len(info)
 
     df = pandas.DataFrame(info)
     df["year"] = year
     return df
 
 
-def create_dataset() -> pandas.DataFrame:
+def extract_songinfo_from(url: str, cache: Optional[http_cache.HTTPCache] = None) -> pandas.DataFrame:
+    year = int(url.split("-")[-1])
+    if year < 2004:
+        final_url = f"{url}/final"
+    else:
+        final_url = f"{url}/grand-final"
+
+    participants_url = f"{url}/participants"
+    participants_page, final_page = fetch.fetch_all([participants_url, final_url], headers=HEADERS, cache=cache)
+    return parse_event_pages(participants_page.content, final_page.content, year)
+
+
+def create_dataset(cache: Optional[http_cache.HTTPCache] = None) -> pandas.DataFrame:
     dfs = []
-    for url in gather_events_url():
+    for url in gather_events_url(cache):
         print(url)
         if url == "https://eurovision.tv/event/london-1963":
             continue
-        df = extract_songinfo_from(url)
+        df = extract_songinfo_from(url, cache)
         dfs.append(df)
     return pandas.concat(dfs)
 
+
+def scrape_to_journal(urls: List[str], journal: Journal, cache: Optional[http_cache.HTTPCache] = None) -> None:
+    for url in journal.pending(urls):
+        print(url)
+        journal.record_frame(url, extract_songinfo_from(url, cache))
+
+
 def save_specific_year(url: str) -> None:
     df = extract_songinfo_from(url)
     year = int(url.split("-")[-1])
@@ -99,6 +152,17 @@ def save_specific_year(url: str) -> None:
 
 
 if __name__ == "__main__":
-    df = create_dataset()
-    df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/eurovision_songs_official.csv", index=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--offline", action="store_true", help="Replay pages from the HTTP cache only")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    journal = Journal(JOURNAL)
+    cache = http_cache.HTTPCache(ttl_rules=CACHE_TTL_RULES, offline=args.offline)
+    urls = [url for url in gather_events_url(cache) if url != "https://eurovision.tv/event/london-1963"]
+    scrape_to_journal(urls, journal, cache)
+
+    columns = sorted(list(SongInfo._fields) + ["year"])  # Order columns alphabetically
+    journal.write_dataset(DATASET, columns, keys=urls)
+    journal.clear()
+    metrics.report(args)
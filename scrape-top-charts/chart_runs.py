@@ -0,0 +1,283 @@
+"""
+Run index of the weekly charts: for every song of each platform and country,
+its debut, last and peak weeks, its weeks on the chart, its longest streak
+of consecutive weeks, across year boundaries, and its re-entries, e.g.
+
+    python chart_runs.py
+    python chart_runs.py --song "Ed Sheeran" "Shape of You"
+    python chart_runs.py --top longest_streak -k 10 --country Norway
+
+The index is built in one sorted pass over the chart datasets, and later
+updates only summarize the weeks charted since, merging their summary into
+the saved index. Queries are answered from the index without rescanning the
+charts.
+"""
+import argparse
+import datetime
+import metrics
+import numpy
+import os
+import pandas
+import song_identity
+import storage
+
+from filter_top_10 import RADIOCHARTS, SPOTIFYCHARTS, radio_country
+from typing import Dict, List, Optional, Tuple
+
+INDEX_DATASET = "data/analytics/chart_runs.csv"
+
+CHART = ["platform", "country"]
+KEYS = CHART + ["song_id"]
+
+# Metrics songs can be ranked by, and whether lower values rank first
+METRICS = {
+    "weeks": False,
+    "longest_streak": False,
+    "reentries": False,
+    "peak": True,
+    "peak_weeks": False,
+}
+
+# Weeks are numbered consecutively within a platform, so that runs carry on
+# across year boundaries: radio charts have 52 weeks a year, Spotify weekly
+# charts start on a Friday
+RADIO_WEEKS_PER_YEAR = 52
+SPOTIFY_WEEKDAY = datetime.date(2017, 1, 6).toordinal() % 7
+
+
+def radio_week_index(year: pandas.Series, week: pandas.Series) -> pandas.Series:
+    return year.astype("int32") * RADIO_WEEKS_PER_YEAR + week.astype("int32") - 1
+
+
+def spotify_week_index(daterange: pandas.Series) -> pandas.Series:
+    starts = pandas.to_datetime(daterange.astype(str).str.slice(0, 10))
+    ordinals = (starts - pandas.Timestamp("0001-01-01")).dt.days + 1
+    return (ordinals // 7).astype("int32")
+
+
+def week_label(platform: str, index: int) -> str:
+    """Human readable week of a week index, e.g. 2019-W10 or the first day of a Spotify chart."""
+    if platform == "radio":
+        year, week = divmod(int(index), RADIO_WEEKS_PER_YEAR)
+        return f"{year}-W{week + 1:02}"
+    return datetime.date.fromordinal(int(index) * 7 + SPOTIFY_WEEKDAY).isoformat()
+
+
+def load_charts(radio_filenames: List[str] = RADIOCHARTS,
+                spotify_filename: str = SPOTIFYCHARTS) -> pandas.DataFrame:
+    """Chart entries of every platform and country, with their week index."""
+    dfs = []
+    for filename in radio_filenames:
+        if not os.path.exists(filename):
+            continue
+        df = storage.read_dataset(filename, columns=["artist", "title", "position", "year", "week"])
+        dfs.append(pandas.DataFrame({
+            "platform": "radio",
+            "country": radio_country(filename),
+            "artist": df.artist.astype(str),
+            "title": df.title.astype(str),
+            "position": df.position,
+            "week_index": radio_week_index(df.year, df.week),
+        }))
+    if os.path.exists(spotify_filename):
+        df = storage.read_dataset(spotify_filename, columns=["artist", "title", "country", "daterange", "position"])
+        dfs.append(pandas.DataFrame({
+            "platform": "spotify",
+            "country": df.country.astype(str),
+            "artist": df.artist.astype(str),
+            "title": df.title.astype(str),
+            "position": df.position,
+            "week_index": spotify_week_index(df.daterange),
+        }))
+    charts = pandas.concat(dfs, ignore_index=True)
+    charts["song_id"] = song_identity.INDEX.song_ids(charts.artist, charts.title)
+    return charts
+
+
+def summarize(charts: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Run summary of every song of the given chart entries, in one sorted pass.
+    A run is a streak of consecutive weeks; the lengths of the first and last
+    runs are kept so that summaries of successive weeks can be merged.
+    """
+    with metrics.RUN.stage("summarize") as stage:
+        # Best position first, so that a song spelled twice in a chart counts once
+        charts = charts.sort_values(KEYS + ["week_index", "position"], kind="stable").reset_index(drop=True)
+        song_codes = charts.groupby(KEYS, sort=False, observed=True).ngroup().to_numpy()
+        weeks = charts.week_index.to_numpy()
+        new_song = numpy.r_[True, song_codes[1:] != song_codes[:-1]]
+        keep = new_song | numpy.r_[True, weeks[1:] != weeks[:-1]]
+        charts, song_codes, weeks, new_song = charts[keep], song_codes[keep], weeks[keep], new_song[keep]
+
+        # Runs break where the song changes or a week is skipped
+        new_run = new_song | numpy.r_[True, weeks[1:] != weeks[:-1] + 1]
+        run_starts = numpy.flatnonzero(new_run)
+        run_lengths = numpy.diff(numpy.r_[run_starts, len(weeks)])
+        song_starts = numpy.flatnonzero(new_song)
+        # Index of the first run of every song among the runs
+        song_runs = numpy.searchsorted(run_starts, song_starts)
+        last_runs = numpy.r_[song_runs[1:], len(run_starts)] - 1
+
+        positions = charts.position.to_numpy().astype("int64")
+        peaks = numpy.minimum.reduceat(positions, song_starts)
+        at_peak = positions == numpy.repeat(peaks, numpy.diff(numpy.r_[song_starts, len(weeks)]))
+        # Earliest week at the peak position, and number of weeks spent there
+        rows_at_peak = numpy.flatnonzero(at_peak)
+        peak_rows = rows_at_peak[numpy.searchsorted(rows_at_peak, song_starts)]
+
+        first = charts.iloc[song_starts]
+        summary = pandas.DataFrame({
+            "platform": first.platform.to_numpy(),
+            "country": first.country.to_numpy(),
+            "song_id": first.song_id.to_numpy(),
+            "artist": first.artist.to_numpy(),
+            "title": first.title.to_numpy(),
+            "debut_week": weeks[song_starts],
+            "last_week": weeks[numpy.r_[song_starts[1:], len(weeks)] - 1],
+            "peak": peaks,
+            "peak_week": weeks[peak_rows],
+            "peak_weeks": numpy.add.reduceat(at_peak.astype("int64"), song_starts),
+            "weeks": numpy.diff(numpy.r_[song_starts, len(weeks)]),
+            "runs": numpy.diff(numpy.r_[song_runs, len(run_starts)]),
+            "longest_streak": numpy.maximum.reduceat(run_lengths, song_runs),
+            "first_streak": run_lengths[song_runs],
+            "last_streak": run_lengths[last_runs],
+        })
+        stage.rows = len(charts)
+    return finish(summary)
+
+
+def finish(summary: pandas.DataFrame) -> pandas.DataFrame:
+    summary["reentries"] = summary.runs - 1
+    return storage.apply_schema(summary.sort_values(KEYS, kind="stable").reset_index(drop=True))
+
+
+def merge(old: pandas.DataFrame, new: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Merge the summary of later weeks into the index. Runs of a song joining
+    up across the two, i.e. its last week in the index directly followed by
+    its first new week, are counted as one.
+    """
+    old_keys = pandas.MultiIndex.from_frame(old[KEYS])
+    new_keys = pandas.MultiIndex.from_frame(new[KEYS])
+    rows = old.merge(new, on=KEYS, suffixes=("", "_new"))
+
+    def values(column: str) -> numpy.ndarray:
+        return rows[column].to_numpy("int64")
+
+    joined = values("debut_week_new") == values("last_week") + 1
+    new_peak = values("peak_new") < values("peak")
+    same_peak = values("peak_new") == values("peak")
+    combined = pandas.DataFrame({
+        **{column: rows[column].to_numpy() for column in KEYS + ["artist", "title", "debut_week"]},
+        "last_week": values("last_week_new"),
+        "peak": numpy.where(new_peak, values("peak_new"), values("peak")),
+        "peak_week": numpy.where(new_peak, values("peak_week_new"), values("peak_week")),
+        "peak_weeks": numpy.where(new_peak, 0, values("peak_weeks")) + numpy.where(new_peak | same_peak,
+                                                                                   values("peak_weeks_new"), 0),
+        "weeks": values("weeks") + values("weeks_new"),
+        "runs": values("runs") + values("runs_new") - joined,
+        "longest_streak": numpy.maximum.reduce([values("longest_streak"), values("longest_streak_new"),
+                                                numpy.where(joined, values("last_streak") + values("first_streak_new"),
+                                                            0)]),
+        # A single run of the older weeks, or of the later ones, carries on into the other
+        "first_streak": values("first_streak") + numpy.where(joined & (values("runs") == 1),
+                                                              values("first_streak_new"), 0),
+        "last_streak": values("last_streak_new") + numpy.where(joined & (values("runs_new") == 1),
+                                                                values("last_streak"), 0),
+    })
+    parts = [old[~old_keys.isin(new_keys)], combined, new[~new_keys.isin(old_keys)]]
+    summary = pandas.concat([part.drop(columns="reentries", errors="ignore") for part in parts], ignore_index=True)
+    # Categories differ between the parts, they are rebuilt over the merged summary
+    return finish(summary.astype({column: str for column in CHART + ["artist", "title"]}))
+
+
+def watermarks(index: pandas.DataFrame) -> Dict[Tuple[str, str], int]:
+    """Last week summarized in the index, for each platform and country."""
+    return index.groupby(CHART, observed=True).last_week.max().to_dict()
+
+
+def update_index(charts: pandas.DataFrame, index: Optional[pandas.DataFrame] = None) -> pandas.DataFrame:
+    """Summarize the chart weeks not in the index yet, and merge them into it."""
+    if index is None or index.empty:
+        return summarize(charts)
+    marks = pandas.Series(watermarks(index), dtype="int64")
+    marks.index.names = CHART
+    last = charts.join(marks.rename("watermark"), on=CHART).watermark
+    later = charts[last.isna() | (charts.week_index > last)]
+    if later.empty:
+        return index
+    return merge(index, summarize(later))
+
+
+def build(path: str = INDEX_DATASET, rebuild: bool = False) -> pandas.DataFrame:
+    index = None if rebuild or not os.path.exists(path) else storage.read_dataset(path)
+    index = update_index(load_charts(), index)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    storage.write_dataset(index, path)
+    return index
+
+
+class RunIndex:
+    """Queries on the run index, answered from lookups and presorted rankings."""
+
+    def __init__(self, runs: pandas.DataFrame) -> None:
+        self.runs = runs
+        self.by_song = runs.set_index("song_id").sort_index()
+        self.rankings: Dict[str, pandas.DataFrame] = {}
+
+    @classmethod
+    def load(cls, path: str = INDEX_DATASET) -> "RunIndex":
+        return cls(storage.read_dataset(path))
+
+    def song(self, artist: str, title: str) -> pandas.DataFrame:
+        """Runs of a song in every platform and country, whatever its spelling."""
+        song_id = song_identity.INDEX.song_id(artist, title)
+        return self.by_song.loc[[song_id]] if song_id in self.by_song.index else self.by_song.iloc[:0]
+
+    def ranking(self, metric: str) -> pandas.DataFrame:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {', '.join(METRICS)}")
+        if metric not in self.rankings:
+            # Ties go to the songs that stayed longest on the chart
+            self.rankings[metric] = self.runs.sort_values([metric, "weeks"], ascending=[METRICS[metric], False],
+                                                          kind="stable")
+        return self.rankings[metric]
+
+    def top(self, metric: str, k: int = 10, platform: Optional[str] = None,
+            country: Optional[str] = None) -> pandas.DataFrame:
+        ranking = self.ranking(metric)
+        if platform is not None:
+            ranking = ranking[ranking.platform == platform]
+        if country is not None:
+            ranking = ranking[ranking.country == country]
+        return ranking.head(k)
+
+
+def show(runs: pandas.DataFrame) -> None:
+    runs = runs.reset_index().copy()
+    for column in ["debut_week", "last_week", "peak_week"]:
+        runs[column] = [week_label(platform, week) for platform, week in zip(runs.platform, runs[column])]
+    columns = CHART + ["artist", "title", "debut_week", "last_week", "peak", "peak_week", "peak_weeks", "weeks",
+                       "longest_streak", "reentries"]
+    print(runs[columns].to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=INDEX_DATASET)
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from scratch, e.g. after a rescrape")
+    parser.add_argument("--song", nargs=2, metavar=("ARTIST", "TITLE"), help="Show the runs of a song")
+    parser.add_argument("--top", choices=METRICS.keys(), help="Show the top songs by this metric")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--platform", choices=["radio", "spotify"])
+    parser.add_argument("--country")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    runs = RunIndex(build(args.index, args.rebuild))
+    if args.song:
+        show(runs.song(*args.song))
+    if args.top:
+        show(runs.top(args.top, args.k, args.platform, args.country))
+    metrics.report(args)
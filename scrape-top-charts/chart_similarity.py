@@ -0,0 +1,257 @@
+"""
+Similarity of every pair of charts of the same week, across countries and
+platforms, e.g. how close Denmark's and Norway's radio charts are week by
+week, or how the radio diverges from Spotify in a country:
+
+    python chart_similarity.py
+    python chart_similarity.py --between radio/Denmark radio/Norway
+    python chart_similarity.py --depth 50
+
+Every chart is a sparse vector over songs, truncated to its top `depth`
+positions. Pairs of charts are compared with:
+
+- jaccard: share of their songs charting in both;
+- cosine: cosine similarity of vectors weighting songs by their position,
+  depth for the number one down to 1 for the last song;
+- rank_correlation: correlation of the positions of the songs of either
+  chart, songs missing from a chart ranking just below it.
+
+All of them derive from sums over the songs common to two charts, which are
+the non-zero products of the chart vectors. They are computed at once for
+every pair by pairing the entries of each song and period, rather than by
+comparing charts one pair at a time.
+"""
+import argparse
+import metrics
+import numpy
+import os
+import pandas
+import song_identity
+import storage
+import time
+
+from filter_top_10 import RADIOCHARTS, SPOTIFYCHARTS, radio_country
+from typing import List, Optional, Tuple
+
+SIMILARITY_DATASET = "data/analytics/chart_similarity.csv"
+
+DEPTH = 10  # Positions compared, the depth of the shortest radio chart
+MEASURES = ["jaccard", "cosine", "rank_correlation"]
+
+
+def radio_periods(year: pandas.Series, week: pandas.Series) -> pandas.Series:
+    return year.astype(str) + "-W" + week.astype(int).map("{:02}".format)
+
+
+def spotify_periods(daterange: pandas.Series) -> pandas.Series:
+    """
+    Period of every Spotify chart. A weekly chart runs from a Friday to a
+    Thursday, and is assigned to the ISO week of the following Monday, where
+    most of its days fall, so that it lines up with the radio week.
+    """
+    # Periods are derived once per distinct chart, rather than once per entry
+    codes, dateranges = pandas.factorize(daterange.astype(str))
+    starts = pandas.Series(pandas.to_datetime(dateranges.str.slice(0, 10)))
+    weeks = (starts + pandas.Timedelta(days=3)).dt.isocalendar()
+    periods = weeks.year.astype(str) + "-W" + weeks.week.map("{:02}".format)
+    return pandas.Series(periods.to_numpy()[codes], index=daterange.index)
+
+
+def load_entries(depth: int = DEPTH, radio_filenames: List[str] = RADIOCHARTS,
+                 spotify_filename: str = SPOTIFYCHARTS) -> pandas.DataFrame:
+    """Top `depth` entries of every chart, with their week."""
+    dfs = []
+    for filename in radio_filenames:
+        if not os.path.exists(filename):
+            continue
+        df = storage.read_dataset(filename, columns=["artist", "title", "position", "year", "week"])
+        df = df[df.position <= depth]
+        dfs.append(pandas.DataFrame({
+            "platform": "radio",
+            "country": radio_country(filename),
+            "period": radio_periods(df.year, df.week),
+            "position": df.position,
+            "song_id": song_identity.INDEX.song_ids(df.artist, df.title),
+        }))
+    if os.path.exists(spotify_filename):
+        df = storage.read_dataset(spotify_filename, columns=["artist", "title", "country", "daterange", "position"])
+        df = df[df.position <= depth]
+        dfs.append(pandas.DataFrame({
+            "platform": "spotify",
+            "country": df.country.astype(str),
+            "period": spotify_periods(df.daterange),
+            "position": df.position,
+            "song_id": song_identity.INDEX.song_ids(df.artist, df.title),
+        }))
+    return pandas.concat(dfs, ignore_index=True)
+
+
+def group_pairs(groups: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Positions i < j of every pair of elements of the same group, `groups` being sorted."""
+    starts = numpy.flatnonzero(numpy.r_[True, groups[1:] != groups[:-1]])
+    sizes = numpy.diff(numpy.r_[starts, len(groups)])
+    # Elements following each one in its group
+    following = numpy.repeat(starts + sizes, sizes) - numpy.arange(len(groups)) - 1
+    firsts, seconds = [], []
+    candidates = numpy.flatnonzero(following > 0)
+    offset = 1
+    while len(candidates):
+        firsts.append(candidates)
+        seconds.append(candidates + offset)
+        offset += 1
+        candidates = candidates[following[candidates] >= offset]
+    if not firsts:
+        return numpy.zeros(0, dtype="int64"), numpy.zeros(0, dtype="int64")
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+
+def first_of_runs(*columns: numpy.ndarray) -> numpy.ndarray:
+    """Mask of the elements starting a run of equal values in all the columns, which are sorted."""
+    mask = numpy.zeros(len(columns[0]), dtype=bool)
+    mask[:1] = True
+    for column in columns:
+        mask[1:] |= column[1:] != column[:-1]
+    return mask
+
+
+def sort_order(*columns: Tuple[numpy.ndarray, int]) -> numpy.ndarray:
+    """
+    Order sorting by several columns of non-negative integers below the given
+    bounds, the first one varying slowest. Columns are packed into a single
+    key, which sorts much faster than `numpy.lexsort` on several keys.
+    """
+    keys = numpy.zeros(len(columns[0][0]), dtype="int64")
+    for values, bound in columns:
+        keys = keys * bound + values
+    return numpy.argsort(keys, kind="stable")
+
+
+def similarities(entries: pandas.DataFrame, depth: int = DEPTH) -> pandas.DataFrame:
+    """Similarity measures of every pair of charts of the same period, from their entries."""
+    with metrics.RUN.stage("similarity") as stage:
+        # Charts are numbered by period, then by platform and country, from integer codes of the columns
+        period_codes, periods = pandas.factorize(entries.period, sort=True)
+        platform_codes, platforms = pandas.factorize(entries.platform, sort=True)
+        country_codes, countries = pandas.factorize(entries.country, sort=True)
+        markets = platform_codes * len(countries) + country_codes
+        songs, song_ids = pandas.factorize(entries.song_id)
+        positions = entries.position.to_numpy("int64")
+        market_count = len(platforms) * len(countries)
+
+        # A song spelled twice in a chart counts once, at its best position
+        order = sort_order((period_codes, len(periods)), (markets, market_count), (songs, len(song_ids)),
+                           (positions, int(positions.max(initial=0)) + 1))
+        period_codes, markets, songs, positions = period_codes[order], markets[order], songs[order], positions[order]
+        keep = first_of_runs(period_codes, markets, songs)
+        period_codes, markets, songs, positions = period_codes[keep], markets[keep], songs[keep], positions[keep]
+        chart_starts = first_of_runs(period_codes, markets)
+        chart_codes = numpy.cumsum(chart_starts) - 1
+        chart_periods, chart_markets = period_codes[chart_starts], markets[chart_starts]
+        charts = len(chart_periods)
+
+        # Positions rank the songs, and weigh them from depth for the number one down to 1
+        ranks = positions.astype("float64")
+        missing = depth + 1  # Rank of the songs missing from a chart
+        weights = missing - ranks
+        sizes = numpy.bincount(chart_codes, minlength=charts)
+        rank_sums = numpy.bincount(chart_codes, ranks, charts)
+        rank_squares = numpy.bincount(chart_codes, ranks ** 2, charts)
+        norms = numpy.sqrt(numpy.bincount(chart_codes, weights ** 2, charts))
+
+        # Pairs of charts of a period are laid out as the cells of a square
+        # matrix, so that sums over the pairs of charts are dense bincounts
+        period_charts = numpy.bincount(chart_periods, minlength=len(periods))
+        period_starts = numpy.cumsum(period_charts) - period_charts
+        cell_offsets = numpy.cumsum(period_charts ** 2) - period_charts ** 2
+
+        def cells(a: numpy.ndarray, b: numpy.ndarray) -> numpy.ndarray:
+            period = chart_periods[a]
+            return (cell_offsets[period] + (a - period_starts[period]) * period_charts[period]
+                    + b - period_starts[period])
+
+        # Entries of a song in the same period, paired across charts: the
+        # non-zero products of the chart vectors
+        song_order = sort_order((period_codes, len(periods)), (songs, len(song_ids)), (markets, market_count))
+        firsts, seconds = group_pairs(numpy.cumsum(first_of_runs(period_codes[song_order], songs[song_order])))
+        firsts, seconds = song_order[firsts], song_order[seconds]
+        common_cells = cells(chart_codes[firsts], chart_codes[seconds])
+        ranks_a, ranks_b = ranks[firsts], ranks[seconds]
+        total_cells = int(numpy.sum(period_charts ** 2))
+
+        def cell_sums(values: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+            return numpy.bincount(common_cells, values, total_cells)
+
+        # Every pair of charts of the same period
+        pair_a, pair_b = group_pairs(chart_periods)
+        pair_cells = cells(pair_a, pair_b)
+        common = cell_sums()[pair_cells].astype("int64")
+        common_ranks_a = cell_sums(ranks_a)[pair_cells]
+        common_ranks_b = cell_sums(ranks_b)[pair_cells]
+        rank_products = cell_sums(ranks_a * ranks_b)[pair_cells]
+        weight_products = cell_sums((missing - ranks_a) * (missing - ranks_b))[pair_cells]
+
+        # Positions over the union of the songs of both charts
+        union = sizes[pair_a] + sizes[pair_b] - common
+        sum_a = rank_sums[pair_a] + (sizes[pair_b] - common) * missing
+        sum_b = rank_sums[pair_b] + (sizes[pair_a] - common) * missing
+        squares_a = rank_squares[pair_a] + (sizes[pair_b] - common) * missing ** 2
+        squares_b = rank_squares[pair_b] + (sizes[pair_a] - common) * missing ** 2
+        products = (rank_products + missing * (rank_sums[pair_a] - common_ranks_a)
+                    + missing * (rank_sums[pair_b] - common_ranks_b))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            correlation = (products - sum_a * sum_b / union) / numpy.sqrt(
+                (squares_a - sum_a ** 2 / union) * (squares_b - sum_b ** 2 / union))
+
+        # Charts are numbered by platform and country within a period, so pairs read the
+        # same way in every period, e.g. radio/Denmark before radio/Norway
+        markets_a, markets_b = chart_markets[pair_a], chart_markets[pair_b]
+        result = pandas.DataFrame({
+            "period": pandas.Categorical.from_codes(chart_periods[pair_a], periods),
+            "platform_a": pandas.Categorical.from_codes(markets_a // len(countries), platforms),
+            "country_a": pandas.Categorical.from_codes(markets_a % len(countries), countries),
+            "platform_b": pandas.Categorical.from_codes(markets_b // len(countries), platforms),
+            "country_b": pandas.Categorical.from_codes(markets_b % len(countries), countries),
+            "common": common,
+            "jaccard": common / union,
+            "cosine": weight_products / (norms[pair_a] * norms[pair_b]),
+            "rank_correlation": correlation,
+        })
+        result = result.iloc[numpy.lexsort((chart_periods[pair_a], markets_b, markets_a))]
+        stage.rows = len(result)
+    # Order columns alphabetically
+    return result.reindex(sorted(result.columns), axis=1).reset_index(drop=True)
+
+
+def summary(result: pandas.DataFrame) -> pandas.DataFrame:
+    """Mean similarity of every pair of markets over all periods."""
+    return result.groupby(["platform_a", "country_a", "platform_b", "country_b"], observed=True)[MEASURES].mean()
+
+
+def between(result: pandas.DataFrame, a: str, b: str) -> pandas.DataFrame:
+    """Similarity time series of two markets, given as platform/country, e.g. radio/Denmark."""
+    (platform_a, country_a), (platform_b, country_b) = sorted([a.split("/", 1), b.split("/", 1)])
+    pair = result[(result.platform_a == platform_a) & (result.country_a == country_a)
+                  & (result.platform_b == platform_b) & (result.country_b == country_b)]
+    return pair.set_index("period")[["common"] + MEASURES]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--depth", type=int, default=DEPTH, help="Positions of every chart compared")
+    parser.add_argument("--output", default=SIMILARITY_DATASET)
+    parser.add_argument("--between", nargs=2, metavar=("PLATFORM/COUNTRY", "PLATFORM/COUNTRY"),
+                        help="Show the similarity time series of two markets")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = similarities(load_entries(args.depth), args.depth)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    storage.write_dataset(result, args.output)
+    print(f"{len(result)} pairs of charts compared in {time.perf_counter() - start:.1f}s")
+
+    with pandas.option_context("display.width", 200, "display.max_rows", 200):
+        print(summary(result).round(3))
+        if args.between:
+            print(between(result, *args.between).round(3))
+    metrics.report(args)
@@ -1,48 +1,120 @@
+import argparse
+import language_classifier
+import lyrics
+import metrics
 import pandas
 import os
+import song_identity
+import storage
+import sys
 
-from functools import lru_cache
-from langdetect import detect
-from langdetect.lang_detect_exception import LangDetectException
-from lyricsgenius import Genius
-from pycountry import languages
-from requests.exceptions import Timeout
+from language_cache import LanguageCache
+from language_classifier import Detection
+from typing import Dict, List, NamedTuple, Optional
 
-FILENAMES = [os.path.join("data/top10", filename) for filename in os.listdir("data/top10")]
+TOP10_DIR = "data/top10"
+LABELLED_DIR = "data/labelled-automated"
+# Songs whose language was detected with a lower confidence, listed for manual labelling
+MIN_CONFIDENCE = 0.9
+REVIEW_DATASET = "data/labelled-automated/to_review.csv"
 
-# Need to provide a Genius access token for this to work
-# GENIUS = Genius(..., timeout=20, retries=5, sleep_time=1)
-GENIUS = None
 
+class Classification(NamedTuple):
+    name: str = "langdetect"
+    model: Optional[str] = None  # Path of the model file, for fasttext
+    processes: int = language_classifier.PROCESSES
 
-@lru_cache(maxsize=None)
-def detect_song_language(artist: str, title: str) -> str:
-    try:
-        song = GENIUS.search_song(title, artist)
-        todetect = song.lyrics if song is not None and song.lyrics is not None else title.lower()
-        detected = detect(todetect)
-        return languages.get(alpha_2=detected).name
-    except LangDetectException:
-        print(f"Cannot detect language for song {title} by {artist}")
-        return "LangDetectException"
-    except Timeout:
-        print(f"Connection timeout while processing song {title} by {artist}")
-        return "Timeout"
 
+def song_text(title: str, song_lyrics: Optional[str]) -> str:
+    return song_lyrics if song_lyrics is not None else title.lower()
 
-def amend_song_language(artist: str, title: str, language: str) -> str:
-    if language == "Timeout":
-        return detect_song_language(artist, title)
-    else:
-        print(f"No amend needed: {title} by {artist}")
-        return language
 
+def song_ids(dfs: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """Distinct (artist, title) pairs appearing in any of the datasets, with their song identifier."""
+    songs = pandas.concat([df[["artist", "title"]] for df in dfs]).drop_duplicates()
+    songs["song_id"] = song_identity.INDEX.song_ids(songs.artist, songs.title)
+    return songs
 
-if __name__ == "__main__":
-    for filename in FILENAMES:
-        df = pandas.read_csv(filename)
-        df["language"] = df.apply(lambda df: detect_song_language(df.artist, df.title), axis=1)
+
+def label_songs(songs: pandas.DataFrame, pool: lyrics.LyricsPool, cache: LanguageCache,
+                classification: Classification = Classification()) -> Dict[int, Detection]:
+    """
+    Map the identifier of each song to its language, looking lyrics up only for the
+    songs missing from the cache. Songs whose lyrics lookup kept failing are
+    left out, and will be retried by the next run.
+    """
+    labelled = cache.get_many(songs.song_id)
+    todo = songs[~songs.song_id.isin(labelled.keys())]
+    print(f"{len(songs)} unique songs, {len(labelled)} already labelled, {len(todo)} to detect")
+
+    with metrics.RUN.stage("lyrics") as stage:
+        lookups = pool.lookup_many(list(zip(todo.artist, todo.title)))
+        stage.rows = sum(lookup.lyrics is not None for lookup in lookups)
+    found = [(song, lookup) for song, lookup in zip(todo.itertuples(index=False), lookups) if lookup.ok]
+    detections = language_classifier.classify([song_text(song.title, lookup.lyrics) for song, lookup in found],
+                                              classification.name, classification.model,
+                                              processes=classification.processes)
+    for (song, _), detection in zip(found, detections):
+        if detection.language == language_classifier.UNDETECTED:
+            print(f"Cannot detect language for song {song.title}")
+
+    cache.put_many((song.song_id, song.artist, song.title, *detection)
+                   for (song, _), detection in zip(found, detections))
+    labelled.update((song.song_id, detection) for (song, _), detection in zip(found, detections))
+    return labelled
+
+
+def label_datasets(filenames: List[str], pool: lyrics.LyricsPool, cache: LanguageCache,
+                   classification: Classification = Classification(), min_confidence: float = MIN_CONFIDENCE) -> None:
+    dfs = {filename: storage.read_dataset(filename) for filename in filenames}
+
+    songs = song_ids(list(dfs.values()))
+    labelled = label_songs(songs.drop_duplicates("song_id"), pool, cache, classification)
+    songs["language"] = songs.song_id.map(lambda song_id: labelled[song_id].language if song_id in labelled else None)
+    songs["confidence"] = songs.song_id.map(lambda song_id: labelled[song_id].confidence
+                                            if song_id in labelled else None)
+
+    review = songs[songs.confidence < min_confidence].drop(columns="song_id").sort_values("confidence")
+    storage.write_dataset(review.reindex(sorted(review.columns), axis=1), REVIEW_DATASET)
+    print(f"{len(review)} songs detected with a confidence below {min_confidence}, listed in {REVIEW_DATASET}")
+    songs = songs.drop(columns=["song_id", "confidence"])
+
+    for filename, df in dfs.items():
+        df = df.merge(songs, on=["artist", "title"], how="left")
         df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-        df.to_csv(os.path.join("data/labelled-automated", os.path.basename(filename)), index=False)
+        storage.write_dataset(df, os.path.join(LABELLED_DIR, os.path.basename(filename)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lyrics-backend", choices=["genius", "http", "none"], default="genius",
+                        help="Where to look lyrics up; with none, languages are detected from titles only")
+    parser.add_argument("--genius-token", default=os.environ.get("GENIUS_ACCESS_TOKEN"),
+                        help="Genius API access token, defaults to $GENIUS_ACCESS_TOKEN")
+    parser.add_argument("--lyrics-url", help="Base url of the http lyrics backend")
+    parser.add_argument("--workers", type=int, default=lyrics.WORKERS)
+    parser.add_argument("--rate", type=float, default=lyrics.RATE, help="Maximum lyrics requests per second")
+    parser.add_argument("--classifier", choices=["langdetect", "fasttext"], default="langdetect")
+    parser.add_argument("--model", help=f"Language identification model of fasttext, defaults to "
+                                        f"{language_classifier.FASTTEXT_MODEL}")
+    parser.add_argument("--processes", type=int, default=language_classifier.PROCESSES,
+                        help="Processes classifying languages")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help=f"Songs detected with a lower confidence are listed in {REVIEW_DATASET}")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.lyrics_backend == "genius" and args.genius_token is None:
+        print("Warning: no Genius access token, set $GENIUS_ACCESS_TOKEN or --genius-token to look lyrics up; "
+              "languages are detected from titles only", file=sys.stderr)
+        args.lyrics_backend = "none"
+    if args.lyrics_backend == "http" and args.lyrics_url is None:
+        parser.error("--lyrics-url is required by the http lyrics backend")
 
-    print(detect_song_language.cache_info())
+    backend = lyrics.make_backend(args.lyrics_backend, args.genius_token, args.lyrics_url)
+    pool = lyrics.LyricsPool(backend, args.workers, args.rate)
+    filenames = [os.path.join(TOP10_DIR, filename) for filename in os.listdir(TOP10_DIR) if filename.endswith(".csv")]
+    cache = LanguageCache()
+    label_datasets(filenames, pool, cache, Classification(args.classifier, args.model, args.processes),
+                   args.min_confidence)
+    cache.close()
+    metrics.report(args)
@@ -0,0 +1,89 @@
+import bs4
+import metrics
+
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+try:
+    from lxml import etree, html
+except ImportError:
+    etree = html = None
+
+# XPath equivalent of bs4's `find_all(class_=...)`, which matches any of the
+# whitespace separated classes of an element
+HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+
+FieldXPath = Union[str, Sequence[str]]
+
+
+class ExtractionSpec(NamedTuple):
+    """
+    How to extract the rows of a chart page, for every parser backend.
+
+    The bs4 backend selects the rows with `find_rows` and turns each of them
+    into a song with `get_song_info`. The lxml backend selects the rows with
+    `rows_xpath`, evaluates the precompiled `fields_xpath` expressions on each
+    of them and hands the resulting strings to `song_info_from_fields`. A field
+    may list several expressions, the first one matching anything is used.
+
+    Field expressions select the node whose text is wanted, mirroring bs4's
+    `.contents[0]`. Fields matching nothing are passed as None.
+    """
+    find_rows: Callable[[bs4.BeautifulSoup], Iterable]
+    get_song_info: Callable[..., tuple]
+    rows_xpath: str
+    fields_xpath: Dict[str, FieldXPath]
+    song_info_from_fields: Callable[[Dict[str, Optional[str]]], tuple]
+
+
+BACKENDS = ["bs4", "lxml"]
+DEFAULT_BACKEND = "lxml" if etree is not None else "bs4"
+
+
+@lru_cache(maxsize=None)
+def compile_xpath(expression: str) -> "etree.XPath":
+    return etree.XPath(expression)
+
+
+def extract_with_bs4(content: bytes, spec: ExtractionSpec) -> List[tuple]:
+    soup = bs4.BeautifulSoup(content, "html.parser")
+    return [spec.get_song_info(row) for row in spec.find_rows(soup)]
+
+
+def node_text(node) -> str:
+    # Text nodes come back from lxml as strings, elements have to be flattened
+    return str(node) if isinstance(node, str) else node.text_content()
+
+
+def extract_field(row, expressions: FieldXPath) -> Optional[str]:
+    if isinstance(expressions, str):
+        expressions = [expressions]
+    for expression in expressions:
+        nodes = compile_xpath(expression)(row)
+        if nodes:
+            return node_text(nodes[0])
+    return None
+
+
+def extract_with_lxml(content: bytes, spec: ExtractionSpec) -> List[tuple]:
+    if etree is None:
+        raise ImportError("The lxml parser backend requires lxml to be installed")
+    # Decode the page the same way bs4 does, so both backends agree on the text
+    tree = html.fromstring(bs4.dammit.UnicodeDammit(content, is_html=True).unicode_markup)
+    fields = spec.fields_xpath.items()
+    return [spec.song_info_from_fields({name: extract_field(row, expressions) for name, expressions in fields})
+            for row in compile_xpath(spec.rows_xpath)(tree)]
+
+
+EXTRACTORS = {
+    "bs4": extract_with_bs4,
+    "lxml": extract_with_lxml,
+}
+
+
+def extract(content: bytes, spec: ExtractionSpec, backend: str = DEFAULT_BACKEND) -> List[tuple]:
+    """Extract the songs of a chart page with the given parser backend."""
+    with metrics.RUN.stage("parse") as stage:
+        songs = EXTRACTORS[backend](content, spec)
+        stage.rows = len(songs)
+    return songs
@@ -0,0 +1,164 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+import metrics
+from http_cache import HTTPCache
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+# Politeness defaults: at most this many requests in flight towards a single
+# host, with a minimum delay (seconds) between two requests started on it.
+CONCURRENCY_PER_HOST = 4
+DELAY_PER_HOST = 0.0
+
+RETRIES = 3
+BACKOFF = 0.5  # Seconds, doubled at every retry
+TIMEOUT = 30
+
+# Server-side hiccups worth retrying. Anything else (e.g. 404) is returned as is.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class Response(NamedTuple):
+    url: str
+    status_code: int
+    content: bytes
+    headers: Dict[str, str]
+
+
+class HostLimiter:
+    """
+    Bound the number of concurrent requests and the request rate towards a
+    single host.
+    """
+
+    def __init__(self, concurrency: int, delay: float) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self.lock = asyncio.Lock()
+        self.last_start = 0.0
+
+    async def __aenter__(self) -> "HostLimiter":
+        await self.semaphore.acquire()
+        if self.delay:
+            async with self.lock:
+                loop = asyncio.get_running_loop()
+                wait = self.last_start + self.delay - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.last_start = loop.time()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.semaphore.release()
+
+
+class Fetcher:
+    """
+    Asynchronous HTTP client shared by the scrapers. Connections are pooled and
+    kept alive across requests, concurrency is bounded per host and transient
+    failures are retried with exponential backoff. When a `HTTPCache` is given,
+    fresh cached responses are served without touching the network.
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None,
+                 concurrency_per_host: int = CONCURRENCY_PER_HOST,
+                 delay_per_host: float = DELAY_PER_HOST,
+                 host_limits: Optional[Dict[str, int]] = None,
+                 retries: int = RETRIES, backoff: float = BACKOFF, timeout: float = TIMEOUT,
+                 cache: Optional[HTTPCache] = None) -> None:
+        self.headers = headers or {}
+        self.concurrency_per_host = concurrency_per_host
+        self.delay_per_host = delay_per_host
+        self.host_limits = host_limits or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache = cache
+        self.limiters: Dict[str, HostLimiter] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "Fetcher":
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=0, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+
+    def limiter(self, url: str) -> HostLimiter:
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            concurrency = self.host_limits.get(host, self.concurrency_per_host)
+            self.limiters[host] = HostLimiter(concurrency, self.delay_per_host)
+        return self.limiters[host]
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        if self.cache is None:
+            return await self.get_from_network(url, headers)
+
+        request_headers = {**self.headers, **(headers or {})}
+        entry = self.cache.lookup(url, request_headers)
+        if entry is not None and self.cache.is_fresh(entry):
+            metrics.RUN.record_cache(url, "hit")
+            return Response(entry.url, entry.status_code, self.cache.read(entry), entry.headers)
+
+        conditional = self.cache.conditional_headers(entry) if entry is not None else {}
+        response = await self.get_from_network(url, {**(headers or {}), **conditional})
+        if entry is not None and response.status_code == 304:
+            metrics.RUN.record_cache(url, "revalidated")
+            entry = self.cache.refresh(entry)
+            return Response(entry.url, entry.status_code, self.cache.read(entry), entry.headers)
+
+        metrics.RUN.record_cache(url, "miss")
+        self.cache.store(url, request_headers, response.status_code, response.headers, response.content)
+        return response
+
+    async def get_from_network(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter(url):
+                    start = time.perf_counter()
+                    try:
+                        async with self.session.get(url, headers=headers) as resp:
+                            content = await resp.read()
+                            response = Response(str(resp.url), resp.status, content, dict(resp.headers))
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        metrics.RUN.record_request(url, time.perf_counter() - start, None, 0)
+                        raise
+                    metrics.RUN.record_request(url, time.perf_counter() - start, response.status_code, len(content))
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+            # Exponential backoff with jitter so that retries of the same host
+            # do not all fire at once
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+            attempt += 1
+
+    async def get_many(self, urls: Iterable[str]) -> List[Response]:
+        return await asyncio.gather(*(self.get(url) for url in urls))
+
+
+async def _fetch_all(urls: Iterable[str], **kwargs) -> List[Response]:
+    async with Fetcher(**kwargs) as fetcher:
+        return await fetcher.get_many(urls)
+
+
+def fetch_all(urls: Iterable[str], **kwargs) -> List[Response]:
+    """
+    Fetch all the given urls concurrently and return the responses in the same
+    order. Keyword arguments are forwarded to `Fetcher`.
+    """
+    with metrics.RUN.stage("fetch"):
+        return asyncio.run(_fetch_all(urls, **kwargs))
+
+
+def fetch(url: str, **kwargs) -> Response:
+    """Blocking helper to fetch a single url through the shared fetch layer."""
+    return fetch_all([url], **kwargs)[0]
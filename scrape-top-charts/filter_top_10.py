@@ -1,6 +1,11 @@
+import argparse
+import metrics
+import os
 import pandas
+import song_identity
+import storage
 
-from typing import Dict
+from typing import Iterable, Iterator, List, Optional
 
 RADIOCHARTS = [
     "data/charts/charts_radio_denmark_2017_2021.csv",
@@ -11,68 +16,204 @@ RADIOCHARTS = [
 
 SPOTIFYCHARTS = "data/charts/charts_spotify_allcountries_2017_2021.csv"
 
+TOP10_DIR = "data/top10"
 
-def filter_radio_charts() -> Dict[str, pandas.DataFrame]:
+# Songs are ranked within each year and country, and told apart by their
+# identifier, so that spellings like "ED SHEERAN" and "Ed Sheeran" add up
+GROUP = ["year", "country"]
+SONG = ["artist", "title"]
+KEYS = GROUP + ["song_id"]
+# Column telling the charts of a year apart: the week of radio charts, the daterange of Spotify ones
+WEEKS = ["week", "daterange"]
+
+# weekcount: number of chart entries, streams: total streams,
+# score: position-weighted entries, where a number one is worth max_position points
+METRICS = ["weekcount", "streams", "score"]
+
+
+def radio_country(filename: str) -> str:
+    """Country of a radio chart dataset, named like charts_radio_<country>_<years>.csv."""
+    return os.path.basename(filename).split("_")[2].capitalize()
+
+
+def load_radio_charts(filenames: List[str] = RADIOCHARTS) -> pandas.DataFrame:
+    """Read the weekly radio charts of every country into a single dataset, with a country column."""
+    dfs = []
+    for filename in filenames:
+        df = storage.read_dataset(filename, columns=SONG + ["position", "year", "week"])
+        df["country"] = radio_country(filename)
+        dfs.append(df)
+    # Categories differ between countries, so they are rebuilt over the combined dataset
+    return storage.apply_schema(pandas.concat(dfs, ignore_index=True).astype({"artist": str, "title": str}))
+
+
+def iter_radio_charts(filenames: List[str] = RADIOCHARTS, chunksize: int = storage.CHUNKSIZE,
+                      max_position: Optional[int] = 10) -> Iterator[pandas.DataFrame]:
+    for filename in filenames:
+        country = radio_country(filename)
+        for chunk in storage.iter_dataset(filename, SONG + ["position", "year", "week"], chunksize, max_position):
+            chunk["country"] = country
+            yield chunk
+
+
+def load_spotify_charts(filename: str = SPOTIFYCHARTS) -> pandas.DataFrame:
+    return storage.read_dataset(filename, columns=SONG + GROUP + ["daterange", "position", "streams"])
+
+
+def aggregate(charts: pandas.DataFrame, metric: str = "weekcount",
+              max_position: Optional[int] = 10) -> pandas.DataFrame:
     """
-    Read in weekly radio top charts and filter to the 10 most popular songs of
-    each year in each country.
+    Total a metric for every song of each year and country, counting only
+    entries at `max_position` or better, all of them when None. Songs are
+    named after their first spelling in the charts. A song charting under
+    several spellings in the same chart counts once, at its best position,
+    except for streams, which every spelling has of its own.
     """
-    dfs_top10 = {}
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}, expected one of {', '.join(METRICS)}")
+    if metric == "score" and max_position is None:
+        raise ValueError("The score metric needs a maximum position")
+    if max_position is not None:
+        charts = charts[charts.position <= max_position]
+
+    if metric == "weekcount":
+        values = pandas.Series(1, index=charts.index)
+    elif metric == "streams":
+        values = charts.streams.astype("int64")
+    else:
+        values = max_position + 1 - charts.position.astype("int64")
+
+    charts = charts.assign(song_id=song_identity.INDEX.song_ids(charts.artist, charts.title), **{metric: values})
+    if metric != "streams":
+        charts = charts.sort_values("position", kind="stable")
+        charts = charts.drop_duplicates(GROUP + chart_week(charts) + ["song_id"]).sort_index()
+    return combine(charts, metric)
 
-    for filename in RADIOCHARTS:
-        country = filename.split("_")[2]
-        df = pandas.read_csv(filename)
-        df["country"] = country.capitalize()
-        dfs_top10[country] = df[df.position <= 10]
 
-    for country, group in dfs_top10.items():
-        topartists = group.groupby(["year", "artist", "title", "country"])["position"].count(
-        ).reset_index().sort_values(by=["year", "position"], ascending=[True, False])
-        topartists.rename(columns={"position": "weekcount"}, inplace=True)
-        dfs_top10[country] = topartists
+def chart_week(charts: pandas.DataFrame) -> List[str]:
+    return [column for column in WEEKS if column in charts.columns]
 
-    for country in dfs_top10.keys():
-        dfs_top10[country] = dfs_top10[country].groupby("year").head(10).reset_index(drop=True)
 
-    return dfs_top10
+def combine(totals: pandas.DataFrame, metric: str) -> pandas.DataFrame:
+    aggregations = {metric: (metric, "sum"), "artist": ("artist", "first"), "title": ("title", "first")}
+    return totals.groupby(KEYS, observed=True, sort=False).agg(**aggregations).reset_index()
 
 
-def save_filtered_radio_charts() -> None:
+def select_top(totals: pandas.DataFrame, n: int = 10, metric: str = "weekcount") -> pandas.DataFrame:
+    """Keep the `n` songs of each year and country with the highest metric, with a single sort."""
+    # Ties are broken by name, so that the selection does not depend on the order of the charts
+    ranked = totals.sort_values(by=GROUP + [metric] + SONG, ascending=[True, True, False, True, True], kind="stable")
+    return ranked.groupby(GROUP, observed=True).head(n).reset_index(drop=True)
+
+
+def top_n(charts: pandas.DataFrame, n: int = 10, metric: str = "weekcount",
+          max_position: Optional[int] = 10) -> pandas.DataFrame:
     """
-    Aggregate filtered radio charts into a single dataset and save to disk.
+    Rank the songs of each year and country by a metric, keeping the `n` best.
+    Every song is aggregated in a single grouped pass, and the top songs of all
+    groups are then selected by a single sort.
     """
-    dfs_top10 = filter_radio_charts()
-    final = pandas.concat(dfs_top10.values())
-    final.sort_values(by=["year", "country", "weekcount"], ascending=[True, True, False], inplace=True)
-    final = final.reindex(sorted(final.columns), axis=1)  # Order columns alphabetically
-    final.to_csv("data/top10/radio_charts.csv", index=False)
-
+    with metrics.RUN.stage("aggregate") as stage:
+        stage.rows = len(charts)
+        return select_top(aggregate(charts, metric, max_position), n, metric)
+
+
+def whole_charts(chunks: Iterable[pandas.DataFrame]) -> Iterator[pandas.DataFrame]:
+    """Chunks of a dataset stored chart by chart, moving the entries of a chart split between two into the second."""
+    held = None
+    for chunk in chunks:
+        # Categories differ between chunks, which are combined on plain strings
+        chunk = chunk.astype({column: str for column in chunk.columns
+                              if isinstance(chunk[column].dtype, pandas.CategoricalDtype)})
+        if held is not None:
+            chunk = pandas.concat([held, chunk], ignore_index=True)
+        if not len(chunk):
+            continue
+        charts = chunk[GROUP + chart_week(chunk)]
+        last = (charts == charts.iloc[-1]).all(axis=1)
+        held = chunk[last]
+        if not last.all():
+            yield chunk[~last]
+    if held is not None:
+        yield held
+
+
+def top_n_streaming(chunks: Iterable[pandas.DataFrame], n: int = 10, metric: str = "weekcount",
+                    max_position: Optional[int] = 10) -> pandas.DataFrame:
+    """
+    Same as top_n over a dataset read chunk by chunk. Only the running totals of
+    every song are kept in memory, so memory use does not grow with the number
+    of chart entries, only with the number of distinct songs.
 
-def filter_spotify_charts() -> pandas.DataFrame:
+    Every chart is aggregated whole, so that a song spelled twice in it still
+    counts once.
+    """
+    totals = pandas.DataFrame({column: pandas.Series(dtype=object) for column in KEYS + SONG + [metric]})
+    for chunk in whole_charts(chunks):
+        with metrics.RUN.stage("aggregate") as stage:
+            stage.rows = len(chunk)
+            partial = aggregate(chunk, metric, max_position).astype({column: str for column in ["country"] + SONG})
+            if len(totals):
+                partial = combine(pandas.concat([totals, partial], ignore_index=True), metric)
+            totals = partial
+    return select_top(totals, n, metric)
+
+
+def filter_radio_charts(n: int = 10, metric: str = "weekcount",
+                        chunksize: Optional[int] = None) -> pandas.DataFrame:
     """
-    Read in weekly Spotify top charts and filter to the 10 most popular songs of
-    each year in each country.
+    Read in weekly radio top charts and filter to the `n` most popular songs of
+    each year in each country. With a chunksize the charts are streamed.
     """
+    if chunksize is not None:
+        return top_n_streaming(iter_radio_charts(chunksize=chunksize), n, metric)
+    return top_n(load_radio_charts(), n, metric)
 
-    df = pandas.read_csv(SPOTIFYCHARTS)
-    df_top10 = df[df.position <= 10]
 
-    topartists = df_top10.groupby(["year", "artist", "title", "country"])["streams"].sum()
-    topartists = topartists.reset_index().sort_values(by=["year", "country", "streams"], ascending=[True, True, False])
+def save_filtered_radio_charts(n: int = 10, metric: str = "weekcount", output_dir: str = TOP10_DIR,
+                               chunksize: Optional[int] = None) -> None:
+    """
+    Aggregate filtered radio charts into a single dataset and save to disk.
+    """
+    final = filter_radio_charts(n, metric, chunksize)
+    final = final.reindex(sorted(final.columns), axis=1)  # Order columns alphabetically
+    storage.write_dataset(final, os.path.join(output_dir, "radio_charts.csv"))
 
-    topartists = topartists.groupby(["year", "country"]).head(10).reset_index(drop=True)
 
-    return topartists
+def filter_spotify_charts(n: int = 10, metric: str = "streams", chunksize: Optional[int] = None,
+                          filename: str = SPOTIFYCHARTS) -> pandas.DataFrame:
+    """
+    Read in weekly Spotify top charts and filter to the `n` most popular songs of
+    each year in each country. With a chunksize the charts are streamed.
+    """
+    if chunksize is not None:
+        chunks = storage.iter_dataset(filename, SONG + GROUP + ["daterange", "position", "streams"], chunksize,
+                                      max_position=10)
+        return top_n_streaming(chunks, n, metric)
+    return top_n(load_spotify_charts(filename), n, metric)
 
 
-def save_filtered_spotify_charts() -> None:
+def save_filtered_spotify_charts(n: int = 10, metric: str = "streams", output_dir: str = TOP10_DIR,
+                                 chunksize: Optional[int] = None) -> None:
     """Save filtered Spotify charts to disk."""
-    final = filter_spotify_charts()
-    final.sort_values(by=["year", "country", "streams"], ascending=[True, True, False], inplace=True)
+    final = filter_spotify_charts(n, metric, chunksize)
     final = final.reindex(sorted(final.columns), axis=1)  # Order columns alphabetically
-    final.to_csv("data/top10/spotify_charts.csv", index=False)
+    storage.write_dataset(final, os.path.join(output_dir, "spotify_charts.csv"))
 
 
 if __name__ == "__main__":
-    save_filtered_radio_charts()
-    save_filtered_spotify_charts()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10, help="Number of songs kept per year and country")
+    parser.add_argument("--radio-metric", choices=["weekcount", "score"], default="weekcount")
+    parser.add_argument("--spotify-metric", choices=METRICS, default="streams")
+    parser.add_argument("--output-dir", default=TOP10_DIR)
+    parser.add_argument("--streaming", action="store_true",
+                        help="Read the charts in chunks, keeping only running totals in memory")
+    parser.add_argument("--chunksize", type=int, default=storage.CHUNKSIZE, help="Rows per chunk when streaming")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    chunksize = args.chunksize if args.streaming else None
+    save_filtered_radio_charts(args.n, args.radio_metric, args.output_dir, chunksize)
+    save_filtered_spotify_charts(args.n, args.spotify_metric, args.output_dir, chunksize)
+    metrics.report(args)
@@ -0,0 +1,174 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".http_cache")
+MAX_BYTES = 2 * 1024 ** 3
+
+ONE_DAY = 24 * 60 * 60
+CURRENT_YEAR = datetime.date.today().year
+
+# Only successful pages and definitive 404s are worth keeping around
+CACHEABLE_STATUSES = {200, 404}
+# Response headers kept with an entry, by their lowercase name, header names being case-insensitive
+STORED_HEADERS = {"etag": "ETag", "last-modified": "Last-Modified", "content-type": "Content-Type"}
+
+# A TTL rule is a regular expression matched against the url and the number of
+# seconds a matching response stays fresh. A TTL of None means the response
+# never expires, which is the case for charts of weeks that are over.
+TTLRule = Tuple[str, Optional[float]]
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    digest: str
+    size: int
+    stored_at: float
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("Last-Modified")
+
+
+class HTTPCache:
+    """
+    On-disk cache of HTTP responses. Entries are keyed by url and request
+    headers and point to a response body stored under the hash of its content,
+    so identical pages are stored only once. Stale entries are revalidated with
+    ETag/Last-Modified when the server provided them, and the least recently
+    used entries are evicted once the cache grows over `max_bytes`.
+
+    In offline mode every entry is served regardless of its age and a url that
+    was never fetched raises `CacheMiss` instead of hitting the network.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, ttl_rules: Sequence[TTLRule] = (),
+                 default_ttl: Optional[float] = None, max_bytes: int = MAX_BYTES, offline: bool = False) -> None:
+        self.directory = directory
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        bodies = os.path.join(directory, "bodies")
+        os.makedirs(os.path.join(directory, "entries"), exist_ok=True)
+        os.makedirs(bodies, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(os.path.join(bodies, digest)) for digest in os.listdir(bodies))
+
+    @staticmethod
+    def make_key(url: str, headers: Optional[Dict[str, str]] = None) -> str:
+        headers = sorted((name.lower(), value) for name, value in (headers or {}).items())
+        return hashlib.sha256(json.dumps([url, headers]).encode()).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, "entries", f"{key}.json")
+
+    def body_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "bodies", digest)
+
+    def ttl(self, url: str) -> Optional[float]:
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        ttl = self.ttl(entry.url)
+        return self.offline or ttl is None or time.time() - entry.stored_at < ttl
+
+    def lookup(self, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[CacheEntry]:
+        key = self.make_key(url, headers)
+        try:
+            with open(self.entry_path(key)) as fh:
+                entry = CacheEntry(**json.load(fh))
+        except FileNotFoundError:
+            if self.offline:
+                raise CacheMiss(url)
+            return None
+        # Touch the entry so that eviction drops the least recently used ones first
+        os.utime(self.entry_path(key))
+        return entry
+
+    def read(self, entry: CacheEntry) -> bytes:
+        with open(self.body_path(entry.digest), "rb") as fh:
+            return fh.read()
+
+    def conditional_headers(self, entry: CacheEntry) -> Dict[str, str]:
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url: str, headers: Optional[Dict[str, str]], status_code: int,
+              response_headers: Dict[str, str], content: bytes) -> Optional[CacheEntry]:
+        if status_code not in CACHEABLE_STATUSES:
+            return None
+        digest = hashlib.sha256(content).hexdigest()
+        if not os.path.exists(self.body_path(digest)):
+            self._write(self.body_path(digest), content)
+            self.total_bytes += len(content)
+        response_headers = {STORED_HEADERS[name.lower()]: value for name, value in response_headers.items()
+                            if name.lower() in STORED_HEADERS}
+        entry = CacheEntry(self.make_key(url, headers), url, status_code, response_headers,
+                           digest, len(content), time.time())
+        self._write(self.entry_path(entry.key), json.dumps(entry._asdict()).encode())
+        self.evict()
+        return entry
+
+    def refresh(self, entry: CacheEntry) -> CacheEntry:
+        """Mark an entry as fresh again after the server answered 304 Not Modified."""
+        entry = entry._replace(stored_at=time.time())
+        self._write(self.entry_path(entry.key), json.dumps(entry._asdict()).encode())
+        return entry
+
+    def entries(self) -> List[Tuple[float, str, CacheEntry]]:
+        entries = []
+        for filename in os.listdir(os.path.join(self.directory, "entries")):
+            path = os.path.join(self.directory, "entries", filename)
+            with open(path) as fh:
+                entries.append((os.path.getmtime(path), path, CacheEntry(**json.load(fh))))
+        return entries
+
+    def evict(self) -> None:
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        entries = sorted(self.entries())
+        referenced: Dict[str, int] = {}
+        for _, _, entry in entries:
+            referenced[entry.digest] = referenced.get(entry.digest, 0) + 1
+
+        for _, path, entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            referenced[entry.digest] -= 1
+            if referenced[entry.digest] == 0:
+                os.remove(self.body_path(entry.digest))
+                self.total_bytes -= entry.size
+
+    @staticmethod
+    def _write(path: str, content: bytes) -> None:
+        # Write to a temporary file first so a killed run never leaves a
+        # truncated entry behind
+        tmppath = f"{path}.{os.getpid()}.tmp"
+        with open(tmppath, "wb") as fh:
+            fh.write(content)
+        os.replace(tmppath, path)
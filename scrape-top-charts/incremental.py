@@ -0,0 +1,35 @@
+import datetime
+import os
+
+import pandas
+
+from typing import List, Optional, Set, Tuple
+
+# First year covered by the chart datasets
+FIRST_YEAR = 2017
+
+
+def chart_weeks(start_year: int = FIRST_YEAR, end_year: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    List the (year, week) pairs between the given years, both included, leaving
+    out the current week and the ones that are still to come.
+    """
+    today = datetime.date.today()
+    end_year = end_year or today.year
+    current_week = today.isocalendar()[1]
+
+    weeks = []
+    for year in range(start_year, end_year + 1):
+        for week in range(1, 53):
+            if year > today.year or (year == today.year and week >= current_week):
+                break
+            weeks.append((year, week))
+    return weeks
+
+
+def existing_keys(path: str, key_columns: List[str]) -> Set[tuple]:
+    """Set of keys already present in the dataset saved at `path`."""
+    if not os.path.exists(path):
+        return set()
+    df = pandas.read_csv(path, usecols=key_columns)
+    return set(df[key_columns].itertuples(index=False, name=None))
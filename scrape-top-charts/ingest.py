@@ -0,0 +1,211 @@
+"""
+Ingest chart sources declared as adapters, e.g.
+
+    python ingest.py --incremental
+    python ingest.py --sources denmark spotify --start-year 2022
+
+Every source is a `Source`: which charts it publishes, where their pages
+live, how rows are extracted from them and how those rows map onto the
+columns of its dataset. The pages of all the selected sources are fetched
+concurrently in one job, bounded per host by the shared fetch layer, and
+each page is parsed and journaled as soon as it arrives. Pages still failing
+once retries ran out are left pending, and the dataset of their source is not
+written until a later run fetched them.
+"""
+import argparse
+import asyncio
+import extraction
+import fetch
+import http_cache
+import importlib
+import incremental
+import metrics
+import storage
+
+from journal import Journal
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+# Adapters of the sources, declared as `SOURCE` in these modules
+SOURCES = {
+    "denmark": "scrape_top_charts_denmark",
+    "finland": "scrape_top_charts_finland",
+    "norway": "scrape_top_charts_norway",
+    "sweden": "scrape_top_charts_sweden",
+    "spotify": "scrape_top_charts_spotify",
+}
+
+
+class ChartUnavailable(Exception):
+    # A chart page answering with an error status, e.g. 404 or 503 once retries ran out
+    pass
+
+
+class WeeklyChartEntry(NamedTuple):
+    # Columns of the weekly radio chart datasets, in alphabetical order
+    artist: str
+    position: int
+    title: str
+    week: int
+    year: int
+
+
+def weekly_chart_entry(song: tuple, year: int, week: int) -> WeeklyChartEntry:
+    return WeeklyChartEntry(song.artist, song.position, song.title, week, year)
+
+
+class Source(NamedTuple):
+    """
+    Declarative adapter of a chart source. Charts are identified by keys,
+    e.g. (year, week), listed by `chart_keys` between two years. `url` builds
+    the address of the page of a key, `spec` extracts its songs and
+    `to_entry` maps each song and the key onto a row of the dataset, an
+    `entry` whose fields are the dataset columns. `key_columns` are the
+    columns identifying the chart of a row, whose values for a key are given
+    by `dataset_key`. Rows rejected by `keep` are left out of the dataset.
+
+    The defaults describe a weekly radio chart.
+    """
+    name: str
+    dataset: str
+    spec: extraction.ExtractionSpec
+    url: Callable[..., str]
+    entry: type = WeeklyChartEntry
+    to_entry: Callable[..., tuple] = weekly_chart_entry
+    chart_keys: Callable[[int, Optional[int]], List[tuple]] = incremental.chart_weeks
+    key_columns: Sequence[str] = ("year", "week")
+    dataset_key: Callable[[tuple], tuple] = tuple
+    keep: Optional[Callable[[tuple], bool]] = None
+    headers: Optional[Dict[str, str]] = None
+    cache_ttl_rules: Sequence[http_cache.TTLRule] = ()
+
+    @property
+    def journal(self) -> str:
+        return f"data/journal/{self.name}"
+
+
+class Job(NamedTuple):
+    source: Source
+    output: str
+    keys: List[tuple]  # Charts making up the refreshed part of the dataset
+    pending: List[tuple]  # Charts still to fetch, the others being journaled already
+    journal: Journal
+
+
+def load_sources(names: Optional[Sequence[str]] = None) -> List[Source]:
+    return [importlib.import_module(SOURCES[name]).SOURCE for name in (names or SOURCES.keys())]
+
+
+def parse_chart(source: Source, content: bytes, key: tuple,
+                backend: str = extraction.DEFAULT_BACKEND) -> List[tuple]:
+    entries = [source.to_entry(song, *key) for song in extraction.extract(content, source.spec, backend)]
+    return entries if source.keep is None else [entry for entry in entries if source.keep(entry)]
+
+
+def extract_chart(source: Source, key: tuple, cache: Optional[http_cache.HTTPCache] = None) -> List[tuple]:
+    page = fetch.fetch(source.url(*key), headers=source.headers, cache=cache)
+    if page.status_code != 200:
+        raise ChartUnavailable(f"{page.url} answered {page.status_code}")
+    return parse_chart(source, page.content, key)
+
+
+def missing_chart_keys(source: Source, path: str, keys: List[tuple]) -> List[tuple]:
+    present = incremental.existing_keys(path, list(source.key_columns))
+    return [key for key in keys if source.dataset_key(key) not in present]
+
+
+async def _fetch_charts(jobs: List[Job], cache: Optional[http_cache.HTTPCache],
+                        **kwargs) -> Dict[str, List[tuple]]:
+    failed: Dict[str, List[tuple]] = {}
+    async with fetch.Fetcher(cache=cache, **kwargs) as fetcher:
+        async def get(job: Job, key: tuple) -> None:
+            page = await fetcher.get(job.source.url(*key), job.source.headers)
+            if page.status_code != 200:
+                # Not journaled, so that the next run fetches it again
+                print(job.source.name, *key, f"failed with status {page.status_code}")
+                failed.setdefault(job.source.name, []).append(key)
+                return
+            print(job.source.name, *key)
+            entries = parse_chart(job.source, page.content, key)
+            job.journal.record(key, (entry._asdict() for entry in entries))
+
+        await asyncio.gather(*(get(job, key) for job in jobs for key in job.pending))
+    return failed
+
+
+def fetch_charts(jobs: List[Job], cache: Optional[http_cache.HTTPCache] = None,
+                 **kwargs) -> Dict[str, List[tuple]]:
+    """
+    Fetch the pending charts of every job in a single pass, each page being
+    parsed and journaled as soon as it arrives. The keys of the charts whose
+    page failed are returned by source. Keyword arguments are forwarded to
+    `fetch.Fetcher`.
+    """
+    with metrics.RUN.stage("fetch"):
+        return asyncio.run(_fetch_charts(jobs, cache, **kwargs))
+
+
+def make_cache(sources: List[Source], offline: bool = False) -> http_cache.HTTPCache:
+    return http_cache.HTTPCache(ttl_rules=[rule for source in sources for rule in source.cache_ttl_rules],
+                                offline=offline)
+
+
+def ingest(sources: List[Source], start_year: int = incremental.FIRST_YEAR, end_year: Optional[int] = None,
+           refresh: bool = False, cache: Optional[http_cache.HTTPCache] = None,
+           outputs: Optional[Dict[str, str]] = None, **kwargs) -> None:
+    """
+    Scrape the charts of the given sources between two years into their
+    datasets, or with `refresh` only the charts missing from them. Sources
+    some of whose charts failed keep their journal for the next run, and
+    `ChartUnavailable` is raised once the others are written. Keyword
+    arguments are forwarded to `fetch.Fetcher`.
+    """
+    outputs = outputs or {}
+    jobs = []
+    for source in sources:
+        output = outputs.get(source.name, source.dataset)
+        keys = source.chart_keys(start_year, end_year)
+        if refresh:
+            keys = missing_chart_keys(source, output, keys)
+        if not keys:
+            print(f"{source.name}: dataset is already up to date")
+            continue
+        journal = Journal(source.journal)
+        jobs.append(Job(source, output, keys, journal.pending(keys), journal))
+
+    failed = fetch_charts(jobs, cache if cache is not None else make_cache(sources), **kwargs)
+
+    for job in jobs:
+        if job.source.name in failed:
+            continue
+        job.journal.write_dataset(job.output, list(job.source.entry._fields), keys=job.keys, append=refresh)
+        job.journal.clear()
+    if failed:
+        counts = ", ".join(f"{len(keys)} of {name}" for name, keys in failed.items())
+        raise ChartUnavailable(f"Charts failed ({counts}), run again to fetch them and write their datasets")
+
+
+def main(sources: Optional[List[Source]] = None) -> None:
+    """Command line of the given sources, or of the ones selected by --sources."""
+    parser = argparse.ArgumentParser()
+    if sources is None:
+        parser.add_argument("--sources", nargs="+", choices=SOURCES.keys(), default=list(SOURCES.keys()))
+    parser.add_argument("--offline", action="store_true", help="Replay pages from the HTTP cache only")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch charts missing from the datasets")
+    parser.add_argument("--start-year", type=int, default=incremental.FIRST_YEAR)
+    parser.add_argument("--end-year", type=int, default=None, help="Defaults to the current year")
+    parser.add_argument("--output", help="Dataset to write, when scraping a single source")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    if sources is None:
+        sources = load_sources(args.sources)
+    if args.output is not None and len(sources) > 1:
+        parser.error("--output requires a single source")
+    outputs = {sources[0].name: args.output} if args.output is not None else None
+
+    ingest(sources, args.start_year, args.end_year, args.incremental, make_cache(sources, args.offline), outputs)
+    metrics.report(args)
+
+
+if __name__ == "__main__":
+    main()
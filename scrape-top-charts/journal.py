@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import pandas
+import shutil
+import storage
+
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+
+
+class Journal:
+    """
+    Progress journal of a scraping run. Every scraped unit (a week, a country
+    week, an event...) is saved as its own JSONL shard, and its key is then
+    appended to an append-only manifest. A crashed or killed run can thus be
+    resumed by skipping the units listed in the manifest, and the final dataset
+    is assembled by streaming the shards instead of keeping every row in memory.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.jsonl")
+        os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+        self.completed = self.read_manifest()
+
+    @staticmethod
+    def encode_key(key: Hashable) -> str:
+        return json.dumps(key)
+
+    def shard_path(self, key: Hashable) -> str:
+        digest = hashlib.sha1(self.encode_key(key).encode()).hexdigest()
+        return os.path.join(self.directory, "shards", f"{digest}.jsonl")
+
+    def read_manifest(self) -> Dict[str, int]:
+        completed = {}
+        if not os.path.exists(self.manifest_path):
+            return completed
+        with open(self.manifest_path) as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a run killed while writing it
+                    continue
+                completed[entry["key"]] = entry["rows"]
+        return completed
+
+    def is_done(self, key: Hashable) -> bool:
+        return self.encode_key(key) in self.completed
+
+    def pending(self, keys: Iterable[Hashable]) -> List[Hashable]:
+        return [key for key in keys if not self.is_done(key)]
+
+    def record(self, key: Hashable, rows: Iterable[dict]) -> None:
+        """
+        Save the rows of a completed unit, replacing any previous shard for it.
+        A unit without rows counts as done too, e.g. a contest that did not
+        take place, so callers only record units whose page was fetched.
+        """
+        path = self.shard_path(key)
+        tmppath = f"{path}.tmp"
+        count = 0
+        with open(tmppath, "w") as fh:
+            for row in rows:
+                fh.write(json.dumps(row) + "\n")
+                count += 1
+        os.replace(tmppath, path)
+
+        encoded = self.encode_key(key)
+        with open(self.manifest_path, "a") as fh:
+            fh.write(json.dumps({"key": encoded, "rows": count}) + "\n")
+        self.completed[encoded] = count
+
+    def record_frame(self, key: Hashable, df: pandas.DataFrame) -> None:
+        # Missing values are stored as null, so they come back as empty CSV cells
+        self.record(key, df.astype(object).where(df.notna(), None).to_dict("records"))
+
+    def iter_rows(self, keys: Optional[Iterable[Hashable]] = None) -> Iterator[dict]:
+        """Stream the rows of the given units, by default of every completed one."""
+        encoded_keys = self.completed.keys() if keys is None else map(self.encode_key, keys)
+        for encoded in encoded_keys:
+            if encoded not in self.completed:
+                continue
+            with open(self.shard_path(json.loads(encoded))) as fh:
+                for line in fh:
+                    yield json.loads(line)
+
+    def write_dataset(self, path: str, columns: List[str], keys: Optional[Iterable[Hashable]] = None,
+                      append: bool = False) -> None:
+        """
+        Stream the journaled rows into a dataset and its Parquet copy, see
+        storage.write_records. When appending to an existing dataset its own
+        column order is kept.
+        """
+        records = ([row.get(column) for column in columns] for row in self.iter_rows(keys))
+        storage.write_records(records, columns, path, append=append)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory)
@@ -0,0 +1,62 @@
+import sqlite3
+
+from language_classifier import Detection
+from song_identity import INDEX
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CACHE_PATH = "data/language_cache.sqlite"
+
+
+class LanguageCache:
+    """
+    Persistent song -> language mapping keyed by song identifiers, see
+    song_identity, so that songs labelled by a previous run under any of
+    their spellings are neither searched on Genius nor detected again.
+    """
+
+    def __init__(self, path: str = CACHE_PATH) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS song_languages "
+                                "(song_id INTEGER PRIMARY KEY, artist TEXT, title TEXT, language TEXT, "
+                                "confidence REAL)")
+        tables = [row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if "languages" in tables:
+            self.migrate()
+
+    def migrate(self) -> None:
+        """Identify the songs of a cache keyed by strings, as written by earlier versions."""
+        # Caches written before confidences were recorded lack their column, left null for their songs
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(languages)")]
+        confidence = "confidence" if "confidence" in columns else "NULL"
+        spellings: Dict[int, List[tuple]] = {}
+        for row in self.connection.execute(f"SELECT artist, title, language, {confidence} FROM languages"):
+            spellings.setdefault(INDEX.song_id(row[0], row[1]), []).append(row)
+        # Spellings of a song labelled differently, e.g. from their titles alone, give it their most common language
+        songs = []
+        for song_id, rows in spellings.items():
+            languages = [language for _, _, language, _ in rows]
+            songs.append((song_id, *max(rows, key=lambda row: languages.count(row[2]))))
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO song_languages VALUES (?, ?, ?, ?, ?)", songs)
+            self.connection.execute("DROP TABLE languages")
+
+    def get_many(self, song_ids: Iterable[int]) -> Dict[int, Detection]:
+        song_ids = [int(song_id) for song_id in song_ids]
+        found = {}
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(song_ids), 500):
+            chunk = song_ids[start:start + 500]
+            query = (f"SELECT song_id, language, confidence FROM song_languages "
+                     f"WHERE song_id IN ({', '.join('?' * len(chunk))})")
+            found.update((song_id, Detection(language, confidence))
+                         for song_id, language, confidence in self.connection.execute(query, chunk))
+        return found
+
+    def put_many(self, songs: Iterable[Tuple[int, str, str, str, Optional[float]]]) -> None:
+        """Store (song_id, artist, title, language, confidence) tuples."""
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO song_languages VALUES (?, ?, ?, ?, ?)",
+                                        ((int(song_id), *song) for song_id, *song in songs))
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,117 @@
+import metrics
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from pycountry import languages
+from typing import List, NamedTuple, Optional
+
+PROCESSES = os.cpu_count() or 1
+CHUNK_SIZE = 64  # Texts classified by a worker at a time
+SEED = 0
+FASTTEXT_MODEL = "data/lid.176.ftz"
+# Label of the texts no language could be detected in, e.g. empty ones
+UNDETECTED = "LangDetectException"
+
+
+class Detection(NamedTuple):
+    language: str
+    # Probability of the language according to the model, between 0 and 1,
+    # unknown for songs labelled before confidences were recorded
+    confidence: Optional[float]
+
+
+def language_name(code: str) -> str:
+    # Some codes returned by the models, e.g. zh-cn, are not ISO 639 ones
+    language = languages.get(alpha_2=code) if len(code) == 2 else languages.get(alpha_3=code)
+    return language.name if language is not None else code
+
+
+class LangdetectClassifier:
+    """
+    Classifier of langdetect, a port of a Java library. Detection samples
+    n-grams at random, so it is seeded to give the same languages every run.
+    """
+
+    def __init__(self, seed: int = SEED) -> None:
+        from langdetect import DetectorFactory
+
+        DetectorFactory.seed = seed
+
+    def classify(self, texts: List[str]) -> List[Detection]:
+        from langdetect import detect_langs
+        from langdetect.lang_detect_exception import LangDetectException
+
+        detections = []
+        for text in texts:
+            try:
+                best = detect_langs(text)[0]
+            except LangDetectException:
+                detections.append(Detection(UNDETECTED, 0.0))
+                continue
+            detections.append(Detection(language_name(best.lang), best.prob))
+        return detections
+
+
+class FastTextClassifier:
+    """
+    Classifier of a local fastText language identification model, e.g.
+    lid.176.ftz, which is much faster than langdetect on long lyrics.
+    """
+
+    def __init__(self, path: str = FASTTEXT_MODEL) -> None:
+        import fasttext
+
+        self.model = fasttext.load_model(path)
+
+    def classify(self, texts: List[str]) -> List[Detection]:
+        # fastText predicts one text per line
+        labels, probabilities = self.model.predict([" ".join(text.split()) for text in texts], k=1)
+        return [Detection(language_name(label[0].replace("__label__", "")), min(float(probability[0]), 1.0))
+                if label else Detection(UNDETECTED, 0.0) for label, probability in zip(labels, probabilities)]
+
+
+def make_classifier(name: str, model: Optional[str] = None, seed: int = SEED):
+    if name == "fasttext":
+        return FastTextClassifier(model or FASTTEXT_MODEL)
+    return LangdetectClassifier(seed)
+
+
+# Classifier of a worker process, loaded once by `init_worker`
+_classifier = None
+
+
+def init_worker(name: str, model: Optional[str], seed: int) -> None:
+    global _classifier
+    _classifier = make_classifier(name, model, seed)
+
+
+def classify_chunk(texts: List[str]) -> List[Detection]:
+    return _classifier.classify(texts)
+
+
+def classify(texts: List[str], name: str = "langdetect", model: Optional[str] = None, seed: int = SEED,
+             processes: int = PROCESSES, chunk_size: int = CHUNK_SIZE) -> List[Detection]:
+    """
+    Language of every text. Distinct texts are classified once, in chunks
+    shared out between a pool of processes, each loading the classifier once.
+    """
+    distinct = list(dict.fromkeys(texts))
+    chunks = [distinct[start:start + chunk_size] for start in range(0, len(distinct), chunk_size)]
+
+    start = time.perf_counter()
+    with metrics.RUN.stage("detect") as stage:
+        if processes > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(min(processes, len(chunks)), initializer=init_worker,
+                                     initargs=(name, model, seed)) as executor:
+                results = list(executor.map(classify_chunk, chunks))
+        else:
+            classifier = make_classifier(name, model, seed)
+            results = [classifier.classify(chunk) for chunk in chunks]
+        stage.rows = len(distinct)
+    seconds = time.perf_counter() - start
+    if distinct:
+        print(f"Classified {len(distinct)} texts in {seconds:.1f}s, {len(distinct) / seconds:.1f} per second")
+
+    detections = dict(zip(distinct, (detection for result in results for detection in result)))
+    return [detections[text] for text in texts]
@@ -0,0 +1,157 @@
+import metrics
+import random
+import threading
+import time
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+WORKERS = 8
+RATE = 5.0  # Requests per second, across all workers
+BURST = 5
+RETRIES = 4
+BACKOFF = 1.0  # Seconds, doubled at every retry
+
+GENIUS_URL = "https://api.genius.com"
+
+
+class TransientError(Exception):
+    """A lookup failed for reasons worth retrying, e.g. a timeout."""
+
+
+class Lookup(NamedTuple):
+    lyrics: Optional[str]
+    # False when every attempt failed, as opposed to a song without lyrics
+    ok: bool
+
+
+class NoLyricsBackend:
+    """
+    Backend that never finds any lyrics, so that songs are labelled from their
+    title only. Handy to run the pipeline offline.
+    """
+
+    def search(self, artist: str, title: str) -> Optional[str]:
+        return None
+
+
+class GeniusBackend:
+    def __init__(self, token: str, timeout: float = 20) -> None:
+        from lyricsgenius import Genius
+
+        # Retries are handled by the lookup pool, with backoff and jitter
+        self.genius = Genius(token, timeout=timeout, retries=0, sleep_time=0, verbose=False)
+
+    def search(self, artist: str, title: str) -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            song = self.genius.search_song(title, artist)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as exc:
+            metrics.RUN.record_request(GENIUS_URL, time.perf_counter() - start, None, 0)
+            raise TransientError(str(exc))
+        lyrics = song.lyrics if song is not None else None
+        metrics.RUN.record_request(GENIUS_URL, time.perf_counter() - start, 200, len(lyrics or ""))
+        return lyrics
+
+
+class HTTPBackend:
+    """
+    Backend querying `{base_url}/lyrics?artist=...&title=...`, which answers
+    with the plain text lyrics or 404. Meant for a local fixture server.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 20) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def session(self) -> requests.Session:
+        # Sessions are not thread safe, give each worker its own
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def search(self, artist: str, title: str) -> Optional[str]:
+        url = f"{self.base_url}/lyrics"
+        start = time.perf_counter()
+        try:
+            response = self.session().get(url, params={"artist": artist, "title": title}, timeout=self.timeout)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as exc:
+            metrics.RUN.record_request(url, time.perf_counter() - start, None, 0)
+            raise TransientError(str(exc))
+        metrics.RUN.record_request(url, time.perf_counter() - start, response.status_code, len(response.content))
+        if response.status_code == 404:
+            return None
+        if response.status_code == 429 or response.status_code >= 500:
+            raise TransientError(f"{response.status_code} for {title} by {artist}")
+        response.raise_for_status()
+        return response.text
+
+
+def make_backend(name: str, token: Optional[str] = None, url: Optional[str] = None):
+    if name == "genius":
+        if token is None:
+            raise ValueError("The genius backend needs an access token")
+        return GeniusBackend(token)
+    if name == "http":
+        if url is None:
+            raise ValueError("The http backend needs a base url")
+        return HTTPBackend(url)
+    return NoLyricsBackend()
+
+
+class TokenBucket:
+    """Thread safe token bucket allowing `rate` calls per second, in bursts of at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class LyricsPool:
+    """
+    Look lyrics up concurrently on a bounded pool of threads, sharing a token
+    bucket so that the backend sees at most `rate` requests per second.
+    Transient failures are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, backend, workers: int = WORKERS, rate: float = RATE, burst: int = BURST,
+                 retries: int = RETRIES, backoff: float = BACKOFF) -> None:
+        self.backend = backend
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+
+    def lookup(self, artist: str, title: str) -> Lookup:
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                return Lookup(self.backend.search(artist, title), True)
+            except TransientError:
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        print(f"Giving up looking up lyrics of {title} by {artist}")
+        return Lookup(None, False)
+
+    def lookup_many(self, songs: List[Tuple[str, str]]) -> List[Lookup]:
+        """Look up (artist, title) pairs, returning the results in the same order."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda song: self.lookup(*song), songs))
@@ -0,0 +1,181 @@
+import argparse
+import collections
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")]
+
+
+class StageStats:
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.calls = 0
+        self.rows = 0
+
+
+class HostStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0  # Responses with a 4xx or 5xx status, and failed connections
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_counts = [0] * len(LATENCY_BUCKETS)
+        # Cache lookups: hit, revalidated (304) or miss
+        self.cache: Dict[str, int] = collections.Counter()
+
+
+class Metrics:
+    """
+    Measurements of a pipeline run: wall time and rows of each stage (fetch,
+    parse, materialize, write...), HTTP requests per host with their latency
+    histogram, bytes and cache outcomes, and peak memory. Stages may nest,
+    e.g. pages are parsed while others are still being fetched.
+    """
+
+    def __init__(self, script: Optional[str] = None) -> None:
+        self.run_id = uuid.uuid4().hex[:12]
+        self.script = script or os.path.basename(sys.argv[0])
+        self.started = time.time()
+        self.stages: Dict[str, StageStats] = collections.defaultdict(StageStats)
+        self.hosts: Dict[str, HostStats] = collections.defaultdict(HostStats)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        """Time a stage; rows it produced can be added to the yielded stats."""
+        start = time.perf_counter()
+        stats = StageStats()
+        try:
+            yield stats
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                total = self.stages[name]
+                total.seconds += seconds
+                total.calls += 1
+                total.rows += stats.rows
+
+    def record_request(self, url: str, seconds: float, status_code: Optional[int], size: int) -> None:
+        """Record a network request; status_code is None when the connection failed."""
+        with self.lock:
+            stats = self.hosts[urlsplit(url).netloc]
+            stats.requests += 1
+            stats.bytes += size
+            stats.latency_sum += seconds
+            stats.latency_counts[next(index for index, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound)] += 1
+            if status_code is None or status_code >= 400:
+                stats.errors += 1
+
+    def record_cache(self, url: str, outcome: str) -> None:
+        with self.lock:
+            self.hosts[urlsplit(url).netloc].cache[outcome] += 1
+
+    @staticmethod
+    def peak_rss_bytes() -> int:
+        # Kilobytes on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    def records(self) -> List[dict]:
+        """One record per stage, one per host and a summary of the run."""
+        common = {"run": self.run_id, "script": self.script}
+        records = []
+        for name, stats in self.stages.items():
+            records.append({**common, "kind": "stage", "stage": name, "seconds": round(stats.seconds, 6),
+                            "calls": stats.calls, "rows": stats.rows})
+
+        lookups = hits = 0
+        for host, stats in self.hosts.items():
+            buckets = dict(zip(map(str, LATENCY_BUCKETS), stats.latency_counts))
+            records.append({**common, "kind": "host", "host": host, "requests": stats.requests,
+                            "errors": stats.errors, "bytes": stats.bytes,
+                            "latency_seconds": round(stats.latency_sum, 6), "latency_buckets": buckets,
+                            "cache": dict(stats.cache)})
+            lookups += sum(stats.cache.values())
+            hits += stats.cache["hit"] + stats.cache["revalidated"]
+
+        records.append({**common, "kind": "run", "started": round(self.started, 3),
+                        "seconds": round(time.time() - self.started, 3), "peak_rss_bytes": self.peak_rss_bytes(),
+                        "cache_hit_ratio": round(hits / lookups, 4) if lookups else None})
+        return records
+
+    def write_jsonl(self, path: str) -> None:
+        """Append the records of this run to a JSON lines file."""
+        with open(path, "a") as fh:
+            for record in self.records():
+                fh.write(json.dumps(record) + "\n")
+
+    def prometheus(self) -> str:
+        """Metrics of this run in the Prometheus text format, e.g. for the node exporter textfile collector."""
+        script = f'script="{self.script}"'
+        lines = []
+
+        def metric(name: str, kind: str, samples: List[str]) -> None:
+            lines.append(f"# TYPE charts_{name} {kind}")
+            lines.extend(f"charts_{sample}" for sample in samples)
+
+        metric("stage_seconds", "gauge",
+               [f'stage_seconds{{{script},stage="{name}"}} {stats.seconds:.6f}' for name, stats in self.stages.items()])
+        metric("stage_rows", "gauge",
+               [f'stage_rows{{{script},stage="{name}"}} {stats.rows}' for name, stats in self.stages.items()])
+
+        requests, errors, size, buckets, cache = [], [], [], [], []
+        for host, stats in self.hosts.items():
+            labels = f'{script},host="{host}"'
+            requests.append(f"http_requests{{{labels}}} {stats.requests}")
+            errors.append(f"http_errors{{{labels}}} {stats.errors}")
+            size.append(f"http_bytes{{{labels}}} {stats.bytes}")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.latency_counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else bound
+                buckets.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            buckets.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.latency_sum:.6f}")
+            buckets.append(f"http_request_duration_seconds_count{{{labels}}} {stats.requests}")
+            cache.extend(f'http_cache_lookups{{{labels},outcome="{outcome}"}} {count}'
+                         for outcome, count in stats.cache.items())
+        metric("http_requests", "gauge", requests)
+        metric("http_errors", "gauge", errors)
+        metric("http_bytes", "gauge", size)
+        metric("http_request_duration_seconds", "histogram", buckets)
+        metric("http_cache_lookups", "gauge", cache)
+
+        metric("run_seconds", "gauge", [f"run_seconds{{{script}}} {time.time() - self.started:.3f}"])
+        metric("run_peak_rss_bytes", "gauge", [f"run_peak_rss_bytes{{{script}}} {self.peak_rss_bytes()}"])
+        metric("run_last_success_timestamp_seconds", "gauge",
+               [f"run_last_success_timestamp_seconds{{{script}}} {time.time():.0f}"])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        # Written to a copy first, so that a collector never reads a partial file
+        tmppath = f"{path}.tmp"
+        with open(tmppath, "w") as fh:
+            fh.write(self.prometheus())
+        os.replace(tmppath, path)
+
+
+# Measurements of the current run, recorded by the shared modules
+RUN = Metrics()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--metrics", help="Append measurements of the run to this JSON lines file")
+    parser.add_argument("--prometheus", help="Write measurements of the run to this Prometheus text file")
+
+
+def report(args: argparse.Namespace) -> None:
+    """Write the measurements of the run where asked by the arguments added by add_arguments."""
+    if args.metrics:
+        RUN.write_jsonl(args.metrics)
+    if args.prometheus:
+        RUN.write_prometheus(args.prometheus)
@@ -0,0 +1,126 @@
+"""
+Fuzzy record linkage between two datasets of songs.
+
+Rows are only compared within blocks sharing the same values of the
+blocking columns, e.g. (year, country), so the number of candidate pairs
+grows linearly with the datasets rather than with their product. Every
+candidate pair is scored by the weighted similarity of its normalized
+fields, and pairs are then resolved one-to-one, best scores first. A block
+holding a single row on each side is matched on its artist alone, its title
+being often translated by one of the datasets, e.g. "Yom Huledeth" and
+"Happy Birthday".
+"""
+import metrics
+import numpy
+import pandas
+
+from song_identity import normalize, normalize_artist, normalize_title
+from typing import Callable, Dict, NamedTuple, Sequence
+
+# Normalization of the fields compared, others being normalized by `normalize`
+NORMALIZERS: Dict[str, Callable[[str], str]] = {"artist": normalize_artist, "title": normalize_title}
+# Songs are told apart by their title first, artists being spelled in many ways
+WEIGHTS = {"title": 0.6, "artist": 0.4}
+THRESHOLD = 0.5  # Lowest score of a match
+LONE_THRESHOLD = 0.5  # Lowest artist similarity of the only pair of a block
+
+
+class Linkage(NamedTuple):
+    # Index labels of the matched rows, with their score and the similarity of every field
+    matches: pandas.DataFrame
+    unmatched_left: pandas.Index
+    unmatched_right: pandas.Index
+
+
+def trigrams(text: str) -> set:
+    # Padding gives the start of words more weight, and strings shorter than 3 characters some trigrams
+    padded = f"  {text} "
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+def similarity(left: pandas.Series, right: pandas.Series, field: str) -> numpy.ndarray:
+    """
+    Dice coefficient of the character trigrams of the normalized values of
+    every pair of rows, the values of a pair being left[i] and right[i].
+    Every distinct spelling is normalized and split into trigrams only once.
+    """
+    if not len(left):
+        return numpy.zeros(0)
+    normalizer = NORMALIZERS.get(field, normalize)
+    codes, spellings = pandas.factorize(pandas.concat([left, right], ignore_index=True), use_na_sentinel=False)
+    strings, string_codes = numpy.unique([normalizer(str(spelling)) for spelling in spellings], return_inverse=True)
+    codes = string_codes[codes]
+    left_codes, right_codes = codes[:len(left)], codes[len(left):]
+
+    # Trigrams of every string, as sorted keys combining the string and the trigram
+    grams = [trigrams(string) for string in strings]
+    gram_codes, gram_spellings = pandas.factorize(numpy.array([gram for string in grams for gram in string],
+                                                              dtype=object))
+    owners = numpy.repeat(numpy.arange(len(strings)), [len(string) for string in grams])
+    sizes = numpy.bincount(owners, minlength=len(strings))
+    keys = numpy.sort(owners * len(gram_spellings) + gram_codes)
+
+    # Count the trigrams of the left value of every pair found among those of the right one
+    starts = numpy.concatenate([[0], numpy.cumsum(sizes)])
+    pair_sizes = sizes[left_codes]
+    pairs = numpy.repeat(numpy.arange(len(left_codes)), pair_sizes)
+    offsets = numpy.arange(len(pairs)) - numpy.repeat(numpy.cumsum(pair_sizes) - pair_sizes, pair_sizes)
+    lookups = right_codes[pairs] * len(gram_spellings) + gram_codes[starts[left_codes][pairs] + offsets]
+    positions = numpy.minimum(numpy.searchsorted(keys, lookups), len(keys) - 1)
+    common = numpy.bincount(pairs, weights=keys[positions] == lookups, minlength=len(left_codes))
+    return 2 * common / (sizes[left_codes] + sizes[right_codes])
+
+
+def candidate_pairs(left: pandas.DataFrame, right: pandas.DataFrame, blocks: Sequence[str]) -> pandas.DataFrame:
+    """Pairs of positions of rows sharing the values of every blocking column."""
+    return pandas.merge(left[list(blocks)].reset_index(drop=True).rename_axis("left").reset_index(),
+                        right[list(blocks)].reset_index(drop=True).rename_axis("right").reset_index(),
+                        on=list(blocks))[["left", "right"]]
+
+
+def resolve(pairs: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Keep pairs so that every row is matched at most once. Pairs that are the
+    best of both their rows are matched first, and the rows they match
+    removed from the other pairs, until none remain.
+    """
+    matched = []
+    while len(pairs):
+        best = (pairs.score == pairs.groupby("left").score.transform("max")) & \
+               (pairs.score == pairs.groupby("right").score.transform("max"))
+        # Ties are broken by the order of the rows
+        matches = pairs[best].drop_duplicates("left").drop_duplicates("right")
+        matched.append(matches)
+        pairs = pairs[~pairs.left.isin(matches.left) & ~pairs.right.isin(matches.right)]
+    return pandas.concat(matched) if matched else pairs
+
+
+def link(left: pandas.DataFrame, right: pandas.DataFrame, blocks: Sequence[str],
+         weights: Dict[str, float] = WEIGHTS, threshold: float = THRESHOLD,
+         lone_threshold: float = LONE_THRESHOLD) -> Linkage:
+    """
+    Match rows of two datasets sharing the values of the blocking columns,
+    on the weighted similarity of the given fields, between 0 and 1, or on
+    the similarity of their artists when they are the only rows of their block.
+    """
+    with metrics.RUN.stage("link") as stage:
+        pairs = candidate_pairs(left, right, blocks)
+        pairs["score"] = 0.0
+        for field, weight in weights.items():
+            pairs[field] = similarity(left[field].iloc[pairs.left].reset_index(drop=True),
+                                      right[field].iloc[pairs.right].reset_index(drop=True), field)
+            pairs["score"] += weight * pairs[field] / sum(weights.values())
+
+        accepted = pairs.score >= threshold
+        if "artist" in weights:
+            lone = (pairs.groupby("left").right.transform("size") == 1) & \
+                   (pairs.groupby("right").left.transform("size") == 1)
+            accepted |= lone & (pairs.artist >= lone_threshold)
+        matches = resolve(pairs[accepted]).sort_values("left")
+        matches["left"] = left.index[matches.left]
+        matches["right"] = right.index[matches.right]
+        stage.rows += len(matches)
+
+    return Linkage(matches.reset_index(drop=True),
+                   left.index.difference(matches.left, sort=False),
+                   right.index.difference(matches.right, sort=False))
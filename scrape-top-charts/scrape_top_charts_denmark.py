@@ -1,10 +1,15 @@
 import bs4
-import pandas
-import requests
+import extraction
+import http_cache
+import ingest
 
-from typing import NamedTuple
+from typing import Dict, NamedTuple, Optional
 
 BASE_URL = "http://hitlisten.nu/default.asp?w={}&y={}&list=t40"
+DATASET = "data/charts/charts_radio_denmark_2017_2021.csv"
+
+# Charts of past years never change, only the current year is still being updated
+CACHE_TTL_RULES = [(f"&y={http_cache.CURRENT_YEAR}&", http_cache.ONE_DAY)]
 
 
 class SongInfo(NamedTuple):
@@ -20,30 +25,35 @@ def get_song_info(elements: bs4.element.Tag) -> SongInfo:
     return SongInfo(position, artist, title)
 
 
-def extract_weekly_chart(year: int, week: int) -> pandas.DataFrame:
-    week_url = BASE_URL.format(f"{week:02}", year)
-    page = requests.get(week_url)
+def song_info_from_fields(fields: Dict[str, Optional[str]]) -> SongInfo:
+    return SongInfo(int(fields["position"]), fields["artist"].strip(), fields["title"].strip())
+
 
-    weekly_chart = bs4.BeautifulSoup(page.content, "html.parser").find_all(id="linien")
+SPEC = extraction.ExtractionSpec(
+    find_rows=lambda soup: soup.find_all(id="linien"),
+    get_song_info=get_song_info,
+    rows_xpath="//*[@id='linien']",
+    fields_xpath={
+        "position": "(.//*[@id='denneugeny' or @id='denneuge' or @id='denneugere'])[1]/node()[1]",
+        "artist": "(.//*[@id='artistnavn'])[1]/node()[1]",
+        "title": "(.//*[@id='titel'])[1]/node()[1]",
+    },
+    song_info_from_fields=song_info_from_fields,
+)
 
-    info = [get_song_info(elements) for elements in weekly_chart]
 
-    df = pandas.DataFrame(info)
-    df["year"] = year
-    df["week"] = week
-    return df
+def get_week_url(year: int, week: int) -> str:
+    return BASE_URL.format(f"{week:02}", year)
 
 
-def create_dataset() -> pandas.DataFrame:
-    dfs = []
-    for year in range(2017, 2022):
-        for week in range(1, 53):
-            print(f"{year}-{week}")
-            dfs.append(extract_weekly_chart(year, week))
-    return pandas.concat(dfs)
+SOURCE = ingest.Source(
+    name="denmark",
+    dataset=DATASET,
+    spec=SPEC,
+    url=get_week_url,
+    cache_ttl_rules=CACHE_TTL_RULES,
+)
 
 
 if __name__ == "__main__":
-    df = create_dataset()
-    df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/charts/charts_radio_denmark_2017_2021.csv", index=False)
+    ingest.main([SOURCE])
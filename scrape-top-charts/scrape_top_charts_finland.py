@@ -1,10 +1,15 @@
 import bs4
-import pandas
-import requests
+import extraction
+import http_cache
+import ingest
 
-from typing import NamedTuple
+from typing import Dict, NamedTuple, Optional
 
 BASE_URL = "https://www.ifpi.fi/lista/singlet"
+DATASET = "data/charts/charts_radio_finland_2017_2021.csv"
+
+# Charts of past years never change, only the current year is still being updated
+CACHE_TTL_RULES = [(f"/{http_cache.CURRENT_YEAR}/", http_cache.ONE_DAY)]
 
 
 class SongInfo(NamedTuple):
@@ -20,30 +25,35 @@ def get_song_info(elements: bs4.element.Tag) -> SongInfo:
     return SongInfo(position, artist, title)
 
 
-def extract_weekly_chart(year: int, week: int) -> pandas.DataFrame:
-    week_url = f"{BASE_URL}/{year}/{week:02}"
-    page = requests.get(week_url)
+def song_info_from_fields(fields: Dict[str, Optional[str]]) -> SongInfo:
+    return SongInfo(int(fields["position"].rstrip(".")), fields["artist"], fields["title"])
+
 
-    weekly_chart = bs4.BeautifulSoup(page.content, "html.parser").find_all(class_="chart-row")
+SPEC = extraction.ExtractionSpec(
+    find_rows=lambda soup: soup.find_all(class_="chart-row"),
+    get_song_info=get_song_info,
+    rows_xpath=f"//*[{extraction.HAS_CLASS.format('chart-row')}]",
+    fields_xpath={
+        "position": f"(.//*[{extraction.HAS_CLASS.format('chart-position')}])[1]/node()[1]",
+        "artist": f"(.//*[{extraction.HAS_CLASS.format('chart-artist')}])[1]/node()[1]",
+        "title": f"(.//*[{extraction.HAS_CLASS.format('chart-title')}])[1]/node()[1]",
+    },
+    song_info_from_fields=song_info_from_fields,
+)
 
-    info = [get_song_info(elements) for elements in weekly_chart]
 
-    df = pandas.DataFrame(info)
-    df["year"] = year
-    df["week"] = week
-    return df
+def get_week_url(year: int, week: int) -> str:
+    return f"{BASE_URL}/{year}/{week:02}"
 
 
-def create_dataset() -> pandas.DataFrame:
-    dfs = []
-    for year in range(2017, 2022):
-        for week in range(1, 53):
-            print(f"{year}-{week}")
-            dfs.append(extract_weekly_chart(year, week))
-    return pandas.concat(dfs)
+SOURCE = ingest.Source(
+    name="finland",
+    dataset=DATASET,
+    spec=SPEC,
+    url=get_week_url,
+    cache_ttl_rules=CACHE_TTL_RULES,
+)
 
 
 if __name__ == "__main__":
-    df = create_dataset()
-    df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/charts/charts_radio_finland_2017_2021.csv", index=False)
+    ingest.main([SOURCE])
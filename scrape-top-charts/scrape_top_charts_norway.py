@@ -1,10 +1,15 @@
 import bs4
-import pandas
-import requests
+import extraction
+import http_cache
+import ingest
 
-from typing import NamedTuple
+from typing import Dict, NamedTuple, Optional
 
 BASE_URL = "https://topplista.no/charts/singles/"
+DATASET = "data/charts/charts_radio_norway_2017_2021.csv"
+
+# Charts of past years never change, only the current year is still being updated
+CACHE_TTL_RULES = [(f"/{http_cache.CURRENT_YEAR}-w", http_cache.ONE_DAY)]
 
 
 class SongInfo(NamedTuple):
@@ -20,27 +25,35 @@ def get_song_info(elements: bs4.element.ResultSet) -> SongInfo:
     return SongInfo(position, artist, title)
 
 
-def extract_weekly_chart(year: int, week: int) -> pandas.DataFrame:
-    week_url = f"{BASE_URL}{year}-w{week:02}"
-    page = requests.get(week_url)
-    weekly_chart = bs4.BeautifulSoup(page.content, "html.parser").table.tbody
-    rows = weekly_chart.find_all("tr")
-    info = [get_song_info(row.find_all("td")) for row in rows]
-    df = pandas.DataFrame(info)
-    df["year"] = year
-    df["week"] = week
-    return df
+def song_info_from_fields(fields: Dict[str, Optional[str]]) -> SongInfo:
+    return SongInfo(int(fields["position"]), fields["artist"], fields["title"])
+
+
+SPEC = extraction.ExtractionSpec(
+    find_rows=lambda soup: [row.find_all("td") for row in soup.table.tbody.find_all("tr")],
+    get_song_info=get_song_info,
+    rows_xpath="((//table)[1]//tbody)[1]//tr",
+    fields_xpath={
+        "position": "(.//td)[1]/node()[last()]",
+        "artist": "(((.//td)[5]//span)[1]//a)[1]/node()[1]",
+        "title": "(.//td)[5]/node()[1]",
+    },
+    song_info_from_fields=song_info_from_fields,
+)
+
+
+def get_week_url(year: int, week: int) -> str:
+    return f"{BASE_URL}{year}-w{week:02}"
 
 
-def create_dataset() -> pandas.DataFrame:
-    dfs = []
-    for year in range(2017, 2022):
-        for week in range(1, 53):
-            dfs.append(extract_weekly_chart(year, week))
-    return pandas.concat(dfs)
+SOURCE = ingest.Source(
+    name="norway",
+    dataset=DATASET,
+    spec=SPEC,
+    url=get_week_url,
+    cache_ttl_rules=CACHE_TTL_RULES,
+)
 
 
 if __name__ == "__main__":
-    df = create_dataset()
-    df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/charts/charts_radio_norway_2017_2021.csv", index=False)
+    ingest.main([SOURCE])
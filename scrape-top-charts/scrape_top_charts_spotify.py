@@ -1,19 +1,26 @@
 import bs4
 import datetime
-import pandas
-import requests
+import extraction
+import http_cache
+import incremental
+import ingest
 
-from pycountry import countries
-from typing import NamedTuple
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 BASE_URL = "https://spotifycharts.com/regional/{country}/weekly/{daterange}"
+DATASET = "data/charts/charts_spotify_allcountries_2017_2021.csv"
 
+# Charts of past years never change, only the current year is still being updated
+CACHE_TTL_RULES = [(f"/{http_cache.CURRENT_YEAR}-|--{http_cache.CURRENT_YEAR}-", http_cache.ONE_DAY)]
+
+# Lowercase ISO 3166-1 alpha-2 codes used in chart urls
 COUNTRIES = {
-    countries.get(name="Denmark").alpha_2.lower(): "Denmark",
-    countries.get(name="Finland").alpha_2.lower(): "Finland",
-    countries.get(name="Iceland").alpha_2.lower(): "Iceland",
-    countries.get(name="Norway").alpha_2.lower(): "Norway",
-    countries.get(name="Sweden").alpha_2.lower(): "Sweden",
+    "dk": "Denmark",
+    "fi": "Finland",
+    "is": "Iceland",
+    "no": "Norway",
+    "se": "Sweden",
 }
 
 # Headers dict to use when requesting pages from spotifycharts.com
@@ -29,61 +36,106 @@ class SongInfo(NamedTuple):
     streams: int
 
 
+class ChartEntry(NamedTuple):
+    # Columns of the dataset, in alphabetical order
+    artist: str
+    country: str
+    daterange: str
+    position: int
+    streams: int
+    title: str
+    year: int
+
+
 def get_song_info(row: bs4.element.Tag) -> SongInfo:
     position = int(row.find(class_="chart-table-position").contents[0])
-    artist_contents = row.find(class_="chart-table-track").span.contents
+    track = row.find(class_="chart-table-track")
+    artist_contents = track.span.contents
     artist = artist_contents[0].lstrip("by ") if artist_contents else None
-    title_contents = row.find(class_="chart-table-track").strong.contents
+    title_contents = track.strong.contents
     title = title_contents[0] if title_contents else None
     streams = int(row.find(class_="chart-table-streams").contents[0].replace(",", ""))
     return SongInfo(position, artist, title, streams)
 
 
-def generate_url_tokens() -> str:
+def song_info_from_fields(fields: Dict[str, Optional[str]]) -> SongInfo:
+    artist = fields["artist"].lstrip("by ") if fields["artist"] is not None else None
+    streams = int(fields["streams"].replace(",", ""))
+    return SongInfo(int(fields["position"]), artist, fields["title"], streams)
+
+
+SPEC = extraction.ExtractionSpec(
+    find_rows=lambda soup: soup.table.tbody.find_all("tr"),
+    get_song_info=get_song_info,
+    rows_xpath="((//table)[1]//tbody)[1]//tr",
+    fields_xpath={
+        "position": f"(.//*[{extraction.HAS_CLASS.format('chart-table-position')}])[1]/node()[1]",
+        "artist": f"((.//*[{extraction.HAS_CLASS.format('chart-table-track')}])[1]//span)[1]/node()[1]",
+        "title": f"((.//*[{extraction.HAS_CLASS.format('chart-table-track')}])[1]//strong)[1]/node()[1]",
+        "streams": f"(.//*[{extraction.HAS_CLASS.format('chart-table-streams')}])[1]/node()[1]",
+    },
+    song_info_from_fields=song_info_from_fields,
+)
+
+
+def generate_url_tokens(start_year: int = incremental.FIRST_YEAR, end_year: Optional[int] = None) -> List[str]:
     tokens = []
-    startdate = datetime.date(2016, 12, 30)
-    enddate = datetime.date(2021, 12, 31)
+    # The year of a weekly chart is the one of its first friday
+    startdate = datetime.date(start_year, 1, 1)
+    startdate += datetime.timedelta((4 - startdate.weekday()) % 7)
+    enddate = datetime.date(end_year or datetime.date.today().year, 12, 31)
+    # Skip the current week, whose chart is not complete yet
+    latest = datetime.date.today() - datetime.timedelta(7)
     # The daterange in the Spotify website contains two consecutive fridays,
-    # e.g. 2021-12-31--2022-01-07
-    while startdate < enddate:
+    # e.g. 2021-12-31--2022-01-07, which belongs to 2021
+    while startdate <= enddate and startdate < latest:
         nextdate = startdate + datetime.timedelta(7)
         tokens.append(f'{startdate.strftime("%Y-%m-%d")}--{nextdate.strftime("%Y-%m-%d")}')
         startdate = nextdate
     return tokens
 
 
-def extract_weekly_chart(country_code: str, daterange: str) -> pandas.DataFrame:
-    week_url = BASE_URL.format(country=country_code, daterange=daterange)
-    page = requests.get(week_url, headers=HEADERS)
+def get_week_url(country_code: str, daterange: str) -> str:
+    return BASE_URL.format(country=country_code, daterange=daterange)
 
-    rows = bs4.BeautifulSoup(page.content, "html.parser").table.tbody.find_all("tr")
-    info = [get_song_info(row) for row in rows]
 
-    year = datetime.datetime.strptime(daterange.split("--")[0], "%Y-%m-%d").year
+def chart_keys(start_year: int = incremental.FIRST_YEAR, end_year: Optional[int] = None) -> List[Tuple[str, str]]:
+    return [(country_code, daterange)
+            for country_code in COUNTRIES.keys()
+            for daterange in generate_url_tokens(start_year, end_year)]
 
-    df = pandas.DataFrame(info)
-    df["daterange"] = daterange
-    df["year"] = year
-    df["country"] = COUNTRIES[country_code]
-    return df
 
+@lru_cache(maxsize=None)
+def daterange_year(daterange: str) -> int:
+    return datetime.datetime.strptime(daterange.split("--")[0], "%Y-%m-%d").year
 
-def create_dataset() -> pandas.DataFrame:
-    dfs = []
-    for country_code in COUNTRIES.keys():
-        for daterange in generate_url_tokens():
-            print(f"{country_code}: {daterange}")
-            dfs.append(extract_weekly_chart(country_code, daterange))
-    return pandas.concat(dfs)
 
+def to_entry(song: SongInfo, country_code: str, daterange: str) -> ChartEntry:
+    return ChartEntry(song.artist, COUNTRIES[country_code], daterange, song.position, song.streams, song.title,
+                      daterange_year(daterange))
 
-if __name__ == "__main__":
-    df = create_dataset()
+
+def has_song(entry: ChartEntry) -> bool:
     # Some songs are on the Spotify top charts, but have been removed from
     # Spotify. Their name and/or title will be null.
-    df = df.dropna()
-    # There is a trailing last week of 2016 due to how Spotify handles the string
-    # of the week in the website URL
-    df = df[df.year > 2016]
-    df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/charts/charts_spotify_allcountries_2017_2021.csv", index=False)
+    return entry.artist is not None and entry.title is not None
+
+
+SOURCE = ingest.Source(
+    name="spotify",
+    dataset=DATASET,
+    spec=SPEC,
+    url=get_week_url,
+    entry=ChartEntry,
+    to_entry=to_entry,
+    chart_keys=chart_keys,
+    key_columns=("country", "daterange"),
+    dataset_key=lambda key: (COUNTRIES[key[0]], key[1]),
+    keep=has_song,
+    headers=HEADERS,
+    cache_ttl_rules=CACHE_TTL_RULES,
+)
+
+
+if __name__ == "__main__":
+    ingest.main([SOURCE])
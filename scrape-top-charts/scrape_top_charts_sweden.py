@@ -1,11 +1,16 @@
 import bs4
 import datetime
-import pandas
-import requests
+import extraction
+import http_cache
+import ingest
 
-from typing import NamedTuple
+from typing import Dict, NamedTuple, Optional
 
 BASE_URL = "https://sverigesradio.se/topplista.aspx?programid=2023&date="
+DATASET = "data/charts/charts_radio_sweden_2017_2021.csv"
+
+# Charts of past years never change, only the current year is still being updated
+CACHE_TTL_RULES = [(f"date={http_cache.CURRENT_YEAR}-", http_cache.ONE_DAY)]
 
 
 class SongInfo(NamedTuple):
@@ -28,30 +33,40 @@ def get_song_info(elements: bs4.element.Tag) -> SongInfo:
     return SongInfo(position, artist, title)
 
 
-def extract_weekly_chart(year: int, week: int) -> pandas.DataFrame:
-    urltoken = convert_weeknumber_to_datetime_str(year, week)
-    week_url = f"{BASE_URL}{urltoken}"
-    page = requests.get(week_url)
+def song_info_from_fields(fields: Dict[str, Optional[str]]) -> SongInfo:
+    artist, title = map(str.strip, fields["artist_title"].split(" - "))
+    return SongInfo(fields["position"].strip(), artist, title)
+
+
+SPEC = extraction.ExtractionSpec(
     # Get elements of tag list at odd positions since the website puts a `\n` between them
-    weekly_chart = bs4.BeautifulSoup(page.content, "html.parser").ul.li.ul.contents[1::2]
-    info = [get_song_info(elements) for elements in weekly_chart]
+    find_rows=lambda soup: soup.ul.li.ul.contents[1::2],
+    get_song_info=get_song_info,
+    rows_xpath="((((//ul)[1]//li)[1])//ul)[1]/*",
+    fields_xpath={
+        "position": f"(.//*[{extraction.HAS_CLASS.format('track__ranking-current')}])[1]/node()[1]",
+        "artist_title": [
+            f"(.//*[{extraction.HAS_CLASS.format('track-title')}])[1]/node()[1]",
+            f"(.//*[{extraction.HAS_CLASS.format('track__title')}])[1]/node()[1]",
+        ],
+    },
+    song_info_from_fields=song_info_from_fields,
+)
+
 
-    df = pandas.DataFrame(info)
-    df["year"] = year
-    df["week"] = week
-    return df
+def get_week_url(year: int, week: int) -> str:
+    urltoken = convert_weeknumber_to_datetime_str(year, week)
+    return f"{BASE_URL}{urltoken}"
 
 
-def create_dataset() -> pandas.DataFrame:
-    dfs = []
-    for year in range(2017, 2022):
-        for week in range(1, 53):
-            print(f"{year}-{week}")
-            dfs.append(extract_weekly_chart(year, week))
-    return pandas.concat(dfs)
+SOURCE = ingest.Source(
+    name="sweden",
+    dataset=DATASET,
+    spec=SPEC,
+    url=get_week_url,
+    cache_ttl_rules=CACHE_TTL_RULES,
+)
 
 
 if __name__ == "__main__":
-    df = create_dataset()
-    df = df.reindex(sorted(df.columns), axis=1)  # Order columns alphabetically
-    df.to_csv("data/charts/charts_radio_sweden_2017_2021.csv", index=False)
+    ingest.main([SOURCE])
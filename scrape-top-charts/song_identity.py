@@ -0,0 +1,84 @@
+import hashlib
+import numpy
+import pandas
+import re
+import unicodedata
+
+from typing import Dict
+
+# Clauses naming featured artists, e.g. "Ed Sheeran feat. Khalid" or "Solo (feat. Demi Lovato)"
+FEATURING = r"(?:feat\.?|featuring|ft\.|with)"
+ARTIST_FEATURING = re.compile(rf"\s+(?:feat\.?|featuring|ft\.)\s.*$")
+# Separators between the lead artist and the others, e.g. "Kygo & Selena Gomez" or "Artigeardit x Kesi"
+ARTIST_SEPARATOR = re.compile(r"\s*(?:,|&|\+|\sx\s|\s/\s)\s*")
+# Bracketed clauses and dash suffixes not telling songs apart, e.g. "(Remix)" or "- Radio Edit"
+VERSION = r"(?:remix|mix|edit|version|remaster(?:ed)?|bonus track)"
+TITLE_CLAUSE = re.compile(rf"\s*[(\[][^)\]]*(?:\b{FEATURING}\s|\b{VERSION}\b)[^)\]]*[)\]]")
+TITLE_SUFFIX = re.compile(rf"\s+-\s+.*\b{VERSION}\b.*$")
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize(text: str) -> str:
+    """Fold case, strip diacritics and collapse whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+def normalize_artist(artist: str) -> str:
+    """Lead artist of a song, e.g. "clean bandit" for "CLEAN BANDIT FEAT SEAN PAUL & ANNE-MARIE"."""
+    artist = normalize(artist).rstrip(".")  # Some charts truncate long names with ".."
+    artist = ARTIST_FEATURING.sub("", artist)
+    lead = ARTIST_SEPARATOR.split(artist, maxsplit=1)[0]
+    return " ".join(PUNCTUATION.sub(" ", lead).split())
+
+
+def normalize_title(title: str) -> str:
+    """Title of a song without featured artists or version, e.g. "despacito" for "Despacito (Remix) [Feat. Justin Bieber]"."""
+    title = normalize(title)
+    title = TITLE_CLAUSE.sub("", title)
+    title = TITLE_SUFFIX.sub("", title)
+    return " ".join(PUNCTUATION.sub(" ", title).split())
+
+
+def song_key(artist: str, title: str) -> str:
+    return f"{normalize_artist(artist)}\x1f{normalize_title(title)}"
+
+
+def key_id(key: str) -> int:
+    """Stable signed 64 bits identifier of a key, the same in every run and every dataset."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+class SongIndex:
+    """
+    Hash index of song identities. Every distinct (artist, title) spelling is
+    normalized once, and mapped to the integer identifier of its normalized
+    key, so that datasets can be grouped and joined on compact integer keys.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        # Normalized key of every identifier, to tell which songs were merged
+        self.keys: Dict[int, str] = {}
+
+    def song_id(self, artist: str, title: str) -> int:
+        key = song_key(artist, title)
+        if key not in self.ids:
+            self.ids[key] = key_id(key)
+            self.keys[self.ids[key]] = key
+        return self.ids[key]
+
+    def song_ids(self, artists: pandas.Series, titles: pandas.Series) -> pandas.Series:
+        """Identifiers of the songs of a dataset, normalizing each distinct spelling only once."""
+        artist_codes, artist_spellings = pandas.factorize(artists, use_na_sentinel=False)
+        title_codes, title_spellings = pandas.factorize(titles, use_na_sentinel=False)
+        codes, pairs = pandas.factorize(artist_codes * len(title_spellings) + title_codes)
+        ids = numpy.array([self.song_id(str(artist_spellings[pair // len(title_spellings)]),
+                                        str(title_spellings[pair % len(title_spellings)])) for pair in pairs],
+                          dtype="int64")
+        return pandas.Series(ids[codes], index=artists.index, name="song_id")
+
+
+# Identifiers are derived from keys only, so a single index can be shared by every pipeline
+INDEX = SongIndex()
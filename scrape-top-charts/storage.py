@@ -0,0 +1,279 @@
+import csv
+import glob
+import importlib.util
+import metrics
+import os
+import shutil
+
+import numpy
+import pandas
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# Explicit types of every column found in the chart and Eurovision datasets.
+# Strings repeating across rows are stored as categoricals, counters as the
+# smallest integers that fit them. Nullable integers are used where rows may
+# lack a value, e.g. songs that did not reach the Eurovision final.
+COLUMN_TYPES = {
+    "artist": "category",
+    "country": "category",
+    "daterange": "category",
+    "language": "category",
+    "title": "category",
+    "position": "uint8",
+    "week": "uint8",
+    "weekcount": "uint16",  # Daily charts have up to 366 entries a year
+    "year": "uint16",
+    "streams": "int64",
+    "song_id": "int64",
+    "place_final": "UInt8",
+    "points_final": "UInt16",
+    "confidence": "float32",
+    # Run index of the charts, where weeks are numbered consecutively
+    "platform": "category",
+    "debut_week": "int32",
+    "last_week": "int32",
+    "peak_week": "int32",
+    "peak": "uint8",
+    "peak_weeks": "uint16",
+    "weeks": "uint16",
+    "runs": "uint16",
+    "reentries": "uint16",
+    "longest_streak": "uint16",
+    "first_streak": "uint16",
+    "last_streak": "uint16",
+    # Similarity of pairs of charts of the same period
+    "period": "category",
+    "platform_a": "category",
+    "platform_b": "category",
+    "country_a": "category",
+    "country_b": "category",
+    "common": "uint16",
+}
+
+HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+CHUNKSIZE = 1_000_000  # Rows per chunk when streaming a dataset
+BATCH_SIZE = 100_000  # Rows per Parquet row group when streaming records into a dataset
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+DATASETS = [
+    os.path.join(BASEDIR, "data", "charts", "*.csv"),
+    os.path.join(BASEDIR, "data", "top10", "*.csv"),
+    os.path.join(BASEDIR, "data", "labelled-automated", "*.csv"),
+    os.path.join(BASEDIR, "data", "labelled-manual", "*.csv"),
+    os.path.join(BASEDIR, "data", "analytics", "*.csv"),
+    os.path.join(BASEDIR, os.pardir, "scrape-eurovision", "data", "eurovision_songs_*.csv"),
+]
+
+
+def parquet_path(csv_path: str) -> str:
+    return f"{os.path.splitext(csv_path)[0]}.parquet"
+
+
+def apply_schema(df: pandas.DataFrame) -> pandas.DataFrame:
+    types: Dict[str, str] = {column: COLUMN_TYPES[column] for column in df.columns if column in COLUMN_TYPES}
+    if "place_final" in types:
+        # Places may have been saved as floats like 2.0 when the column had nulls
+        df["place_final"] = pandas.to_numeric(df["place_final"])
+    for column, dtype in types.items():
+        check_range(df[column], dtype)
+    return df.astype(types)
+
+
+def check_range(values: pandas.Series, dtype: str) -> None:
+    """Fail on values a cast to a numpy integer type would silently wrap around, e.g. 300 to 44 in uint8."""
+    target = pandas.api.types.pandas_dtype(dtype)
+    if not isinstance(target, numpy.dtype) or target.kind not in "iu":
+        return
+    if not pandas.api.types.is_numeric_dtype(values) or values.empty:
+        return
+    bounds = numpy.iinfo(target)
+    if values.min() < bounds.min or values.max() > bounds.max:
+        raise ValueError(f"Column {values.name} has values out of the range of {dtype}, "
+                         f"from {values.min()} to {values.max()}")
+
+
+def write_parquet(df: pandas.DataFrame, csv_path: str) -> None:
+    if HAS_PARQUET:
+        apply_schema(df.copy()).to_parquet(parquet_path(csv_path), index=False)
+
+
+def write_dataset(df: pandas.DataFrame, csv_path: str) -> None:
+    """Save a dataset as CSV, together with a typed Parquet copy when pyarrow is available."""
+    with metrics.RUN.stage("write") as stage:
+        df.to_csv(csv_path, index=False)
+        write_parquet(df, csv_path)
+        stage.rows = len(df)
+
+
+class ParquetStream:
+    """
+    Typed Parquet copy of a dataset written batch by batch. Categories of each
+    batch differ, so they are all stored with the same dictionary type.
+    """
+
+    def __init__(self, csv_path: str, columns: List[str]) -> None:
+        self.path = parquet_path(csv_path)
+        self.columns = columns
+        self.writer = None
+        self.schema = None
+
+    def write_table(self, table) -> None:
+        import pyarrow
+        import pyarrow.parquet
+
+        if self.writer is None:
+            dictionary = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+            self.schema = pyarrow.schema(
+                [field.with_type(dictionary) if pyarrow.types.is_dictionary(field.type) else field
+                 for field in table.schema], metadata=table.schema.metadata)
+            self.writer = pyarrow.parquet.ParquetWriter(f"{self.path}.tmp", self.schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def write_rows(self, rows: List[list]) -> None:
+        import pyarrow
+
+        if rows:
+            df = apply_schema(pandas.DataFrame.from_records(rows, columns=self.columns))
+            self.write_table(pyarrow.Table.from_pandas(df, preserve_index=False))
+
+    def copy(self, path: str) -> None:
+        """Carry over the rows of an existing Parquet file."""
+        import pyarrow
+        import pyarrow.parquet
+
+        parquet = pyarrow.parquet.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=BATCH_SIZE):
+            self.write_table(pyarrow.Table.from_batches([batch]).replace_schema_metadata(
+                parquet.schema_arrow.metadata))
+
+    def close(self) -> bool:
+        """Replace the Parquet copy with the rows written, if any."""
+        if self.writer is None:
+            return False
+        self.writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        return True
+
+
+def write_records(records: Iterable[Sequence], columns: List[str], csv_path: str, append: bool = False,
+                  batch_size: int = BATCH_SIZE) -> None:
+    """
+    Stream records, e.g. the NamedTuples yielded by a scraper, into a dataset
+    without ever holding it in memory: rows go straight into the CSV file and
+    into its Parquet copy one batch at a time. When appending, the column
+    order of the existing file is kept. Both files are written to copies
+    which then replace them, so readers never see a partial dataset.
+    """
+    with metrics.RUN.stage("write") as stage:
+        tmppath = f"{csv_path}.tmp"
+        order = columns
+        header = True
+        previous_parquet = None
+        if append and os.path.exists(csv_path):
+            with open(csv_path, newline="") as fh:
+                order = next(csv.reader(fh))
+            shutil.copyfile(csv_path, tmppath)
+            header = False
+            previous_parquet = parquet_path(csv_path) if has_fresh_parquet(csv_path) else None
+        elif os.path.exists(tmppath):
+            os.remove(tmppath)
+        indices = [columns.index(column) for column in order]
+
+        parquet = ParquetStream(csv_path, order) if HAS_PARQUET and (not append or previous_parquet) else None
+        if parquet is not None and previous_parquet is not None:
+            parquet.copy(previous_parquet)
+
+        batch: List[list] = []
+        with open(tmppath, "a", newline="") as fh:
+            writer = csv.writer(fh)
+            if header:
+                writer.writerow(order)
+            for record in records:
+                row = [record[index] for index in indices]
+                writer.writerow(row)
+                stage.rows += 1
+                if parquet is not None:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        parquet.write_rows(batch)
+                        batch = []
+            if parquet is not None:
+                parquet.write_rows(batch)
+        os.replace(tmppath, csv_path)
+
+    if HAS_PARQUET and (parquet is None or not parquet.close()):
+        # No rows or no previous copy to stream into, the copy is written from the CSV file
+        convert(csv_path)
+
+
+def convert(csv_path: str) -> None:
+    """Write the typed Parquet copy of a dataset saved as CSV only, e.g. by a scraper."""
+    with metrics.RUN.stage("convert") as stage:
+        df = pandas.read_csv(csv_path)
+        write_parquet(df, csv_path)
+        stage.rows = len(df)
+
+
+def has_fresh_parquet(csv_path: str) -> bool:
+    parquet = parquet_path(csv_path)
+    return HAS_PARQUET and os.path.exists(parquet) and (
+        not os.path.exists(csv_path) or os.path.getmtime(parquet) >= os.path.getmtime(csv_path))
+
+
+def read_dataset(csv_path: str, columns: Optional[List[str]] = None) -> pandas.DataFrame:
+    """
+    Read a dataset with its explicit column types, from its Parquet copy when
+    that is at least as recent as the CSV file and from the CSV otherwise.
+    """
+    with metrics.RUN.stage("read") as stage:
+        if has_fresh_parquet(csv_path):
+            df = pandas.read_parquet(parquet_path(csv_path), columns=columns)
+        else:
+            df = apply_schema(pandas.read_csv(csv_path, usecols=columns))
+        stage.rows = len(df)
+    return df
+
+
+def iter_dataset(csv_path: str, columns: Optional[List[str]] = None, chunksize: int = CHUNKSIZE,
+                 max_position: Optional[int] = None) -> Iterator[pandas.DataFrame]:
+    """
+    Stream a dataset in chunks of at most `chunksize` rows, skipping the chart
+    entries below `max_position`. From a Parquet copy the position filter is
+    pushed down to the scan, so skipped rows are never turned into a DataFrame.
+    """
+    chunks = read_chunks(csv_path, columns, chunksize, max_position)
+    while True:
+        # Only reading a chunk is timed, not what the caller does with it
+        with metrics.RUN.stage("read") as stage:
+            chunk = next(chunks, None)
+            stage.rows = len(chunk) if chunk is not None else 0
+        if chunk is None:
+            return
+        yield chunk
+
+
+def read_chunks(csv_path: str, columns: Optional[List[str]], chunksize: int,
+                max_position: Optional[int]) -> Iterator[pandas.DataFrame]:
+    if has_fresh_parquet(csv_path):
+        import pyarrow.dataset
+
+        scan_filter = pyarrow.dataset.field("position") <= max_position if max_position is not None else None
+        dataset = pyarrow.dataset.dataset(parquet_path(csv_path), format="parquet")
+        for batch in dataset.to_batches(columns=columns, filter=scan_filter, batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    for chunk in pandas.read_csv(csv_path, usecols=columns, chunksize=chunksize):
+        if max_position is not None:
+            chunk = chunk[chunk.position <= max_position]
+        yield apply_schema(chunk)
+
+
+if __name__ == "__main__":
+    # Write the Parquet copies of every dataset in the repository
+    for pattern in DATASETS:
+        for filename in sorted(glob.glob(pattern)):
+            print(os.path.relpath(filename, BASEDIR))
+            convert(filename)
@@ -0,0 +1,168 @@
+"""
+Load test of the query service, reporting latency percentiles and throughput
+per endpoint, e.g.
+
+    python load_test.py --duration 10 --concurrency 8
+    python load_test.py --url http://127.0.0.1:8000
+
+Without --url a service is started on a free port for the duration of the
+test. Every client thread keeps its connection alive and cycles through
+requests to every endpoint, built from the datasets being served.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urlencode, urlsplit
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Sample(NamedTuple):
+    endpoint: str
+    seconds: float
+    status: int
+
+
+def get(connection: http.client.HTTPConnection, path: str) -> http.client.HTTPResponse:
+    connection.request("GET", path)
+    response = connection.getresponse()
+    response.read()
+    return response
+
+
+def get_json(base_url: str, path: str):
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    try:
+        connection.request("GET", path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def make_paths(base_url: str, count: int, seed: int = 0) -> List[str]:
+    """Requests spread over every endpoint, with parameters taken from the data being served."""
+    rng = random.Random(seed)
+    languages = get_json(base_url, "/languages")
+    keys = [(entry["platform"], entry["country"], entry["year"]) for entry in languages]
+    countries = sorted({country for _, country, _ in keys})
+    weeks = [f"{year}-W{week:02}" for year in sorted({year for _, _, year in keys}) for week in range(1, 53)]
+
+    paths = []
+    for _ in range(count // 5):
+        platform, country, year = rng.choice(keys)
+        paths.append("/languages?" + urlencode({"platform": platform, "country": country, "year": year}))
+        paths.append("/top?" + urlencode({"platform": platform, "country": country, "year": year}))
+        paths.append("/charts?" + urlencode({"country": rng.choice(countries), "week": rng.choice(weeks)}))
+        paths.append("/eurovision?" + urlencode({"country": rng.choice(countries)}))
+        top = get_json(base_url, "/top?" + urlencode({"platform": platform, "country": country, "year": year}))
+        if isinstance(top, list) and top:
+            paths.append("/artists?" + urlencode({"name": rng.choice(top)["artist"]}))
+    return paths
+
+
+def run_client(base_url: str, paths: List[str], deadline: float, samples: List[Sample]) -> None:
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    for path in itertools.cycle(paths):
+        start = time.perf_counter()
+        if start >= deadline:
+            break
+        try:
+            status = get(connection, path).status
+        except (OSError, http.client.HTTPException):
+            status = 0
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        samples.append(Sample(urlsplit(path).path, time.perf_counter() - start, status))
+    connection.close()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(samples: List[Sample], seconds: float) -> Dict[str, dict]:
+    by_endpoint: Dict[str, List[Sample]] = {"all": samples}
+    for sample in samples:
+        by_endpoint.setdefault(sample.endpoint, []).append(sample)
+
+    results = {}
+    print(f"{'endpoint':>12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for endpoint, endpoint_samples in by_endpoint.items():
+        latencies = [sample.seconds for sample in endpoint_samples]
+        results[endpoint] = {
+            "requests": len(endpoint_samples),
+            "errors": sum(sample.status not in (200, 304, 404) for sample in endpoint_samples),
+            "requests_per_second": len(endpoint_samples) / seconds,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+        result = results[endpoint]
+        print(f"{endpoint:>12} {result['requests']:>9} {result['errors']:>7} {result['requests_per_second']:>9.1f} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+    return results
+
+
+def start_server() -> subprocess.Popen:
+    """Start the service on a free port, and wait until it has loaded the datasets."""
+    process = subprocess.Popen([sys.executable, os.path.join(BASEDIR, "serve_charts.py"), "--port", "0"],
+                               stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()
+    if not line.startswith("Serving on "):
+        process.kill()
+        raise RuntimeError(f"The service did not start: {line}{process.stderr.read()}")
+    process.base_url = line.split()[-1]
+    return process
+
+
+def load_test(base_url: str, duration: float, concurrency: int, requests: int) -> Dict[str, dict]:
+    paths = make_paths(base_url, requests)
+    samples: List[Sample] = []  # Appending to a list is thread-safe
+    deadline = time.perf_counter() + duration
+    threads = []
+    for index in range(concurrency):
+        # Every client starts at a different request, so that they do not move in lockstep
+        offset = index * len(paths) // concurrency
+        thread = threading.Thread(target=run_client,
+                                  args=(base_url, paths[offset:] + paths[:offset], deadline, samples))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return report(samples, duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Base url of a running service, by default one is started")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of client connections")
+    parser.add_argument("--requests", type=int, default=500, help="Number of distinct requests cycled through")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    server: Optional[subprocess.Popen] = None
+    base_url = args.url
+    if base_url is None:
+        server = start_server()
+        base_url = server.base_url
+    try:
+        results = load_test(base_url, args.duration, args.concurrency, args.requests)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
@@ -0,0 +1,384 @@
+"""
+Read-only HTTP service over the chart, top-10 and Eurovision datasets, e.g.
+
+    python serve_charts.py --port 8000
+
+Every endpoint answers GET requests with JSON:
+
+    /languages?platform=radio&country=Norway&year=2019   Language share of the top songs of a year
+    /top?platform=spotify&country=Sweden&year=2020       Top songs of a year, by weeks or streams
+    /charts?country=Denmark&week=2019-W10&n=10           Top of a weekly chart, Spotify weeks
+                                                         being given by their first day
+    /eurovision?country=Sweden                           Eurovision entries and results of a country
+    /artists?name=Ed Sheeran                             Top songs and Eurovision entries of an artist
+    /health                                              Datasets loaded and their version
+
+Datasets are loaded once into dictionaries keyed by the query parameters,
+so that requests are lookups. They are reloaded in the background when
+their files change. Responses are cached until then, and tagged with the
+version of the data, so that clients can revalidate them with If-None-Match.
+"""
+import argparse
+import collections
+import http.server
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+CHARTS_DIR = os.path.join(BASEDIR, os.pardir, "scrape-top-charts")
+EUROVISION_DIR = os.path.join(BASEDIR, os.pardir, "scrape-eurovision")
+
+# The storage layer and the chart helpers live with the pipeline producing the datasets
+sys.path.append(CHARTS_DIR)
+
+import chart_runs  # noqa: E402
+import filter_top_10  # noqa: E402
+import song_identity  # noqa: E402
+import storage  # noqa: E402
+
+RADIOCHARTS = [os.path.join(CHARTS_DIR, filename) for filename in filter_top_10.RADIOCHARTS]
+SPOTIFYCHARTS = os.path.join(CHARTS_DIR, filter_top_10.SPOTIFYCHARTS)
+# Top songs of each year, labelled with their language
+TOP_SONGS = {
+    "radio": os.path.join(CHARTS_DIR, "data", "labelled-manual", "radio_charts.csv"),
+    "spotify": os.path.join(CHARTS_DIR, "data", "labelled-manual", "spotify_charts.csv"),
+}
+EUROVISION = os.path.join(EUROVISION_DIR, "data", "eurovision_songs_merged.csv")
+
+RELOAD_INTERVAL = 2.0  # Seconds between two checks of the dataset files
+CACHE_SIZE = 4096  # Responses kept in the cache
+
+Rows = List[Dict[str, Any]]
+
+
+def records(df: pandas.DataFrame) -> Rows:
+    # Columns of other platforms are left out, and missing values become
+    # null instead of NaN, which is not valid JSON
+    df = df.dropna(axis=1, how="all")
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def group_records(df: pandas.DataFrame, keys: List[str]) -> Dict[Tuple, Rows]:
+    return {key if isinstance(key, tuple) else (key,): records(group.drop(columns=keys))
+            for key, group in df.groupby(keys, observed=True, sort=False)}
+
+
+class Indexes(NamedTuple):
+    version: str
+    datasets: Dict[str, int]  # Rows of every dataset loaded
+    # Language shares under every combination of platform, country and year, None standing for any
+    languages: Dict[Tuple[Optional[str], Optional[str], Optional[int]], Rows]
+    top: Dict[Tuple[str, str, int], Rows]
+    charts: Dict[Tuple[str, str], Rows]
+    eurovision: Dict[str, Rows]
+    artists: Dict[str, Dict[str, Rows]]
+
+
+def dataset_files() -> List[str]:
+    return RADIOCHARTS + [SPOTIFYCHARTS, EUROVISION] + list(TOP_SONGS.values())
+
+
+def files_signature() -> Tuple:
+    """Modification time and size of every dataset file, which change whenever one is rewritten."""
+    signature = []
+    for path in dataset_files():
+        for candidate in (path, storage.parquet_path(path)):
+            if os.path.exists(candidate):
+                stat = os.stat(candidate)
+                signature.append((candidate, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def language_shares(top: pandas.DataFrame) -> Dict[Tuple[str, str, int], Dict[str, float]]:
+    """Share of every language among the top songs, songs in several languages counting for each in part."""
+    songs = top.dropna(subset=["language"]).reset_index(drop=True)
+    languages = songs.language.astype(str).str.split(",")
+    songs = songs.assign(weight=1 / languages.str.len(), language=languages).explode("language")
+    songs["language"] = songs.language.str.strip()
+    totals = songs.groupby(["platform", "country", "year", "language"], observed=True).weight.sum()
+    shares = totals / totals.groupby(level=["platform", "country", "year"], observed=True).transform("sum")
+
+    result: Dict[Tuple[str, str, int], Dict[str, float]] = collections.defaultdict(dict)
+    for (platform, country, year, language), share in shares.sort_values(ascending=False).items():
+        result[(platform, country, int(year))][language] = round(float(share), 4)
+    return dict(result)
+
+
+def language_index(shares: Dict[Tuple[str, str, int], Dict[str, float]]) -> Dict[Tuple, Rows]:
+    """Rows of the language shares listed under every subset of the parameters of /languages."""
+    index: Dict[Tuple, Rows] = collections.defaultdict(list)
+    for (platform, country, year), languages in shares.items():
+        row = {"platform": platform, "country": country, "year": year, "shares": languages}
+        for key in itertools.product((platform, None), (country, None), (year, None)):
+            index[key].append(row)
+    return dict(index)
+
+
+def load_top_songs() -> pandas.DataFrame:
+    dfs = []
+    for platform, path in TOP_SONGS.items():
+        if not os.path.exists(path):
+            print(f"No top songs of {platform}, {path} is missing", file=sys.stderr)
+            continue
+        dfs.append(storage.read_dataset(path).astype({"artist": str, "title": str, "country": str})
+                   .assign(platform=platform))
+    if not dfs:
+        raise FileNotFoundError(f"No top songs labelled with their language in {', '.join(TOP_SONGS.values())}")
+    top = pandas.concat(dfs, ignore_index=True)
+    # Counts of the platform whose songs are missing
+    top = top.reindex(columns=top.columns.union(["weekcount", "streams"], sort=False))
+    # Songs rank by weeks in the top 10 on the radio, and by streams on Spotify
+    top["score"] = top.weekcount.fillna(top.streams).astype("int64")
+    # Counts stay integers despite being missing for the other platform
+    top = top.astype({"weekcount": "Int64", "streams": "Int64"})
+    return top.sort_values(["platform", "country", "year", "score"], ascending=[True, True, True, False])
+
+
+def load_charts() -> pandas.DataFrame:
+    charts = chart_runs.load_charts(RADIOCHARTS, SPOTIFYCHARTS)
+    # Weeks are looked up by their label, e.g. 2019-W10, or the first day of a Spotify chart
+    labels = {(platform, week): chart_runs.week_label(platform, week)
+              for platform, week in charts[["platform", "week_index"]].drop_duplicates().itertuples(index=False)}
+    charts["week"] = [labels[key] for key in zip(charts.platform, charts.week_index)]
+    return charts.sort_values(["country", "week", "platform", "position"])
+
+
+def load_indexes() -> Indexes:
+    top = load_top_songs()
+    charts = load_charts()
+    eurovision = storage.read_dataset(EUROVISION).astype({"artist": str, "title": str, "country": str})
+    eurovision = eurovision.sort_values(["country", "year"])
+
+    # Artists are told apart by their normalized lead artist, so that spellings match across datasets
+    artists: Dict[str, Dict[str, Rows]] = collections.defaultdict(lambda: {"top": [], "eurovision": []})
+    for name, df in (("top", top.drop(columns="score")), ("eurovision", eurovision)):
+        keys = df.artist.map(song_identity.normalize_artist)
+        for key, group in df.groupby(keys, sort=False):
+            artists[key][name] = records(group)
+
+    charts_columns = ["platform", "position", "artist", "title"]
+    return Indexes(
+        version=f"{time.time_ns():x}",
+        datasets={"top": len(top), "charts": len(charts), "eurovision": len(eurovision)},
+        languages=language_index(language_shares(top)),
+        top=group_records(top.drop(columns="score"), ["platform", "country", "year"]),
+        charts=group_records(charts[["country", "week"] + charts_columns], ["country", "week"]),
+        eurovision={key[0]: rows for key, rows in group_records(eurovision, ["country"]).items()},
+        artists=dict(artists),
+    )
+
+
+class DataStore:
+    """Current indexes of the datasets, rebuilt when their files change."""
+
+    def __init__(self) -> None:
+        self.signature = files_signature()
+        self.indexes = load_indexes()
+        self.lock = threading.Lock()
+
+    def reload_if_changed(self) -> bool:
+        signature = files_signature()
+        if signature == self.signature:
+            return False
+        with self.lock:
+            # Requests keep being served from the previous indexes while the new ones are built
+            indexes = load_indexes()
+            self.indexes, self.signature = indexes, signature
+        return True
+
+    def watch(self, interval: float) -> threading.Thread:
+        def poll() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload_if_changed():
+                        print(f"Reloaded datasets, version {self.indexes.version}", file=sys.stderr)
+                except Exception as exc:  # A dataset being rewritten, kept until the next check
+                    print(f"Could not reload datasets: {exc!r}", file=sys.stderr)
+
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        return thread
+
+
+class ResponseCache:
+    """Least recently used cache of serialized responses."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.entries: "collections.OrderedDict[Tuple, bytes]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple, body: bytes) -> None:
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def required(params: Dict[str, str], name: str) -> str:
+    if name not in params:
+        raise BadRequest(f"Missing parameter {name}")
+    return params[name]
+
+
+def integer(params: Dict[str, str], name: str, default: Optional[int] = None, minimum: Optional[int] = None) -> int:
+    if name not in params and default is not None:
+        return default
+    try:
+        value = int(required(params, name))
+    except ValueError:
+        raise BadRequest(f"Parameter {name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise BadRequest(f"Parameter {name} must be at least {minimum}")
+    return value
+
+
+def get_languages(indexes: Indexes, params: Dict[str, str]) -> Any:
+    year = integer(params, "year") if "year" in params else None
+    return indexes.languages.get((params.get("platform"), params.get("country"), year), [])
+
+
+def get_top(indexes: Indexes, params: Dict[str, str]) -> Any:
+    key = (params.get("platform", "radio"), required(params, "country"), integer(params, "year"))
+    if key not in indexes.top:
+        raise NotFound(f"No top songs for {key}")
+    return indexes.top[key][:integer(params, "n", 10, minimum=1)]
+
+
+def get_charts(indexes: Indexes, params: Dict[str, str]) -> Any:
+    key = (required(params, "country"), required(params, "week"))
+    if key not in indexes.charts:
+        raise NotFound(f"No chart for {key}")
+    return indexes.charts[key][:integer(params, "n", 10, minimum=1)]
+
+
+def get_eurovision(indexes: Indexes, params: Dict[str, str]) -> Any:
+    country = required(params, "country")
+    if country not in indexes.eurovision:
+        raise NotFound(f"No Eurovision entries for {country}")
+    return indexes.eurovision[country]
+
+
+def get_artists(indexes: Indexes, params: Dict[str, str]) -> Any:
+    key = song_identity.normalize_artist(required(params, "name"))
+    if key not in indexes.artists:
+        raise NotFound(f"No songs by {params['name']}")
+    return indexes.artists[key]
+
+
+def get_health(indexes: Indexes, params: Dict[str, str]) -> Any:
+    return {"version": indexes.version, "datasets": indexes.datasets}
+
+
+ROUTES: Dict[str, Callable[[Indexes, Dict[str, str]], Any]] = {
+    "/languages": get_languages,
+    "/top": get_top,
+    "/charts": get_charts,
+    "/eurovision": get_eurovision,
+    "/artists": get_artists,
+    "/health": get_health,
+}
+
+
+def make_handler(store: DataStore, cache: ResponseCache) -> type:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        # Keep connections alive between requests, and send the headers and
+        # the body of a response without waiting for the previous one's ACK
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            route = ROUTES.get(url.path)
+            if route is None:
+                return self.respond(404, {"error": f"Unknown endpoint {url.path}"})
+
+            indexes = store.indexes
+            params = {name: values[0] for name, values in parse_qs(url.query).items()}
+            key = (indexes.version, url.path, tuple(sorted(params.items())))
+            body = cache.get(key)
+            if body is None:
+                try:
+                    result = route(indexes, params)
+                except BadRequest as exc:
+                    return self.respond(400, {"error": str(exc)})
+                except NotFound as exc:
+                    return self.respond(404, {"error": str(exc)})
+                body = json.dumps(result, ensure_ascii=False).encode()
+                if url.path != "/health":
+                    cache.put(key, body)
+            # Responses only change with the data, whose version tags them
+            etag = f'"{indexes.version}"'
+            if url.path != "/health" and self.headers.get("If-None-Match") == etag:
+                return self.respond(304, None, etag)
+            self.send_body(200, body, etag)
+
+        def respond(self, status: int, result: Any, etag: Optional[str] = None) -> None:
+            self.send_body(status, json.dumps(result).encode() if result is not None else b"", etag)
+
+        def send_body(self, status: int, body: bytes, etag: Optional[str]) -> None:
+            self.send_response(status)
+            if body:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # Access logs would dominate the latency of cached responses
+            pass
+
+    return Handler
+
+
+def make_server(host: str, port: int, reload_interval: Optional[float] = RELOAD_INTERVAL,
+                cache_size: int = CACHE_SIZE) -> http.server.ThreadingHTTPServer:
+    store = DataStore()
+    if reload_interval:
+        store.watch(reload_interval)
+    return http.server.ThreadingHTTPServer((host, port), make_handler(store, ResponseCache(cache_size)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="Seconds between two checks of the dataset files, 0 to never reload")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.reload_interval, args.cache_size)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import pytest
+import sys
+import threading
+
+from aiohttp import web
+from typing import Awaitable, Callable, Iterator, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+class StandIn:
+    """
+    Local stand-in of a website, answering every path with `handler`. It is
+    served by aiohttp from an event loop of its own, in a background thread,
+    so that code running its own event loop, e.g. through asyncio.run, can
+    fetch from it.
+    """
+
+    def __init__(self, handler: Handler) -> None:
+        self.handler = handler
+        self.paths: List[str] = []  # Paths requested, in order
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        app = web.Application()
+        app.router.add_route("GET", "/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        self.run(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.run(site.start())
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.paths.append(request.path_qs)
+        return await self.handler(request)
+
+    def run(self, coroutine: Awaitable) -> None:
+        asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        self.run(self.runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+@pytest.fixture
+def standin() -> Iterator[Callable[[Handler], StandIn]]:
+    servers = []
+
+    def start(handler: Handler) -> StandIn:
+        servers.append(StandIn(handler))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
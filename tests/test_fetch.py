@@ -0,0 +1,96 @@
+import aiohttp
+import asyncio
+import fetch
+import pytest
+import socket
+import time
+
+from aiohttp import web
+from typing import List
+
+
+def get_many(urls: List[str], **kwargs) -> List[fetch.Response]:
+    async def run() -> List[fetch.Response]:
+        async with fetch.Fetcher(**kwargs) as fetcher:
+            return await fetcher.get_many(urls)
+
+    return asyncio.run(run())
+
+
+def failing(status: int, failures: int):
+    """Handler answering `status` to the first `failures` requests, and the path afterwards."""
+    async def handler(request: web.Request) -> web.Response:
+        handler.times.append(time.perf_counter())
+        if len(handler.times) <= failures:
+            return web.Response(status=status)
+        return web.Response(text=request.path)
+
+    handler.times = []
+    return handler
+
+
+@pytest.mark.parametrize("status", sorted(fetch.RETRY_STATUSES))
+def test_transient_failures_are_retried(standin, status):
+    server = standin(failing(status, 2))
+    [response] = get_many([f"{server.url}/page"], retries=3, backoff=0.01)
+    assert (response.status_code, response.content) == (200, b"/page")
+    assert len(server.paths) == 3
+
+
+def test_retries_back_off_exponentially(standin, monkeypatch):
+    monkeypatch.setattr(fetch.random, "random", lambda: 0.0)  # No jitter
+    handler = failing(503, 2)
+    server = standin(handler)
+    get_many([f"{server.url}/page"], retries=2, backoff=0.05)
+    gaps = [later - earlier for earlier, later in zip(handler.times, handler.times[1:])]
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1
+
+
+def test_last_response_is_returned_when_retries_run_out(standin):
+    server = standin(failing(503, 10))
+    [response] = get_many([f"{server.url}/page"], retries=2, backoff=0)
+    assert response.status_code == 503
+    assert len(server.paths) == 3
+
+
+def test_other_errors_are_not_retried(standin):
+    server = standin(failing(404, 1))
+    [response] = get_many([f"{server.url}/page"], retries=3, backoff=0)
+    assert response.status_code == 404
+    assert len(server.paths) == 1
+
+
+def test_connection_errors_are_raised_when_retries_run_out():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(aiohttp.ClientError):
+        get_many([f"http://127.0.0.1:{port}/page"], retries=1, backoff=0)
+
+
+def test_concurrency_is_bounded_per_host(standin):
+    in_flight, peak = 0, 0
+
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return web.Response(text=request.path)
+
+    server = standin(handler)
+    get_many([f"{server.url}/{index}" for index in range(12)], concurrency_per_host=3)
+    assert len(server.paths) == 12
+    assert peak == 3
+
+
+def test_responses_keep_the_order_of_the_urls(standin):
+    async def handler(request: web.Request) -> web.Response:
+        # Later pages answer first
+        await asyncio.sleep(0.01 * (10 - int(request.path[1:])))
+        return web.Response(text=request.path)
+
+    server = standin(handler)
+    responses = get_many([f"{server.url}/{index}" for index in range(10)], concurrency_per_host=10)
+    assert [response.content for response in responses] == [f"/{index}".encode() for index in range(10)]
@@ -0,0 +1,37 @@
+import os
+import pandas
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import filter_top_10  # noqa: E402
+
+
+def charts() -> pandas.DataFrame:
+    # "Old Town Road" charts under two spellings in week 2
+    return pandas.DataFrame({
+        "artist": ["Lil Nas X", "Gettomasa", "Lil Nas X", "Lil Nas X feat. Billy Ray Cyrus", "Gettomasa"],
+        "title": ["Old Town Road", "Silmät", "Old Town Road", "Old Town Road (Remix)", "Silmät"],
+        "position": [1, 2, 3, 2, 4],
+        "week": [1, 1, 2, 2, 2],
+        "year": [2019] * 5,
+        "country": ["Finland"] * 5,
+    })
+
+
+def test_spellings_of_a_song_in_the_same_week_count_once():
+    top = filter_top_10.top_n(charts(), n=10).set_index("title")
+    assert top.loc["Old Town Road", "weekcount"] == 2
+    assert top.loc["Silmät", "weekcount"] == 2
+
+
+def test_spellings_of_a_song_in_the_same_week_score_at_their_best_position():
+    top = filter_top_10.top_n(charts(), n=10, metric="score").set_index("title")
+    assert top.loc["Old Town Road", "score"] == 10 + 9
+
+
+def test_streaming_counts_spellings_split_between_chunks_once():
+    # The second chunk starts in the middle of week 2
+    chunks = [charts().iloc[:3], charts().iloc[3:]]
+    top = filter_top_10.top_n_streaming(chunks, n=10).set_index("title")
+    assert top.loc["Old Town Road", "weekcount"] == 2
@@ -0,0 +1,61 @@
+import asyncio
+import fetch
+import http_cache
+import pytest
+
+from aiohttp import web
+
+
+def get(cache: http_cache.HTTPCache, url: str) -> fetch.Response:
+    async def run() -> fetch.Response:
+        async with fetch.Fetcher(cache=cache, retries=0) as fetcher:
+            return await fetcher.get(url)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def server(standin):
+    async def handler(request: web.Request) -> web.Response:
+        handler.conditional.append(request.headers.get("If-None-Match"))
+        if request.path == "/flaky":
+            return web.Response(status=503)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.Response(text="chart", headers={"ETag": '"v1"'})
+
+    handler.conditional = []
+    server = standin(handler)
+    server.conditional = handler.conditional
+    return server
+
+
+def test_fresh_entries_are_served_without_the_network(server, tmp_path):
+    cache = http_cache.HTTPCache(str(tmp_path))
+    assert get(cache, f"{server.url}/page").content == b"chart"
+    assert get(cache, f"{server.url}/page").content == b"chart"
+    assert len(server.paths) == 1
+
+
+def test_stale_entries_are_revalidated_with_their_etag(server, tmp_path):
+    cache = http_cache.HTTPCache(str(tmp_path), default_ttl=0)
+    get(cache, f"{server.url}/page")
+    response = get(cache, f"{server.url}/page")
+    assert (response.status_code, response.content) == (200, b"chart")
+    assert server.conditional == [None, '"v1"']
+
+
+def test_server_errors_are_not_cached(server, tmp_path):
+    cache = http_cache.HTTPCache(str(tmp_path))
+    assert get(cache, f"{server.url}/flaky").status_code == 503
+    assert cache.lookup(f"{server.url}/flaky") is None
+
+
+def test_offline_mode_replays_stale_entries_and_misses_the_others(server, tmp_path):
+    get(http_cache.HTTPCache(str(tmp_path), default_ttl=0), f"{server.url}/page")
+
+    offline = http_cache.HTTPCache(str(tmp_path), default_ttl=0, offline=True)
+    assert get(offline, f"{server.url}/page").content == b"chart"
+    with pytest.raises(http_cache.CacheMiss):
+        get(offline, f"{server.url}/other")
+    assert server.paths == ["/page"]
@@ -0,0 +1,51 @@
+import http_cache
+import ingest
+import pandas
+import pytest
+import scrape_top_charts_denmark
+
+from aiohttp import web
+
+WEEKS = [(2017, 1), (2017, 2), (2017, 3)]
+
+
+def chart_page(week: str) -> str:
+    return (f'<table id="linien"><tr><td id="denneuge">1</td><td><div id="artistnavn">ARTIST {week}</div>'
+            f'<div id="titel">TITLE {week}</div></td></tr></table>')
+
+
+def test_failed_chart_is_retried_by_the_next_run(standin, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    failing = {"/2017/2"}
+
+    async def handler(request: web.Request) -> web.Response:
+        if request.path in failing:
+            return web.Response(status=500)
+        return web.Response(text=chart_page(request.path.rsplit("/", 1)[-1]), content_type="text/html")
+
+    server = standin(handler)
+    source = scrape_top_charts_denmark.SOURCE._replace(
+        url=lambda year, week: f"{server.url}/{year}/{week}", dataset="charts.csv",
+        chart_keys=lambda start_year, end_year: WEEKS)
+    cache = http_cache.HTTPCache(str(tmp_path / "cache"))
+
+    with pytest.raises(ingest.ChartUnavailable):
+        ingest.ingest([source], cache=cache, retries=1, backoff=0)
+    assert not (tmp_path / "charts.csv").exists()
+    assert server.paths.count("/2017/2") == 2
+
+    failing.clear()
+    ingest.ingest([source], cache=cache)
+    assert pandas.read_csv(tmp_path / "charts.csv").week.tolist() == [1, 2, 3]
+    # Weeks journaled by the first run are not fetched again
+    assert server.paths.count("/2017/1") == 1
+
+
+def test_extract_chart_fails_on_error_pages(standin, tmp_path):
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(status=404)
+
+    server = standin(handler)
+    source = scrape_top_charts_denmark.SOURCE._replace(url=lambda year, week: f"{server.url}/{year}/{week}")
+    with pytest.raises(ingest.ChartUnavailable):
+        ingest.extract_chart(source, (2017, 1), http_cache.HTTPCache(str(tmp_path / "cache")))
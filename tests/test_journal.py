@@ -0,0 +1,43 @@
+import json
+import pandas
+
+from journal import Journal
+
+WEEKS = [(2017, 1), (2017, 2), (2017, 3)]
+
+
+def rows(week: int) -> list:
+    return [{"artist": f"Artist {week}", "position": 1, "title": f"Title {week}", "week": week, "year": 2017}]
+
+
+def test_interrupted_run_resumes_with_the_units_left(tmp_path):
+    journal = Journal(str(tmp_path / "journal"))
+    journal.record((2017, 1), rows(1))
+    # Killed while writing the manifest entry of the second week
+    with open(journal.manifest_path, "a") as fh:
+        fh.write('{"key": "[2017, 2]", "ro')
+
+    resumed = Journal(str(tmp_path / "journal"))
+    assert resumed.pending(WEEKS) == [(2017, 2), (2017, 3)]
+    for year, week in resumed.pending(WEEKS):
+        resumed.record((year, week), rows(week))
+
+    path = str(tmp_path / "charts.csv")
+    resumed.write_dataset(path, ["artist", "position", "title", "week", "year"], keys=WEEKS)
+    assert pandas.read_csv(path).week.tolist() == [1, 2, 3]
+
+
+def test_recording_a_unit_again_replaces_its_rows(tmp_path):
+    journal = Journal(str(tmp_path / "journal"))
+    journal.record((2017, 1), rows(1) * 2)
+    journal.record((2017, 1), rows(1))
+    assert list(Journal(str(tmp_path / "journal")).iter_rows()) == rows(1)
+
+
+def test_empty_units_count_as_done(tmp_path):
+    journal = Journal(str(tmp_path / "journal"))
+    journal.record((2020, 1), [])
+    assert Journal(str(tmp_path / "journal")).pending([(2020, 1)]) == []
+    assert list(journal.iter_rows()) == []
+    with open(journal.manifest_path) as fh:
+        assert json.loads(fh.readline()) == {"key": "[2020, 1]", "rows": 0}
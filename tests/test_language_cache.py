@@ -0,0 +1,30 @@
+import sqlite3
+
+from language_cache import LanguageCache
+from language_classifier import Detection
+from song_identity import INDEX
+
+
+def test_spellings_of_a_song_share_their_language(tmp_path):
+    cache = LanguageCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many([(INDEX.song_id("Ed Sheeran", "Shape of You"), "Ed Sheeran", "Shape of You", "English", 0.99)])
+    song_id = INDEX.song_id("ED SHEERAN", "SHAPE OF YOU")
+    assert cache.get_many([song_id]) == {song_id: Detection("English", 0.99)}
+
+
+def test_caches_keyed_by_strings_are_migrated(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE languages (key TEXT PRIMARY KEY, artist TEXT, title TEXT, language TEXT)")
+        connection.executemany("INSERT INTO languages VALUES (?, ?, ?, ?)", [
+            ("post malone^_rockstar", "POST MALONE", "ROCKSTAR", "Swedish"),
+            ("post malone, 21 savage^_rockstar", "Post Malone, 21 Savage", "rockstar", "English"),
+            ("post malone^_rockstar (feat. 21 savage)", "Post Malone", "Rockstar (Feat. 21 Savage)", "English"),
+        ])
+    connection.close()
+
+    cache = LanguageCache(path)
+    song_id = INDEX.song_id("Post Malone", "Rockstar")
+    assert cache.get_many([song_id]) == {song_id: Detection("English", None)}
+    tables = [row[0] for row in cache.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert tables == ["song_languages"]
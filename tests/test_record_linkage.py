@@ -0,0 +1,38 @@
+import pandas
+import record_linkage
+
+# Lone entries of a (year, country) in both datasets, whose titles are spelled too differently to match
+LONE_ENTRIES = [
+    (1978, "Israel", "Izhar Cohen and the Alphabeta", "Abanibi", "Izhar Cohen & the Alphabeta", "A-Ba-Ni-Bi"),
+    (1981, "Israel", "Habibi", "Halaylah", "Hakol Over Habibi", "Layla"),
+    (1991, "Cyprus", "Elena Patroclou", "S.o.s.", "Elena Patroklou", "SOS"),
+    (1999, "Israel", "Eden", "Yom Huledeth", "Eden", "Happy Birthday"),
+    (2006, "Israel", "Eddie Butler", "Ze Hazman", "Eddie Butler", "Together We Are One"),
+    (2017, "Belarus", "Naviband", "Story of My Life", "Naviband", "Historyja Majho Žyccia"),
+]
+
+
+def songs(rows) -> pandas.DataFrame:
+    return pandas.DataFrame(rows, columns=["year", "country", "artist", "title"])
+
+
+def test_lone_entries_of_a_block_match_on_their_artist():
+    left = songs([(year, country, artist, title) for year, country, artist, title, _, _ in LONE_ENTRIES])
+    right = songs([(year, country, artist, title) for year, country, _, _, artist, title in LONE_ENTRIES])
+    linkage = record_linkage.link(left, right, blocks=["year", "country"])
+    assert linkage.matches.left.tolist() == linkage.matches.right.tolist() == list(range(len(LONE_ENTRIES)))
+
+
+def test_lone_entries_by_other_artists_do_not_match():
+    left = songs([(1999, "Israel", "Eden", "Yom Huledeth")])
+    right = songs([(1999, "Israel", "Dana International", "Diva")])
+    assert record_linkage.link(left, right, blocks=["year", "country"]).matches.empty
+
+
+def test_artist_alone_does_not_match_entries_of_a_larger_block():
+    left = songs([(2000, "Sweden", "Eden", "Yom Huledeth"),
+                  (2000, "Sweden", "Roger Pontare", "When Spirits Are Calling")])
+    right = songs([(2000, "Sweden", "Eden", "Happy Birthday"),
+                   (2000, "Sweden", "Roger Pontare", "When Spirits Are Calling My Name")])
+    linkage = record_linkage.link(left, right, blocks=["year", "country"])
+    assert linkage.matches.left.tolist() == [1]
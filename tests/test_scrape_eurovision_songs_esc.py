@@ -0,0 +1,78 @@
+import os
+import pandas
+import pytest
+import sys
+
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-eurovision"))
+
+import scrape_eurovision_songs_esc as esc  # noqa: E402
+
+# Detail page of every entry of the listing, by status, None for a page without a language
+ENTRIES = {
+    "song1": (200, "English"),
+    "song2": (404, None),
+    "song3": (503, None),
+    "song4": (200, None),
+}
+
+
+def listing_page(start: str) -> str:
+    rows = ['<tr><td colspan="9">Spurious</td></tr>']
+    for index, name in enumerate(ENTRIES if start == "1" else []):
+        rows.append(f'<tr><td></td><td><a>{2000 + index}</a></td><td></td><td><a>Sweden</a></td>'
+                    f'<td>Artist {name}</td><td>Title {name}</td><td></td><td></td>'
+                    f'<td><a href="details/{name}">Details</a></td></tr>')
+    return f"<html><body><table><tbody>{''.join(rows)}</tbody></table></body></html>"
+
+
+def detail_page(language: str) -> str:
+    details = f"<b>Language</b><span>{language}</span>" if language else "<b>Composer</b><span>Someone</span>"
+    return f'<html><body><section id="middle-col">{details}</section></body></html>'
+
+
+@pytest.fixture
+def site(standin, monkeypatch):
+    async def handler(request: web.Request) -> web.Response:
+        if request.path == "/entries.asp":
+            return web.Response(text=listing_page(request.query["start"]), content_type="text/html")
+        status, language = ENTRIES[request.path.rsplit("/", 1)[-1]]
+        return web.Response(status=status, text=detail_page(language), content_type="text/html")
+
+    server = standin(handler)
+    monkeypatch.setattr(esc, "BASE_URL", f"{server.url}/entries.asp?start=")
+    monkeypatch.setattr(esc, "DETAIL_BASE_URL", f"{server.url}/")
+    return server
+
+
+def crawl(tmp_path) -> pandas.DataFrame:
+    return esc.create_dataset(workers=2, partial_path=str(tmp_path / "partial.csv"),
+                              missing_path=str(tmp_path / "missing.csv"), retries=0)
+
+
+def test_failed_pages_are_fetched_again_by_the_next_crawl(site, tmp_path, monkeypatch):
+    with pytest.raises(RuntimeError):
+        crawl(tmp_path)
+    assert pandas.read_csv(tmp_path / "partial.csv").title.tolist() == ["Title song1"]
+    missing = pandas.read_csv(tmp_path / "missing.csv").sort_values("title")
+    assert missing[["title", "status_code"]].values.tolist() == [["Title song2", 404], ["Title song4", 200]]
+
+    monkeypatch.setitem(ENTRIES, "song3", (200, "Swedish"))
+    df = crawl(tmp_path)
+    assert df[["title", "language"]].values.tolist() == [["Title song1", "English"], ["Title song3", "Swedish"]]
+    # Entries found or missing for good by the first crawl are not fetched again
+    assert site.paths.count("/details/song1") == site.paths.count("/details/song2") == 1
+
+
+def test_missing_rows_of_a_previous_crawl_are_reset(tmp_path):
+    missing = pandas.DataFrame({"detail_url": ["a", "b", "c"], "status_code": [404, 503, 200]})
+    missing.to_csv(tmp_path / "missing.csv", index=False)
+    (tmp_path / "partial.csv").write_text("detail_url\n")
+
+    esc.reset_missing(str(tmp_path / "missing.csv"), str(tmp_path / "partial.csv"))
+    assert pandas.read_csv(tmp_path / "missing.csv").detail_url.tolist() == ["a", "c"]
+
+    os.remove(tmp_path / "partial.csv")
+    esc.reset_missing(str(tmp_path / "missing.csv"), str(tmp_path / "partial.csv"))
+    assert not (tmp_path / "missing.csv").exists()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import scrape_top_charts_spotify  # noqa: E402
+
+
+def test_chart_of_a_friday_on_the_last_day_of_the_year():
+    tokens_2021 = scrape_top_charts_spotify.generate_url_tokens(2021, 2021)
+    tokens_2022 = scrape_top_charts_spotify.generate_url_tokens(2022, 2022)
+    assert tokens_2021[-1] == "2021-12-31--2022-01-07"
+    assert tokens_2022[0] == "2022-01-07--2022-01-14"
+    assert len(tokens_2021) == 53
+
+
+def test_consecutive_years_cover_every_week_once():
+    tokens = scrape_top_charts_spotify.generate_url_tokens(2020, 2022)
+    years = [token for year in (2020, 2021, 2022)
+             for token in scrape_top_charts_spotify.generate_url_tokens(year, year)]
+    assert years == tokens
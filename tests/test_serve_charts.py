@@ -0,0 +1,24 @@
+import os
+import pytest
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "serve-charts"))
+
+import serve_charts  # noqa: E402
+
+CHART = [{"platform": "radio", "position": position, "artist": "Artist", "title": f"Title {position}"}
+         for position in range(1, 21)]
+INDEXES = serve_charts.Indexes(version="1", datasets={}, languages={}, top={}, charts={("Denmark", "2019-W10"): CHART},
+                               eurovision={}, artists={})
+
+
+def test_top_of_a_chart():
+    params = {"country": "Denmark", "week": "2019-W10", "n": "3"}
+    assert serve_charts.get_charts(INDEXES, params) == CHART[:3]
+    assert serve_charts.get_charts(INDEXES, {"country": "Denmark", "week": "2019-W10"}) == CHART[:10]
+
+
+@pytest.mark.parametrize("n", ["0", "-3", "three"])
+def test_invalid_sizes_are_rejected(n):
+    with pytest.raises(serve_charts.BadRequest):
+        serve_charts.get_charts(INDEXES, {"country": "Denmark", "week": "2019-W10", "n": n})
@@ -0,0 +1,18 @@
+import os
+import pandas
+import pytest
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import storage  # noqa: E402
+
+
+def test_week_counts_of_daily_charts_are_kept():
+    df = storage.apply_schema(pandas.DataFrame({"weekcount": [300, 366]}))
+    assert df.weekcount.tolist() == [300, 366]
+
+
+def test_out_of_range_values_are_not_wrapped_around():
+    with pytest.raises(ValueError, match="position"):
+        storage.apply_schema(pandas.DataFrame({"position": [1, 300]}))
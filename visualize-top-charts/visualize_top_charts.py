@@ -1,15 +1,26 @@
+import argparse
+import glob
+import hashlib
 import os
+import sys
 
+import matplotlib
 import numpy
 import pandas
 
-from matplotlib import pyplot
-from matplotlib.patches import Patch
+# Figures are only ever saved to files, also from worker processes
+matplotlib.use("Agg")
 
-from typing import Dict, Iterable, List, Tuple
+from concurrent.futures import ProcessPoolExecutor  # noqa: E402
+from matplotlib import pyplot  # noqa: E402
+from matplotlib.patches import Patch  # noqa: E402
 
+from typing import Iterable, List, NamedTuple, Optional, Tuple  # noqa: E402
 
-LANGUAGE_COUNTS = Dict[str, List[int]]
+# The storage layer lives with the pipeline producing the datasets
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scrape-top-charts"))
+
+import storage  # noqa: E402
 
 LANGUAGE_COLORS = {
     "Danish": "tab:red",
@@ -21,6 +32,27 @@ LANGUAGE_COLORS = {
     "Other": "lightgrey",
 }
 
+PANELS_DIR = "panels"
+# Bump to render every panel again after changing how they look
+PANEL_STYLE = 1
+
+PLATFORMS = ["radio", "spotify"]
+COUNTRIES = ["Denmark", "Finland", "Norway", "Sweden", "Iceland"]
+# Iceland has no radio charts
+PLATFORM_COUNTRIES = {"radio": COUNTRIES[:4], "spotify": COUNTRIES}
+
+
+class CountCube(NamedTuple):
+    """Number of top songs in each language, as a dense year x platform x country x language array."""
+    counts: numpy.ndarray
+    years: List[int]
+    languages: List[str]
+
+    def panel(self, year: int, platform: str) -> numpy.ndarray:
+        """Country x language counts of a single year and platform."""
+        countries = len(PLATFORM_COUNTRIES[platform])
+        return self.counts[self.years.index(year), PLATFORMS.index(platform), :countries]
+
 
 def get_lang(language: str, iterable: Iterable[str]) -> str:
     for item in iterable:
@@ -28,133 +60,170 @@ def get_lang(language: str, iterable: Iterable[str]) -> str:
             return item
 
 
-def create_dataset_for_vis() -> Dict[int, Tuple[LANGUAGE_COUNTS, LANGUAGE_COUNTS]]:
-    dfs = {}
+def create_dataset_for_vis() -> CountCube:
+    dfs = []
     basepath = "../scrape-top-charts/data/labelled-manual"
     for filename in os.listdir(basepath):
-        name = filename.split("_")[0]
-        dfs[name] = pandas.read_csv(os.path.join(basepath, filename))
-
-    spotify_years = {}
-    for label, group in dfs["spotify"].groupby("year"):
-        spotify_years[label] = group
-
-    radio_years = {}
-    for label, group in dfs["radio"].groupby("year"):
-        radio_years[label] = group
-
-    radio_agg = {}
-    for year, df in radio_years.items():
-        radio_agg[year] = df.groupby(["country", "language"])["weekcount"].count().reset_index()
-
-    spotify_agg = {}
-    for year, df in spotify_years.items():
-        spotify_agg[year] = df.groupby(["country", "language"])["streams"].count().reset_index()
-
-    dfs_agg = {
-        year: (radio, spotify)
-        for year, radio, spotify
-        in zip(radio_agg.keys(), radio_agg.values(), spotify_agg.values())
-    }
-
-    stacked_bars = {}
-    for year, (radio, spotify) in dfs_agg.items():
-        stacked_bars_radio = pandas.crosstab(
-            radio.country, radio.language, values=radio["weekcount"],
-            aggfunc=lambda x: x.apply(pandas.to_numeric, errors="ignore"))
-        stacked_bars_radio = stacked_bars_radio.apply(lambda x: x.fillna(0))
-
-        stacked_bars_spotify = pandas.crosstab(
-            spotify.country, spotify.language, values=spotify["streams"],
-            aggfunc=lambda x: x.apply(pandas.to_numeric, errors="ignore"))
-        stacked_bars_spotify = stacked_bars_spotify.apply(lambda x: x.fillna(0))
-        stacked_bars_spotify = stacked_bars_spotify.reindex(["Denmark", "Finland", "Norway", "Sweden", "Iceland"])
-
-        stacked_bars[year] = (stacked_bars_radio, stacked_bars_spotify)
-
-    lang_countries = {}
-    for year, (radio, spotify) in stacked_bars.items():
-        radio_langs = {}
-        for column in radio.columns:
-            radio_langs[column] = radio[column].to_list()
+        if not filename.endswith(".csv"):
+            continue
+        df = storage.read_dataset(os.path.join(basepath, filename), columns=["country", "language", "year"])
+        df["platform"] = filename.split("_")[0]
+        dfs.append(df)
+    songs = pandas.concat(dfs, ignore_index=True).astype({"country": str, "language": str})
+    songs = songs[songs.language != "nan"]
+
+    years = sorted(songs.year.unique().tolist())
+    languages = sorted(songs.language.unique().tolist())
+    axes = {"year": years, "platform": PLATFORMS, "country": COUNTRIES, "language": languages}
+
+    # Count every (year, platform, country, language) at once by binning their flat cube index
+    codes = [pandas.Categorical(songs[column], categories=values).codes for column, values in axes.items()]
+    shape = tuple(len(values) for values in axes.values())
+    known = numpy.all(numpy.stack(codes) >= 0, axis=0)
+    flat = numpy.ravel_multi_index([code[known] for code in codes], shape)
+    counts = numpy.bincount(flat, minlength=numpy.prod(shape)).reshape(shape)
+    return CountCube(counts, years, languages)
+
+
+def plot_panel(ax, counts: numpy.ndarray, languages: List[str]) -> None:
+    """Plot English, the Nordic languages stacked, and the other languages of a panel, side by side."""
+    width = 0.15
+    xvals = numpy.arange(counts.shape[0])
+    stacked = numpy.zeros(counts.shape[0])
+    others = 0
+    for index in numpy.flatnonzero(counts.any(axis=0)):
+        language, values = languages[index], counts[:, index]
+        if language == "English":
+            ax.bar(xvals-width, values, width, label=language, color=LANGUAGE_COLORS[language])
+        elif language in LANGUAGE_COLORS.keys():
+            ax.bar(xvals, values, width, label=language, bottom=stacked, color=LANGUAGE_COLORS[language])
+            stacked = stacked + values
+        else:
+            otherlang = "Other"
+            ax.bar(xvals+width, values, width, label=otherlang if others == 0 else "", color=LANGUAGE_COLORS[otherlang])
+            others += 1
+
+
+def style_panel(ax, title: str, labels: List[str]) -> None:
+    textbox_props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+    ax.set_xticks(numpy.arange(len(labels)), labels, fontsize=14)
+    ax.set_yticks([0, 5, 10])
+    ax.text(0.02, 0.9, title, transform=ax.transAxes, bbox=textbox_props, fontsize=12)
 
-        spotify_langs = {}
-        for column in spotify.columns:
-            spotify_langs[column] = spotify[column].to_list()
 
-        lang_countries[year] = (radio_langs, spotify_langs)
+def plot(cube: CountCube) -> None:
+    fig, axes = pyplot.subplots(len(cube.years), 2, figsize=(13, 3 * len(cube.years)), squeeze=False)
 
-    return lang_countries
+    for year, year_axes in zip(cube.years, axes):
+        for platform, ax in zip(PLATFORMS, year_axes):
+            plot_panel(ax, cube.panel(year, platform), cube.languages)
+            style_panel(ax, panel_title(year, platform), PLATFORM_COUNTRIES[platform])
 
+    add_legend(fig)
+    fig.savefig("visualize_top_charts.png")
 
-def plot(dataset: Dict[int, Tuple[LANGUAGE_COUNTS, LANGUAGE_COUNTS]]) -> None:
-    fig, axes = pyplot.subplots(5, 2, figsize=(13, 15))
-    ax_years = {year: (ax_radio, ax_spoti) for year, (ax_radio, ax_spoti) in zip(dataset.keys(), axes)}
 
-    textbox_props = dict(boxstyle='round', facecolor='white', alpha=0.5)
+def panel_title(name, platform: str) -> str:
+    return f"{name} - {'Spotify' if platform == 'spotify' else 'Radio'}"
 
-    radio_labels = ["Denmark", "Finland", "Norway", "Sweden"]
-    spotify_labels = radio_labels + ["Iceland"]
-
-    radio_xvals = numpy.arange(len(radio_labels))
-    spotify_xvals = numpy.arange(len(spotify_labels))
-
-    for year in ax_years.keys():
-        ax_radio, ax_spotify = ax_years[year]
-
-        radio_langs, spotify_langs = dataset[year]
-
-        width = 0.15
-
-        radio_others, spotify_others = 0, 0
-
-        radio_agg_bars = [0] * 4
-        spotify_agg_bars = [0] * 5
-
-        # Plot radio
-        for language in radio_langs.keys():
-            if language == "English":
-                ax_radio.bar(radio_xvals-width, radio_langs[language], width,
-                             label=language, color=LANGUAGE_COLORS[language])
-            elif language in LANGUAGE_COLORS.keys():
-                ax_radio.bar(radio_xvals, radio_langs[language], width, label=language,
-                             bottom=radio_agg_bars, color=LANGUAGE_COLORS[language])
-                radio_agg_bars = numpy.add(radio_agg_bars, radio_langs[language])
-            else:
-                otherlang = "Other"
-                ax_radio.bar(radio_xvals+width, radio_langs[language], width,
-                             label=otherlang if radio_others == 0 else "", color=LANGUAGE_COLORS[otherlang])
-                radio_others += 1
-
-        # Plot spotify
-        for language in spotify_langs.keys():
-            if language == "English":
-                ax_spotify.bar(spotify_xvals-width, spotify_langs[language],
-                               width, label=language, color=LANGUAGE_COLORS[language])
-            elif language in LANGUAGE_COLORS.keys():
-                ax_spotify.bar(spotify_xvals, spotify_langs[language], width, label=language,
-                               bottom=spotify_agg_bars, color=LANGUAGE_COLORS[language])
-                spotify_agg_bars = numpy.add(spotify_agg_bars, spotify_langs[language])
-            else:
-                otherlang = "Other"
-                ax_spotify.bar(spotify_xvals+width, spotify_langs[language], width,
-                               label=otherlang if spotify_others == 0 else "", color=LANGUAGE_COLORS[otherlang])
-                spotify_others += 1
-
-        ax_radio.set_xticks(radio_xvals, radio_labels, fontsize=14)
-        ax_spotify.set_xticks(spotify_xvals, spotify_labels, fontsize=14)
-
-        ax_radio.set_yticks([0, 5, 10])
-        ax_spotify.set_yticks([0, 5, 10])
-
-        ax_radio.text(0.02, 0.9, f"{year} - Radio", transform=ax_radio.transAxes, bbox=textbox_props, fontsize=12)
-        ax_spotify.text(0.02, 0.9, f"{year} - Spotify", transform=ax_spotify.transAxes, bbox=textbox_props, fontsize=12)
 
+def add_legend(fig) -> None:
     legend_items = [Patch(facecolor=value, label=key) for key, value in LANGUAGE_COLORS.items()]
     fig.legend(handles=legend_items, loc="lower center", ncol=4, fontsize=14)
-    fig.savefig("visualize_top_charts.png")
+
+
+def panel_hash(counts: numpy.ndarray, languages: List[str], title: str, labels: List[str]) -> str:
+    """Hash of everything a panel is drawn from, so that unchanged panels are not rendered again."""
+    digest = hashlib.sha1(f"{PANEL_STYLE}|{title}|{labels}|{languages}|{counts.shape}".encode())
+    digest.update(numpy.ascontiguousarray(counts, dtype="int64").tobytes())
+    return digest.hexdigest()[:16]
+
+
+class PanelJob(NamedTuple):
+    path: str
+    counts: numpy.ndarray
+    languages: List[str]
+    title: str
+    labels: List[str]
+
+
+def render_panel(job: PanelJob) -> str:
+    fig, ax = pyplot.subplots(figsize=(6.5, 3))
+    plot_panel(ax, job.counts, job.languages)
+    style_panel(ax, job.title, job.labels)
+    fig.savefig(job.path)
+    pyplot.close(fig)
+    return job.path
+
+
+def panel_jobs(cube: CountCube, directory: str) -> List[Tuple[str, PanelJob]]:
+    """(name, job) of the panel of every year and platform, and of every country and platform over the years."""
+    jobs = []
+    for year in cube.years:
+        for platform in PLATFORMS:
+            jobs.append((f"{year}_{platform}", cube.panel(year, platform), panel_title(year, platform),
+                         PLATFORM_COUNTRIES[platform]))
+    for country_index, country in enumerate(COUNTRIES):
+        for platform in PLATFORMS:
+            if country in PLATFORM_COUNTRIES[platform]:
+                counts = cube.counts[:, PLATFORMS.index(platform), country_index]
+                jobs.append((f"{country.lower()}_{platform}", counts, panel_title(country, platform),
+                             [str(year) for year in cube.years]))
+
+    named_jobs = []
+    for name, counts, title, labels in jobs:
+        path = os.path.join(directory, f"{name}_{panel_hash(counts, cube.languages, title, labels)}.png")
+        named_jobs.append((name, PanelJob(path, counts, cube.languages, title, labels)))
+    return named_jobs
+
+
+def render_panels(cube: CountCube, directory: str = PANELS_DIR, workers: Optional[int] = None) -> List[str]:
+    """
+    Render every panel as its own figure, in a pool of processes. Panel files
+    are named after the hash of their data, so only panels whose data changed
+    are rendered, and outdated versions are removed. Returns the panel paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    named_jobs = panel_jobs(cube, directory)
+    todo = [job for _, job in named_jobs if not os.path.exists(job.path)]
+    print(f"{len(named_jobs)} panels, {len(named_jobs) - len(todo)} up to date, {len(todo)} to render")
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render_panel, todo))
+
+    for name, job in named_jobs:
+        for path in glob.glob(os.path.join(directory, f"{name}_*.png")):
+            if path != job.path:
+                os.remove(path)
+    return [job.path for _, job in named_jobs]
+
+
+def compose_overview(cube: CountCube, directory: str = PANELS_DIR,
+                     path: str = "visualize_top_charts.png") -> None:
+    """Assemble the rendered year panels into the overview figure."""
+    fig, axes = pyplot.subplots(len(cube.years), 2, figsize=(13, 3 * len(cube.years)), squeeze=False)
+    named_jobs = dict(panel_jobs(cube, directory))
+    for year, year_axes in zip(cube.years, axes):
+        for platform, ax in zip(PLATFORMS, year_axes):
+            ax.imshow(pyplot.imread(named_jobs[f"{year}_{platform}"].path))
+            ax.axis("off")
+    fig.subplots_adjust(left=0, right=1, top=1, bottom=0.06, wspace=0, hspace=0)
+    add_legend(fig)
+    fig.savefig(path)
 
 
 if __name__ == "__main__":
-    dataset = create_dataset_for_vis()
-    plot(dataset)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--panels", action="store_true",
+                        help="Render every panel as its own figure, in parallel and only when its data changed, "
+                             "then compose the overview from them")
+    parser.add_argument("--panels-dir", default=PANELS_DIR)
+    parser.add_argument("--workers", type=int, help="Number of rendering processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+
+    cube = create_dataset_for_vis()
+    if args.panels:
+        render_panels(cube, args.panels_dir, args.workers)
+        compose_overview(cube, args.panels_dir)
+    else:
+        plot(cube)